@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+
+"""ehvagrant benchmark suite.
+
+Runs the hot paths of ehvagrant against the fake vagrant, ssh and scp executables in stubs/, which simulate
+start-up latency, network delay and output size, so it runs on a plain Linux box without any virtual machine.
+Results are written as JSON, one record per scenario and node count.
+
+Usage:
+  bench.py [--nodes=LIST] [--scenarios=LIST] [--parallel=N] [--repeat=N] [--vagrant-startup=SECONDS]
+           [--latency=SECONDS] [--handshake=SECONDS] [--bandwidth=BYTES] [--output-bytes=BYTES] [--output=FILE]
+  bench.py -h
+
+Options:
+  -h --help                  Show this screen.
+  --nodes=LIST               Comma separated numbers of simulated nodes [default: 1,10,100,1000]
+  --scenarios=LIST           Comma separated scenarios [default: inventory,ssh_config,run_command,run_parallel,upload,run_script,run_script_pipeline,collect]
+  --parallel=N               Maximum number of nodes a parallel job runs on at the same time [default: 10]
+  --repeat=N                 Number of samples of the single node scenarios [default: 20]
+  --vagrant-startup=SECONDS  Start-up cost of every vagrant call [default: 1.0]
+  --latency=SECONDS          Network round trip of every ssh/scp call [default: 0.002]
+  --handshake=SECONDS        TCP connection and ssh handshake, saved by reused master connections [default: 0.05]
+  --bandwidth=BYTES          Bytes per second of scp transfers, 0 means unlimited [default: 0]
+  --output-bytes=BYTES       Output size of every remote command [default: 1000]
+  --output=FILE              Write the JSON report to FILE instead of the standard output
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+from docopt import docopt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ehvagrant.ehvagrant import Vagrant
+
+STUB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stubs')
+
+
+def percentile(samples, p):
+    """
+    nearest-rank percentile
+
+    :param samples: list of numbers
+    :param p: percentile, 0-100
+    :return: float
+    """
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, max(0, int(round(p / 100.0 * len(samples) + 0.5)) - 1))]
+
+
+def summarize(samples):
+    """
+    latency summary of samples in seconds
+
+    :param samples: list of seconds
+    :return: dictionary
+    """
+    return {'p50': percentile(samples, 50),
+            'p90': percentile(samples, 90),
+            'p99': percentile(samples, 99),
+            'max': max(samples),
+            'mean': sum(samples) / len(samples)}
+
+
+class FakeProject(object):
+    """
+    temporary ehvagrant workspace backed by the fake executables, with n running nodes
+    """
+
+    def __init__(self, n, settings):
+        self.root = tempfile.mkdtemp(prefix='ehvagrant-bench-')
+        self.fake_root = os.path.join(self.root, 'fake')
+        self.workspace = os.path.join(self.root, 'workspace')
+        self.names = ['node{}'.format(i + 1) for i in range(n)]
+        os.makedirs(self.fake_root)
+        os.makedirs(self.workspace)
+        with open(os.path.join(self.fake_root, 'nodes'), 'w') as f:
+            for name in self.names:
+                f.write('{} running\n'.format(name))
+        open(os.path.join(self.fake_root, 'private_key'), 'w').close()
+
+        self.environ = dict(os.environ)
+        os.environ.update({'PATH': STUB_PATH + os.pathsep + os.environ['PATH'],
+                           'EHVAGRANT_HOME': self.workspace,
+                           'EHV_FAKE_ROOT': self.fake_root,
+                           'EHV_FAKE_VAGRANT_STARTUP': str(settings['vagrant_startup']),
+                           'EHV_FAKE_SSH_LATENCY': str(settings['latency']),
+                           'EHV_FAKE_SSH_HANDSHAKE': str(settings['handshake']),
+                           'EHV_FAKE_BANDWIDTH': str(settings['bandwidth'])})
+
+    def calls(self):
+        """
+        number of stub calls made so far, by executable
+        """
+        counts = {}
+        path = os.path.join(self.fake_root, 'calls.log')
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    counts[line.split(' ', 1)[0]] = counts.get(line.split(' ', 1)[0], 0) + 1
+        return counts
+
+    def close(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def timed_parallel(provider, hosts, action, args, kwargs):
+    """
+    run action on every host through iter_parallel
+
+    :return: (wall seconds, list of per node completion seconds, number of failed nodes)
+    """
+    start = time.time()
+    latency, failed = [], 0
+    for name, res in provider.iter_parallel(hosts, action, args, kwargs):
+        latency.append(time.time() - start)
+        if isinstance(res, Exception) or (isinstance(res, dict) and res.get('job_status') == 'Failed'):
+            failed += 1
+    return time.time() - start, latency, failed
+
+
+def bench_inventory(project, provider, settings):
+    provider._invalidate_inventory()
+    start = time.time()
+    hosts = provider._get_host_names()
+    cold = time.time() - start
+    samples = []
+    for _ in range(settings['repeat']):
+        start = time.time()
+        provider._get_host_names()
+        samples.append(time.time() - start)
+    assert len(hosts) == len(project.names)
+    return {'wall_s': cold, 'latency_s': summarize(samples), 'note': 'wall_s is the cold lookup, latency_s the cached ones'}
+
+
+def bench_ssh_config(project, provider, settings):
+    cache = os.path.join(provider.cache_path, 'ssh_config.json')
+    if os.path.isfile(cache):
+        os.remove(cache)
+    provider.ssh_config = {}
+    start = time.time()
+    for name in project.names:
+        provider._get_ssh_config(name)
+    wall = time.time() - start
+    return {'wall_s': wall, 'throughput_nodes_s': len(project.names) / wall}
+
+
+def bench_run_command(project, provider, settings):
+    command = "head -c {} /dev/zero | tr '\\0' x; echo".format(settings['output_bytes'])
+    samples = []
+    for _ in range(settings['repeat']):
+        start = time.time()
+        res = provider.run_command(project.names[0], command, report=False)
+        samples.append(time.time() - start)
+    assert len(res['output']) == settings['output_bytes']
+    return {'wall_s': sum(samples), 'latency_s': summarize(samples)}
+
+
+def bench_run_parallel(project, provider, settings):
+    command = "head -c {} /dev/zero | tr '\\0' x; echo".format(settings['output_bytes'])
+    wall, latency, failed = timed_parallel(provider, project.names, provider.run_command, [command], {'report': False})
+    return {'wall_s': wall, 'throughput_nodes_s': len(project.names) / wall, 'latency_s': summarize(latency),
+            'failed': failed}
+
+
+def bench_upload(project, provider, settings):
+    payload = os.path.join(project.root, 'payload.bin')
+    with open(payload, 'wb') as f:
+        f.write(b'x' * settings['output_bytes'])
+    wall, latency, failed = timed_parallel(provider, project.names, provider.upload, [payload, '~/payload.bin'], {})
+    return {'wall_s': wall, 'throughput_nodes_s': len(project.names) / wall, 'latency_s': summarize(latency),
+            'failed': failed}
+
+
+def _bench_script(project, provider, settings, pipeline):
+    script = os.path.join(project.root, 'job.sh')
+    with open(script, 'w') as f:
+        f.write('mkdir -p $1/output\n')
+        f.write("head -c {} /dev/zero | tr '\\0' x > $1/output/result.txt\n".format(settings['output_bytes']))
+        f.write('echo done\n')
+    wall, latency, failed = timed_parallel(provider, project.names, provider.run_script, [script],
+                                           {'report': False, 'pipeline': pipeline})
+    return {'wall_s': wall, 'throughput_nodes_s': len(project.names) / wall, 'latency_s': summarize(latency),
+            'failed': failed}
+
+
+def bench_collect(project, provider, settings):
+    for name in project.names:
+        folder = os.path.join(project.fake_root, 'guests', name, 'cm_experiment', 'job.sh_1', 'output')
+        os.makedirs(folder)
+        with open(os.path.join(folder, 'result.txt'), 'w') as f:
+            f.write('x' * settings['output_bytes'])
+    wall, latency, failed = timed_parallel(provider, project.names, provider.collect, [], {})
+    start = time.time()
+    timed_parallel(provider, project.names, provider.collect, [], {})
+    return {'wall_s': wall, 'throughput_nodes_s': len(project.names) / wall, 'latency_s': summarize(latency),
+            'failed': failed, 'incremental_wall_s': time.time() - start}
+
+
+def bench_run_script(project, provider, settings):
+    return _bench_script(project, provider, settings, False)
+
+
+def bench_run_script_pipeline(project, provider, settings):
+    return _bench_script(project, provider, settings, True)
+
+
+SCENARIOS = {'inventory': bench_inventory,
+             'ssh_config': bench_ssh_config,
+             'run_command': bench_run_command,
+             'run_parallel': bench_run_parallel,
+             'upload': bench_upload,
+             'run_script': bench_run_script,
+             'run_script_pipeline': bench_run_script_pipeline,
+             'collect': bench_collect}
+
+
+def run(settings, nodes, scenarios):
+    """
+    run every scenario for every node count
+
+    :return: list of result records
+    """
+    results = []
+    for scenario in scenarios:
+        for n in nodes:
+            project = FakeProject(n, settings)
+            try:
+                provider = Vagrant(parallel=settings['parallel'])
+                # warm the ssh setting cache, except for the scenario which measures it
+                if scenario not in ['inventory', 'ssh_config']:
+                    provider._cached_host_names()
+                record = {'scenario': scenario, 'nodes': n}
+                record.update(SCENARIOS[scenario](project, provider, settings))
+                provider.disconnect()
+                record['calls'] = project.calls()
+            finally:
+                project.close()
+            results.append(record)
+            print('{:<20s} nodes={:<5d} wall={:.3f}s'.format(scenario, n, record['wall_s']), file=sys.stderr)
+    return results
+
+
+def main():
+    arguments = docopt(__doc__)
+    settings = {'parallel': int(arguments['--parallel']),
+                'repeat': int(arguments['--repeat']),
+                'vagrant_startup': float(arguments['--vagrant-startup']),
+                'latency': float(arguments['--latency']),
+                'handshake': float(arguments['--handshake']),
+                'bandwidth': float(arguments['--bandwidth']),
+                'output_bytes': int(arguments['--output-bytes'])}
+    nodes = [int(x) for x in arguments['--nodes'].split(',')]
+    scenarios = arguments['--scenarios'].split(',')
+    for x in scenarios:
+        if x not in SCENARIOS:
+            sys.exit('unknown scenario {}, choose from {}'.format(x, ','.join(sorted(SCENARIOS))))
+
+    report = {'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'settings': settings},
+              'results': run(settings, nodes, scenarios)}
+
+    if arguments['--output']:
+        with open(arguments['--output'], 'w') as out:
+            json.dump(report, out, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+shared helpers of the fake vagrant, ssh and scp executables used by the benchmark suite.
+
+The fake project lives in $EHV_FAKE_ROOT:
+
+    nodes            one "name state" line per machine
+    guests/<name>/   home folder of the machine, remote commands run there
+    mux/<name>       marker of an open multiplexed master connection
+    boxes            names of the added boxes
+    snapshots/<name> names of the snapshots of the machine
+    calls.log        one line per stub call
+
+Simulated costs are read from the environment, in seconds:
+
+    EHV_FAKE_VAGRANT_STARTUP   start-up of every vagrant call
+    EHV_FAKE_VAGRANT_UP        extra cost of bringing one machine up
+    EHV_FAKE_SSH_LATENCY       network round trip of every ssh/scp call
+    EHV_FAKE_SSH_HANDSHAKE     tcp connection and ssh handshake, skipped when a master connection is reused
+    EHV_FAKE_BANDWIDTH         bytes per second of scp transfers, 0 means unlimited
+
+Faults are injected with:
+
+    EHV_FAKE_FAILURE_RATE      probability, 0-1, that a ssh/scp connection fails before anything runs
+    EHV_FAKE_HANG_NODES        comma separated machines whose connections never answer
+"""
+import os
+import sys
+import time
+import fcntl
+import random
+
+ROOT = os.environ['EHV_FAKE_ROOT']
+BASE_PORT = 2200
+
+
+def cost(name):
+    return float(os.environ.get(name, 0) or 0)
+
+
+def sleep(name, factor=1):
+    if cost(name):
+        time.sleep(cost(name) * factor)
+
+
+def log_call(argv):
+    with open(os.path.join(ROOT, 'calls.log'), 'a') as f:
+        f.write(' '.join(argv) + '\n')
+
+
+def nodes():
+    with open(os.path.join(ROOT, 'nodes')) as f:
+        return [x.split() for x in f if x.strip()]
+
+
+def set_state(names, state):
+    with open(os.path.join(ROOT, 'nodes.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        machines = nodes()
+        with open(os.path.join(ROOT, 'nodes'), 'w') as f:
+            for name, cur in machines:
+                f.write('{} {}\n'.format(name, state if not names or name in names else cur))
+
+
+def port_of(name):
+    return BASE_PORT + [x[0] for x in nodes()].index(name)
+
+
+def name_of(port):
+    return nodes()[int(port) - BASE_PORT][0]
+
+
+def home(name):
+    path = os.path.join(ROOT, 'guests', name)
+    if not os.path.isdir(path):
+        os.makedirs(path, exist_ok=True)
+    return path
+
+
+def connect(name, options, failure_code=255):
+    """
+    pay for the ssh handshake unless a multiplexed master connection of the node is open, and inject the 
+    configured faults. A failed connection exits with failure_code, without any message like a quiet ssh/scp
+    """
+    if name in os.environ.get('EHV_FAKE_HANG_NODES', '').split(','):
+        while True:
+            time.sleep(60)
+    if random.random() < cost('EHV_FAKE_FAILURE_RATE'):
+        sys.exit(failure_code)
+    sleep('EHV_FAKE_SSH_LATENCY')
+    mux = os.path.join(ROOT, 'mux', name)
+    if any(x.startswith('ControlMaster=') for x in options) and os.path.exists(mux):
+        return
+    sleep('EHV_FAKE_SSH_HANDSHAKE')
+    if any(x.startswith('ControlMaster=') for x in options):
+        os.makedirs(os.path.dirname(mux), exist_ok=True)
+        open(mux, 'w').close()
+
+
+def parse_args(argv, port_flag):
+    """
+    split ssh/scp arguments into (options dict, -o options, positional arguments)
+    """
+    flags, options, positional = {}, [], []
+    i = 0
+    while i < len(argv):
+        x = argv[i]
+        if x in (port_flag, '-i', '-F', '-S', '-l', '-O'):
+            flags[x] = argv[i + 1]
+            i += 2
+        elif x == '-o':
+            options.append(argv[i + 1])
+            i += 2
+        elif x.startswith('-o'):
+            options.append(x[2:])
+            i += 1
+        elif x.startswith('-') and not positional:
+            flags[x] = True
+            i += 1
+        else:
+            positional.append(x)
+            i += 1
+    return flags, options, positional
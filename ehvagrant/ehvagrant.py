@@ -3,25 +3,74 @@
 """Vagrant Manager.
 
 Usage:
-  ehvagrant.py create --vms=<vmlist> [--box=BOX] [--template=TEMPLATE] [--output=OUTPUT] [--debug]										 
-  ehvagrant.py start [--vms=<vmList>] [--debug]
-  ehvagrant.py resume [--vms=<vmList>] [--debug]												  
-  ehvagrant.py stop [--vms=<vmList>] [--debug]
-  ehvagrant.py suspend [--vms=<vmList>] [--debug]
-  ehvagrant.py destroy [--vms=<vmList>] [--debug]
+  ehvagrant.py create --vms=<vmlist> [--box=BOX] [--template=TEMPLATE] [--output=OUTPUT] [--debug]
+  ehvagrant.py provision --vms=<vmlist> [--box=BOX] [--wave=N] [--template=TEMPLATE] [--output=OUTPUT] [--debug]										 
+  ehvagrant.py start [--vms=<vmList>] [--parallel=N] [--debug]
+  ehvagrant.py resume [--vms=<vmList>] [--parallel=N] [--debug]												  
+  ehvagrant.py stop [--vms=<vmList>] [--parallel=N] [--debug]
+  ehvagrant.py suspend [--vms=<vmList>] [--parallel=N] [--debug]
+  ehvagrant.py destroy [-f] [--vms=<vmList>] [--parallel=N] [--debug]
   ehvagrant.py info NAME [--debug]
-  ehvagrant.py ls   [--vms=<vmList>] [--debug]
-  ehvagrant.py upload --from=FROM --to=TO [-r] [--vms=<vmlist>] [--debug]
-  ehvagrant.py download --from=FROM --to=TO [-r] [--vms=<vmlist>] [--debug]
+  ehvagrant.py ls   [--vms=<vmList>] [--state=STATE] [--debug]
+  ehvagrant.py upload --from=FROM --to=TO [-r] [--sync] [--compress] [--vms=<vmlist>] [--workspaces=NAMES] [--state=STATE] [--parallel=N] [--min-parallel=N] [--persist=SECONDS] [--trace=FILE] [--timeout=SECONDS] [--connect-timeout=SECONDS] [--retries=N] [--debug]
+  ehvagrant.py download --from=FROM --to=TO [-r] [--sync] [--compress] [--vms=<vmlist>] [--workspaces=NAMES] [--state=STATE] [--parallel=N] [--min-parallel=N] [--persist=SECONDS] [--trace=FILE] [--timeout=SECONDS] [--connect-timeout=SECONDS] [--retries=N] [--debug]
   ehvagrant.py ssh NAME [--debug]
-  ehvagrant.py run command COMMAND [--vms=<vmList>] [--debug]
-  ehvagrant.py run script SCRIPT [--data=PATH] [--vms=<vmList>] [--debug]
+  ehvagrant.py run command COMMAND [--stream] [--format=FORMAT] [--vms=<vmList>] [--workspaces=NAMES] [--state=STATE] [--parallel=N] [--min-parallel=N] [--vagrant-ssh] [--persist=SECONDS] [--trace=FILE] [--timeout=SECONDS] [--connect-timeout=SECONDS] [--retries=N] [--debug]
+  ehvagrant.py run script SCRIPT [--stream] [--format=FORMAT] [--data=PATH] [--data-cache] [--pipeline] [--reset-to=SNAPSHOT] [--result-cache|--no-cache] [--vms=<vmList>] [--workspaces=NAMES] [--state=STATE] [--parallel=N] [--min-parallel=N] [--vagrant-ssh] [--persist=SECONDS] [--trace=FILE] [--timeout=SECONDS] [--connect-timeout=SECONDS] [--retries=N] [--debug]
+  ehvagrant.py run batch JOBS [--data-cache] [--pipeline] [--result-cache|--no-cache] [--format=FORMAT] [--vms=<vmList>] [--state=STATE] [--parallel=N] [--min-parallel=N] [--vagrant-ssh] [--persist=SECONDS] [--trace=FILE] [--speculate] [--timeout=SECONDS] [--connect-timeout=SECONDS] [--retries=N] [--debug]
+  ehvagrant.py collect [--runs=PATTERNS] [--to=DIR] [--bandwidth=RATE] [--vms=<vmList>] [--state=STATE] [--parallel=N] [--min-parallel=N] [--persist=SECONDS] [--trace=FILE] [--timeout=SECONDS] [--connect-timeout=SECONDS] [--retries=N] [--debug]
+  ehvagrant.py runs [--vms=<vmList>] [--status=STATUS] [--script=PATTERN] [--since=TIME] [--until=TIME] [--limit=N] [--format=FORMAT] [--debug]
+  ehvagrant.py disconnect [--vms=<vmList>] [--debug]
+  ehvagrant.py workspace add NAME PATH [--budget=N] [--debug]
+  ehvagrant.py workspace remove NAME [--debug]
+  ehvagrant.py workspace list [--debug]
+  ehvagrant.py snapshot (save|restore|delete) SNAPSHOT [--vms=<vmList>] [--state=STATE] [--parallel=N] [--timeout=SECONDS] [--debug]
+  ehvagrant.py snapshot list [--vms=<vmList>] [--state=STATE] [--parallel=N] [--debug]
+  ehvagrant.py cache gc [--max-size=SIZE] [--max-age=DAYS] [--vms=<vmList>] [--state=STATE] [--parallel=N] [--debug]
+  ehvagrant.py cache gc --local [--max-size=SIZE] [--max-age=DAYS] [--debug]
+  ehvagrant.py daemon start [--idle=SECONDS] [--debug]
+  ehvagrant.py daemon stop
+  ehvagrant.py daemon status
 
   ehvagrant.py -h
 
 Options:
   -h --help     Show this screen.
   --vm_list=<list_of_vms>  List of VMs separated by commas ex: node-1,node-2
+  --state=STATE  Only work with instances in one of the comma separated states, e.g. running
+  --sync  Only transfer the files whose content differs between both sides
+  --compress  Compress data on the wire
+  -f  Destroy without confirmation, lets destroy run on the instances in parallel
+  --vagrant-ssh  Run remote commands through `vagrant ssh` instead of the system ssh
+  --data-cache  Keep data in a content-addressed cache on the instances, only upload it when missing
+  --max-size=SIZE  Evict the least recently used data until the cache fits in SIZE, e.g. 10G
+  --max-age=DAYS  Evict data not used for DAYS days
+  --stream  Print output lines of every instance as they arrive and tee them to a log under experiment
+  --format=FORMAT  Result format, text reports or jsonl, one json record per instance as soon as it finishes [default: text]
+  --pipeline  Ship script and data, run the script and fetch its results within a single ssh session
+  --parallel=N  Maximum number of instances a job runs on at the same time [default: 10]
+  --min-parallel=N  Adapt the number of instances a job runs on at the same time to the cpu, memory and disk load of this machine, between N and --parallel
+  --persist=SECONDS  Keep the ssh master connections open for SECONDS idle seconds after the run [default: 0]
+  --timeout=SECONDS  Cancel the job of an instance after SECONDS
+  --connect-timeout=SECONDS  Give up a ssh/scp call if the instance does not connect or answer within SECONDS [default: 10]
+  --retries=N  Retry a ssh/scp call up to N times, with backoff, if it could not reach the instance [default: 2]
+  --speculate  Run a copy of a straggling batch job on an idle instance, the first copy to finish wins
+  --runs=PATTERNS  Comma separated shell patterns of the run folders to collect, e.g. job.sh_*, default to every run
+  --bandwidth=RATE  Cap the total transfer rate of all instances, in bytes per second, e.g. 20M
+  --wave=N  Maximum number of instances booting at the same time, default to --parallel
+  --reset-to=SNAPSHOT  Restore every instance to SNAPSHOT right before its job starts
+  --result-cache  Reuse the result of a successful earlier run of the same script, data, arguments and box, also on by EHVAGRANT_RESULT_CACHE=1
+  --no-cache  Always run the job, even if EHVAGRANT_RESULT_CACHE=1
+  --local  Evict entries of the local result cache instead of the data cache of the instances
+  --status=STATUS  Only runs with job status STATUS: Success, Finished (non-zero return code) or Failed
+  --script=PATTERN  Only runs of the scripts whose file name matches the shell pattern, e.g. sweep*.sh
+  --since=TIME  Only runs started since TIME: epoch seconds, a date like 2024-05-01[T13:30], or a duration before now like 12h or 7d
+  --until=TIME  Only runs started before TIME, see --since
+  --limit=N  Show at most the N newest runs
+  --workspaces=NAMES  Run on the instances of the comma separated registered workspaces, or of all of them, instead of the current one
+  --budget=N  Maximum number of instances of the workspace a job runs on at the same time, within --parallel
+  --idle=SECONDS  Stop the daemon after SECONDS without any command [default: 3600]
+  --trace=FILE  Write the timed phases of every instance to FILE as Chrome trace JSON, and print a timing summary
 
 Description:
    put a description here
@@ -32,14 +81,675 @@ Example:
 from __future__ import print_function
 import os
 import re
+import json
+import shlex
+import shutil
+import stat
+import sqlite3
+import hashlib
 import subprocess
-import multiprocessing.dummy as mt
-import queue
+import asyncio
+import functools
+import itertools
+import collections
+import random
+import threading
+import tempfile
+import tarfile
+import atexit
+import contextlib
+import contextvars
+import signal
+import socket
+import struct
+import sys
+import traceback
+from concurrent import futures
 import time
 import logging
 from docopt import docopt
 import hostlist
 
+DEFAULT_PARALLEL = 10
+GUEST_CACHE_PATH = '~/cm_experiment/.cache'
+# providers which can bring several machines up at the same time with `vagrant up --parallel`
+PARALLEL_PROVIDERS = {'aws', 'docker', 'google', 'hyperv', 'libvirt', 'openstack', 'vmware_desktop'}
+# first delay before a transient ssh/scp failure is retried, doubled on every further attempt
+RETRY_BACKOFF = 1.0
+# limits the local result cache is trimmed to after every run which uses it, size and days since last use
+RESULT_CACHE_MAX_SIZE = '10G'
+RESULT_CACHE_MAX_AGE = 30
+# a batch job is run again on an idle node once it runs this many times longer than the median job
+SPECULATE_FACTOR = 1.5
+# outputs up to this size are inlined into jsonl records, larger ones are referenced by the path of their log
+INLINE_OUTPUT_BYTES = 4096
+# load of the machine past which adaptive concurrency backs off: runnable tasks per cpu, fraction of the memory in
+# use, and fraction of the time some task stalled on cpu, memory or io (pressure stall information)
+HOST_OVERLOAD = {'runnable': 1.5, 'memory': 0.9, 'stall': 0.25}
+# node the current span belongs to, inherited by the nested spans of the same job
+TRACE_NODE = contextvars.ContextVar('trace_node', default=None)
+
+def workspace_path():
+    """
+    workspace of the vagrant project, $EHVAGRANT_HOME or ~/ehvagrant
+
+    :return: str
+    """
+    if not os.getenv('EHVAGRANT_HOME'):
+        return os.path.join(os.path.expanduser('~'),'ehvagrant',)
+    return os.getenv('EHVAGRANT_HOME')
+
+
+def runtime_path(workspace):
+    """
+    short private folder of the sockets of the workspace, since the length of unix socket path is limited. It is 
+    created under $XDG_RUNTIME_DIR, or the temporary folder if not set. As the temporary folder is shared, a 
+    folder which another user could have created or can enter is never used
+
+    :param workspace: workspace of the vagrant project
+    :return: str
+    :raise PermissionError: if the folder is not owned by this user, or is open to other users
+    """
+    uid=os.getuid() if hasattr(os, 'getuid') else None
+    path=os.path.join(os.getenv('XDG_RUNTIME_DIR') or tempfile.gettempdir(), 
+                      'ehvagrant-{}-{}'.format(uid, hashlib.sha1(workspace.encode('utf8')).hexdigest()[:10]))
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info=os.lstat(path)
+    if uid is not None and (not stat.S_ISDIR(info.st_mode) or info.st_uid!=uid or info.st_mode & 0o077):
+        raise PermissionError('{} is not a private folder of this user, remove it or set XDG_RUNTIME_DIR'.format(path))
+    return path
+
+
+def host_load():
+    """
+    load of the machine, read from /proc/loadavg, /proc/meminfo and /proc/pressure. A value which can not be read, 
+    e.g. pressure stall information on older kernels or anything on other systems, is left out
+
+    :return: dictionary with cpus, runnable (tasks running or waiting for a cpu), memory (fraction in use), and 
+             cpu_stall, memory_stall and io_stall (microseconds some task stalled, since boot)
+    """
+    load={'cpus': os.cpu_count() or 1}
+    try:
+        with open('/proc/loadavg') as f:
+            # the reading process is one of the runnable tasks
+            load['runnable']=max(int(f.read().split()[3].split('/')[0]) - 1, 0)
+    except (IOError, OSError, IndexError, ValueError):
+        pass
+    try:
+        with open('/proc/meminfo') as f:
+            meminfo=dict(line.split(':', 1) for line in f if ':' in line)
+        load['memory']=1 - float(meminfo['MemAvailable'].split()[0]) / float(meminfo['MemTotal'].split()[0])
+    except (IOError, OSError, KeyError, ValueError, ZeroDivisionError):
+        pass
+    for resource in ['cpu', 'memory', 'io']:
+        try:
+            with open('/proc/pressure/{}'.format(resource)) as f:
+                some=f.readline().split()
+            load['{}_stall'.format(resource)]=int(dict(x.split('=') for x in some[1:])['total'])
+        except (IOError, OSError, KeyError, ValueError):
+            pass
+    return load
+
+
+class BlockingLoop(object):
+    """
+    event loop driven step by step by the generators of the blocking api. If the calling thread already runs an 
+    event loop, e.g. in Jupyter, the steps run in a worker thread instead, and block the calling loop until they 
+    are done
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            asyncio.get_running_loop()
+            self.thread = futures.ThreadPoolExecutor(max_workers=1)
+        except RuntimeError:
+            self.thread = None
+
+    def run_until_complete(self, future):
+        """
+        run the loop until future is done
+
+        :param future: awaitable
+        :return: result of future
+        """
+        if self.thread is None:
+            return self.loop.run_until_complete(future)
+        return self.thread.submit(self.loop.run_until_complete, future).result()
+
+    def close(self):
+        """
+        close the loop and its worker thread
+
+        :return: None
+        """
+        if self.thread is None:
+            self.loop.close()
+        else:
+            self.thread.submit(self.loop.close).result()
+            self.thread.shutdown()
+
+
+class NodeStream(object):
+    """
+    print the output lines of a node as soon as they arrive, prefixed with the node name, and tee them to a log 
+    file. Lines are never kept, so memory use does not grow with the amount of output
+    """
+
+    def __init__(self, name, log_path, echo=True):
+        """
+        :param name: name of the node
+        :param log_path: local path of the log file
+        :param echo: print the lines. if False, they are only spooled to the log file
+        """
+        self.name = name
+        self.log_path = log_path
+        self.echo = echo
+        self.return_code = None
+        self.started = False
+        self.bytes = 0
+        if not os.path.isdir(os.path.dirname(log_path)):
+            os.makedirs(os.path.dirname(log_path))
+        self.log = open(log_path, 'wb')
+
+    def __call__(self, line):
+        """
+        handle one output line, the run_command framing (\\x04 and return_code lines) is filtered out
+
+        :param line: bytes, without the line break
+        :return: None
+        """
+        stripped=line.strip()
+        if stripped==b'\x04':
+            self.started=True
+            return
+        match=re.match(b'^return_code: (\\d+)$', stripped)
+        if match:
+            self.return_code=int(match.group(1))
+            return
+        self.log.write(line + b'\n')
+        self.bytes+=len(line) + 1
+        if self.echo:
+            print('[{}] {}'.format(self.name, line.decode('utf8', 'replace').rstrip('\r')))
+
+    def close(self):
+        self.log.close()
+
+
+class Tracer(object):
+    """
+    record timed spans tagged by node and phase, export them as a Chrome trace (also read by Perfetto) and 
+    summarize the time of every phase
+    """
+
+    def __init__(self):
+        self.origin = time.time()
+        self.spans = []
+        self.counters = []
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, phase, node=None, **args):
+        """
+        time the enclosed block
+
+        :param phase: name of the phase
+        :param node: [optional], name of the node, default to the node of the enclosing span
+        :param args: extra values shown with the span in the trace viewer
+        """
+        token=TRACE_NODE.set(node) if node is not None else None
+        node=TRACE_NODE.get()
+        start=time.time()
+        try:
+            yield
+        finally:
+            end=time.time()
+            if token is not None:
+                TRACE_NODE.reset(token)
+            with self.lock:
+                self.spans.append((node, phase, start, end, args))
+
+    def counter(self, name, value):
+        """
+        record the value a counter takes from now on, e.g. the concurrency limit
+
+        :param name: name of the counter
+        :param value: number
+        """
+        with self.lock:
+            self.counters.append((name, time.time(), value))
+
+    def export(self, path):
+        """
+        write the spans as Chrome trace JSON, one thread per node, and the counters as counter tracks
+
+        :param path: local path of the trace file
+        :return: None
+        """
+        pid=os.getpid()
+        tids={}
+        events=[]
+        for node, phase, start, end, args in sorted(self.spans, key=lambda x: x[2]):
+            tid=tids.setdefault(node or 'ehvagrant', len(tids) + 1)
+            events.append({'name':phase, 'cat':'ehvagrant', 'ph':'X', 'pid':pid, 'tid':tid,
+                           'ts':round((start - self.origin) * 1e6, 1), 'dur':round((end - start) * 1e6, 1),
+                           'args':dict(args, node=node)})
+        events+=[{'name':name, 'cat':'ehvagrant', 'ph':'C', 'pid':pid, 'ts':round((at - self.origin) * 1e6, 1), 
+                  'args':{name:value}} for name, at, value in self.counters]
+        events+=[{'name':'thread_name', 'ph':'M', 'pid':pid, 'tid':tid, 'args':{'name':node}} 
+                 for node, tid in tids.items()]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents':events, 'displayTimeUnit':'ms'}, f)
+
+    def _percentile(self, samples, p):
+        return samples[min(len(samples) - 1, int(p / 100.0 * len(samples)))]
+
+    def summary(self):
+        """
+        format the count, percentiles and total seconds of every phase into a table
+
+        :return: str
+        """
+        phases={}
+        for node, phase, start, end, args in self.spans:
+            phases.setdefault(phase, []).append(end - start)
+        rows=[['phase', 'count', 'p50', 'p90', 'p99', 'max', 'total']]
+        for phase, samples in sorted(phases.items(), key=lambda x: -sum(x[1])):
+            samples.sort()
+            rows.append([phase, str(len(samples))] + 
+                        ['{:.3f}'.format(x) for x in [self._percentile(samples, 50), self._percentile(samples, 90), 
+                                                      self._percentile(samples, 99), samples[-1], sum(samples)]])
+        widths=[max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines=['  '.join(x.ljust(w) for x, w in zip(row, widths)) for row in rows]
+        return '\n'.join(['\n========= TIMING (seconds) =========', lines[0], '-' * len(lines[0])] + lines[1:])
+
+
+class RateLimit(object):
+    """
+    bandwidth budget shared by every transfer of a run. A transfer reserves the time its bytes take at the given
+    rate, so the transfers of all nodes together never exceed it, and a stalled reader throttles the sender
+    through the pipe and the tcp window
+    """
+
+    def __init__(self, rate, burst=0.5):
+        """
+        :param rate: bytes per second
+        :param burst: seconds of unused budget which may be spent at once
+        """
+        self.rate = float(rate)
+        self.burst = burst
+        self.clock = time.monotonic()
+
+    async def consume(self, size):
+        """
+        wait until size bytes fit in the budget
+
+        :param size: number of bytes
+        :return: None
+        """
+        now=time.monotonic()
+        self.clock=max(self.clock, now - self.burst) + size / self.rate
+        if self.clock > now:
+            await asyncio.sleep(self.clock - now)
+
+
+class AdaptiveLimit(object):
+    """
+    concurrency limit which follows the load of the machine, used like asyncio.Semaphore. It starts at minimum and 
+    doubles while every slot is busy and the machine has spare capacity, then grows by one after the first 
+    overload. It halves as soon as the cpu, memory or disk of the machine is overloaded, see HOST_OVERLOAD, and 
+    always stays between minimum and maximum. Running jobs are never stopped, a lower limit only holds back new ones
+    """
+
+    def __init__(self, minimum, maximum, interval=1.0, probe=host_load, tracer=None):
+        """
+        :param minimum: least number of jobs running at the same time
+        :param maximum: most number of jobs running at the same time
+        :param interval: seconds between two load samples, and so between two changes of the limit
+        :param probe: function which returns the load of the machine, see host_load
+        :param tracer: [optional], Tracer which records the limit as a counter
+        """
+        self.minimum = max(int(minimum), 1)
+        self.maximum = max(int(maximum), self.minimum)
+        self.limit = self.minimum
+        self.interval = interval
+        self.probe = probe
+        self.tracer = tracer
+        self.active = 0
+        self.waiters = collections.deque()
+        self.slow_start = True
+        self.busy = False
+        self.last = (time.monotonic(), probe())
+        self.history = [(time.time(), self.limit, [])]
+        if tracer is not None:
+            tracer.counter('concurrency', self.limit)
+
+    def _overloaded(self, last, load, seconds):
+        """
+        resources of the machine which are overloaded between two samples
+
+        :param last: load of the previous sample
+        :param load: load of this sample
+        :param seconds: seconds between both samples
+        :return: list of str
+        """
+        reasons=[]
+        if load.get('runnable', 0) > HOST_OVERLOAD['runnable'] * load['cpus']:
+            reasons.append('cpu')
+        if load.get('memory', 0) > HOST_OVERLOAD['memory']:
+            reasons.append('memory')
+        for resource in ['cpu', 'memory', 'io']:
+            key='{}_stall'.format(resource)
+            if key in load and key in last and (load[key] - last[key]) / 1e6 / seconds > HOST_OVERLOAD['stall']:
+                reasons.append('{} pressure'.format(resource))
+        return reasons
+
+    def _adjust(self):
+        """
+        sample the load once per interval and move the limit
+
+        :return: None
+        """
+        now=time.monotonic()
+        if now - self.last[0] < self.interval:
+            return
+        load=self.probe()
+        reasons=self._overloaded(self.last[1], load, now - self.last[0])
+        self.last=(now, load)
+        if reasons and self.active > self.limit:
+            # the jobs started before the last cut still run, their load is no reason to cut again
+            limit=self.limit
+        elif reasons:
+            limit=max(self.limit // 2, self.minimum)
+            self.slow_start=False
+        elif self.busy:
+            limit=min(self.limit * 2 if self.slow_start else self.limit + 1, self.maximum)
+        else:
+            limit=self.limit
+        if limit!=self.limit:
+            logging.debug('concurrency {} -> {}{}'.format(self.limit, limit, 
+                                                          ', overloaded: ' + ', '.join(reasons) if reasons else ''))
+            self.limit=limit
+            self.history.append((time.time(), limit, reasons))
+            if self.tracer is not None:
+                self.tracer.counter('concurrency', limit)
+        self.busy=self.active >= self.limit
+        self._wake()
+
+    def _wake(self):
+        while self.waiters and self.active < self.limit:
+            waiter=self.waiters.popleft()
+            if not waiter.done():
+                self.active+=1
+                waiter.set_result(True)
+
+    async def acquire(self):
+        """
+        wait for a free slot. Waiting jobs sample the load, so the limit also grows while no job finishes
+
+        :return: True
+        """
+        self._adjust()
+        if self.active < self.limit and not self.waiters:
+            self.active+=1
+            return True
+        self.busy=True
+        waiter=asyncio.get_event_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            while not waiter.done():
+                await asyncio.wait([waiter], timeout=self.interval)
+                self._adjust()
+        except asyncio.CancelledError:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            else:
+                self.release()
+            raise
+        return True
+
+    def release(self):
+        self.active-=1
+        self._adjust()
+        self._wake()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class Result(object):
+    """
+    outcome of an action on one node, yielded by Vagrant.map as soon as the node finishes. status is Success, 
+    Finished (the job returned non-zero) or Failed. The fields which do not apply to an action are None, e.g. 
+    output of an upload, or output of a job whose output was spooled and is larger than INLINE_OUTPUT_BYTES
+    """
+    __slots__ = ('node', 'job', 'status', 'return_code', 'started', 'finished', 'seconds', 'remote_job_folder', 
+                 'local_output_folder', 'cached', 'output_path', 'output_bytes', 'output', 'error', 'value')
+
+    def __init__(self, node, job, status, return_code=None, error=None, value=None, **fields):
+        """
+        :param node: name of the node
+        :param job: name of the action, e.g. run_script
+        :param status: Success, Finished or Failed
+        :param return_code: return code of the job, None if there is none
+        :param error: the exception raised by the job if it failed
+        :param value: return value of actions other than run_command and run_script, e.g. the statistic of collect
+        :param fields: other fields of __slots__
+        """
+        self.node = node
+        self.job = job
+        self.status = status
+        self.return_code = return_code
+        self.error = error
+        self.value = value
+        for key in self.__slots__[4:-2]:
+            setattr(self, key, fields.get(key))
+
+    @property
+    def ok(self):
+        return self.status=='Success'
+
+    def to_dict(self):
+        """
+        json serializable record, as written by --format=jsonl
+
+        :return: dictionary
+        """
+        record={key: getattr(self, key) for key in self.__slots__[:4]}
+        record.update({key: getattr(self, key) for key in self.__slots__[4:-2] if getattr(self, key) is not None})
+        return record
+
+    def __repr__(self):
+        return 'Result(node={!r}, job={!r}, status={!r}, return_code={!r})'.format(self.node, self.job, self.status, 
+                                                                                 self.return_code)
+
+
+class Shards(object):
+    """
+    several vagrant projects, e.g. with different providers or on different physical hosts, driven as one pool of 
+    nodes. Nodes are named {workspace}:{node} in the merged reports. A job runs on at most parallel nodes in 
+    total, and on at most the budget of a workspace within it
+    """
+
+    def __init__(self, providers, budgets=None, parallel=DEFAULT_PARALLEL, min_parallel=None):
+        """
+        :param providers: dictionary: workspace name -> Vagrant object of the workspace
+        :param budgets: [optional], dictionary: workspace name -> maximum number of its nodes running at the same 
+                        time. A workspace without a budget is only limited by parallel
+        :param parallel: maximum number of nodes running at the same time over all workspaces
+        :param min_parallel: [optional], adapt the number of nodes running at the same time over all workspaces to 
+                             the load of this machine, between min_parallel and parallel
+        """
+        self.providers = providers
+        self.budgets = budgets or {}
+        self.parallel = int(parallel)
+        self.min_parallel = int(min_parallel) if min_parallel else None
+
+    def hosts(self, vms=None, states=None):
+        """
+        nodes of the workspaces, interleaved workspace by workspace, so that every workspace gets its share of 
+        the global budget from the start
+
+        :param vms: [optional], list of node names. A name like ws1:node1 picks the node of one workspace, a 
+                    plain name picks the node of that name in every workspace which has it
+        :param states: [optional], list of states the nodes must be in
+        :return: list of (workspace name, node name)
+        """
+        groups=[]
+        for ws, provider in self.providers.items():
+            if vms:
+                known=set(provider._get_host_names())
+                names=[x.split(':', 1)[1] for x in vms if x.startswith(ws + ':')]
+                names+=[x for x in vms if ':' not in x and x in known and x not in names]
+                names=provider._filter_hosts(names, states) if states and names else names
+            else:
+                names=provider._get_host_names(states)
+            groups.append([(ws, x) for x in names])
+        return [x for group in itertools.zip_longest(*groups) for x in group if x is not None]
+
+    def iter_parallel(self, hosts, action, args, kwargs):
+        """
+        run the async version of a Vagrant action on nodes of several workspaces within one event loop, and yield 
+        the job result of every node as soon as it finishes. A job which runs longer than the timeout of its 
+        workspace is cancelled, and its result is a TimeoutError
+
+        :param hosts: list of (workspace name, node name)
+        :param action: name of the action, e.g. run_script
+        :param args: positional arguments of the action, or function which takes the workspace and node names and 
+                     returns them
+        :param kwargs: keyword arguments of the action
+        :return: generator of (workspace name, node name, job result)
+        """
+        loop=BlockingLoop()
+        
+        async def start():
+            if self.min_parallel:
+                tracer=next(iter(self.providers.values())).tracer if self.providers else None
+                total=AdaptiveLimit(min(self.min_parallel, self.parallel), self.parallel, tracer=tracer)
+            else:
+                total=asyncio.Semaphore(self.parallel)
+            budgets={ws: asyncio.Semaphore(int(n)) for ws, n in self.budgets.items() if n}
+            
+            async def job(ws, name):
+                provider=self.providers[ws]
+                async with contextlib.AsyncExitStack() as slots:
+                    # a job waits for the budget of its workspace first, so it never holds a global slot idle
+                    if ws in budgets:
+                        await slots.enter_async_context(budgets[ws])
+                    await slots.enter_async_context(total)
+                    with provider._span('job', name, action=action, workspace=ws):
+                        call=getattr(provider, '{}_async'.format(action))(name, *(args(ws, name) if callable(args) else args), **kwargs)
+                        try:
+                            return await asyncio.wait_for(call, provider.timeout)
+                        except asyncio.TimeoutError:
+                            provider.incidents[name]['timeout']+=1
+                            raise TimeoutError('job on node {}:{} timed out after {} seconds'.format(ws, name, provider.timeout))
+            
+            return {asyncio.ensure_future(job(ws, name)): (ws, name) for ws, name in hosts}
+        
+        pending=set()
+        try:
+            tasks=loop.run_until_complete(start())
+            pending=set(tasks)
+            while pending:
+                done, pending=loop.run_until_complete(asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED))
+                for task in done:
+                    ws, name=tasks[task]
+                    try:
+                        res=task.result()
+                    except Exception as e:
+                        logging.error('job assigned to node {}:{} failed: {}'.format(ws, name, e))
+                        res=e
+                    yield ws, name, res
+        finally:
+            # cancel the unfinished jobs if the caller stops early
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.close()
+
+    def run(self, hosts, action, args, kwargs, output_format='text', stream=False):
+        """
+        run an action on nodes of several workspaces and print the merged reports: the report, or json record, 
+        of every node as soon as it finishes, then one summary table of all nodes. Nodes are named 
+        {workspace}:{node} in both. Downloads of every workspace go to their own {dest}/{workspace}/{node} folder
+
+        :param hosts: list of (workspace name, node name)
+        :param action: run_command, run_script, upload or download
+        :param args: positional arguments of the action
+        :param kwargs: keyword arguments of the action
+        :param output_format: text or jsonl
+        :param stream: print output lines of every node as they arrive
+        :return: list of Result, named {workspace}:{node}
+        """
+        kwargs=dict(kwargs)
+        if action in ['run_command', 'run_script']:
+            kwargs.update({'report':False, 'spool':output_format=='jsonl', 'stream':stream and output_format!='jsonl'})
+        
+        def node_args(ws, name):
+            if action!='download':
+                return args
+            if os.path.isdir(args[1]):
+                dest=os.path.join(args[1], ws, name)
+                folder=dest
+            else:
+                folder=os.path.join(os.path.dirname(args[1]), ws, name)
+                dest=os.path.join(folder, os.path.basename(args[1]))
+            os.makedirs(folder, exist_ok=True)
+            return [args[0], dest] + list(args[2:])
+        
+        results=[]
+        for ws, name, res in self.iter_parallel(hosts, action, node_args, kwargs):
+            result=self.providers[ws]._result(name, res, action)
+            result.node='{}:{}'.format(ws, name)
+            if output_format=='jsonl' and action in ['run_command', 'run_script']:
+                record=result.to_dict()
+                record['workspace']=ws
+                print(json.dumps(record), flush=True)
+            elif action in ['run_command', 'run_script'] and not stream:
+                print(self._report(result, args[0]))
+            results.append(result)
+        
+        if output_format!='jsonl' and self.providers:
+            rows=[(x.node, {'job_status':x.status, 'return_code':'N.A.' if x.return_code is None else x.return_code,
+                            'log_path':x.output_path or 'N.A.'}) for x in results]
+            print(next(iter(self.providers.values()))._summary_table(rows))
+        return results
+
+    def _report(self, result, description):
+        """
+        text report of a run_command or run_script job, in the layout of their own reports
+
+        :param result: Result
+        :param description: command or script path
+        :return: str
+        """
+        lines=['\n\n========= JOB REPORT =========',
+               'node_name: {}'.format(result.node),
+               'job_description: {} "{}"'.format(result.job, description),
+               'job_status/node_return_code: {} / {}'.format(result.status, 
+                                                            'N.A.' if result.return_code is None else result.return_code)]
+        if result.job=='run_script':
+            lines+=['node job_folder: {}'.format(result.remote_job_folder or 'N.A.'),
+                    'local output folder:{}'.format(result.local_output_folder or 'N.A.')]
+        return '\n'.join(lines + ['console output:\n{}\n'.format(result.output)])
+
+    def incidents(self):
+        """
+        incidents of the nodes of every workspace, keyed by {workspace}:{node}
+
+        :return: dictionary: node name -> collections.Counter
+        """
+        return {'{}:{}'.format(ws, name): counter for ws, provider in self.providers.items() 
+                for name, counter in provider.incidents.items()}
+
 
 class Vagrant(object):
     """
@@ -47,33 +757,151 @@ class Vagrant(object):
 																				  
     """
 
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, vagrant_ssh=False, multiplex=True, persist=0, parallel=DEFAULT_PARALLEL, 
+                 inventory_ttl=10, trace=False, timeout=None, connect_timeout=10, retries=2, workspace=None, 
+                 min_parallel=None):
         """
         TODO: doc
 
         :param debug:
+        :param vagrant_ssh: run remote command through `vagrant ssh` instead of calling the system ssh directly
+        :param multiplex: share one persistent ssh master connection per node among all of the remote operations
+        :param persist: idle seconds the master connections outlive this run. if 0, they are closed at exit
+        :param parallel: maximum number of nodes a parallel job runs on at the same time
+        :param inventory_ttl: seconds the cached machine names and states are trusted
+        :param trace: record timed spans of every phase in self.tracer
+        :param timeout: [optional], seconds the job of a parallel run may take on one node before it is cancelled
+        :param connect_timeout: seconds a ssh/scp call waits for a node to connect or to answer a keepalive
+        :param retries: number of times a ssh/scp call is retried after a transient connection failure
+        :param workspace: [optional], folder of the vagrant project, default to $EHVAGRANT_HOME or ~/ehvagrant
+        :param min_parallel: [optional], adapt the number of nodes a parallel job runs on at the same time to the 
+                             load of this machine, between min_parallel and parallel, see AdaptiveLimit
         """
         # set workspace and related path
-        if not os.getenv('EHVAGRANT_HOME'):
-            self.workspace = os.path.join(os.path.expanduser('~'),'ehvagrant',)
-        else:
-            self.workspace =  os.getenv('EHVAGRANT_HOME')
-            self.path = os.path.join(self.workspace, "Vagrantfile")
-            self.experiment_path = os.path.join(self.workspace,'experiment')
+        self.workspace = os.path.abspath(workspace) if workspace else workspace_path()
+        self.path = os.path.join(self.workspace, "Vagrantfile")
+        self.experiment_path = os.path.join(self.workspace,'experiment')
+        self.cache_path = os.path.join(self.workspace, '.ehvagrant')
   
 		  # prepare folder and Vagrantfile								
         if not os.path.isdir(self.workspace):
             self._nested_mkdir(self.workspace)
+            os.mkdir(self.workspace)
             
         if not os.path.isdir(self.experiment_path):
             os.mkdir(self.experiment_path)
+
+        if not os.path.isdir(self.cache_path):
+            os.mkdir(self.cache_path)
             
         if not os.path.isfile(self.path):
             self.create(['node1','node2'])  
                          
         self.ssh_config={}
+        # names of the hosts vagrant has no ssh setting of, e.g. halted ones
+        self.ssh_config_missing=set()
+        self.ssh_config_fingerprint=None
+        self.ssh_config_lock = threading.Lock()
+        self.hash_cache=None
+        self.hash_cache_lock = threading.Lock()
+        self.runs_lock = threading.Lock()
         self.debug = debug
+        self.vagrant_ssh = vagrant_ssh
+        self.parallel = int(parallel)
+        self.min_parallel = int(min_parallel) if min_parallel else None
+        self.inventory_ttl = inventory_ttl
+        self.tracer = Tracer() if trace else None
+        self.timeout = float(timeout) if timeout else None
+        self.connect_timeout = int(connect_timeout)
+        self.retries = int(retries)
+        # node name -> counter of timeout, retry and replaced events of this run
+        self.incidents = collections.defaultdict(collections.Counter)
+
+        # ssh connection multiplexing, not supported by the windows port of openssh
+        self.multiplex = multiplex and os.name != 'nt'
+        self.persist = int(persist or 0)
+        self.connected = set()
+        if self.multiplex:
+            self.control_path = runtime_path(self.workspace)
+            atexit.register(self._close_connections)
           
+    def workspaces(self):
+        """
+        the registered workspaces, kept in .ehvagrant/workspaces.json of this workspace
+
+        :return: dictionary: workspace name -> {'path': folder of the vagrant project, 'budget': int or None}
+        """
+        try:
+            with open(os.path.join(self.cache_path, 'workspaces.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def add_workspace(self, name, path, budget=None):
+        """
+        register a vagrant project, so jobs can fan out over its nodes too
+
+        :param name: name of the workspace, the prefix of its nodes in reports
+        :param path: folder of the vagrant project, with its Vagrantfile
+        :param budget: [optional], maximum number of its nodes a job runs on at the same time
+        :return: None
+        """
+        if ':' in name or ',' in name:
+            raise ValueError('workspace name {} must not contain : or ,'.format(name))
+        if not os.path.isfile(os.path.join(path, 'Vagrantfile')):
+            raise EnvironmentError('there is no Vagrantfile in {}'.format(path))
+        registry=self.workspaces()
+        registry[name]={'path':os.path.abspath(path), 'budget':int(budget) if budget else None}
+        with open(os.path.join(self.cache_path, 'workspaces.json'), 'w') as out:
+            json.dump(registry, out, indent=2)
+
+    def remove_workspace(self, name):
+        """
+        unregister a workspace, its vagrant project is left as it is
+
+        :param name: name of the workspace
+        :return: None
+        """
+        registry=self.workspaces()
+        if registry.pop(name, None) is None:
+            raise ValueError('unknown workspace {}'.format(name))
+        with open(os.path.join(self.cache_path, 'workspaces.json'), 'w') as out:
+            json.dump(registry, out, indent=2)
+
+    def list_workspaces(self):
+        """
+        print the registered workspaces
+
+        :return: None
+        """
+        rows=[['name', 'budget', 'path']]
+        for name, x in sorted(self.workspaces().items()):
+            rows.append([name, str(x.get('budget') or '-'), x['path']])
+        widths=[max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        print('\n'.join('  '.join(x.ljust(w) for x, w in zip(row, widths)).rstrip() for row in rows))
+
+    def shards(self, names=None):
+        """
+        Shards object over registered workspaces, whose Vagrant objects share the options of this one
+
+        :param names: [optional], list of workspace names, default to every registered workspace
+        :return: Shards
+        """
+        registry=self.workspaces()
+        names=list(registry) if not names or names==['all'] else names
+        unknown=[x for x in names if x not in registry]
+        if unknown:
+            raise ValueError('unknown workspace {}, register it with `ehvagrant workspace add`'.format(','.join(unknown)))
+        
+        providers={}
+        for name in names:
+            providers[name]=Vagrant(debug=self.debug, vagrant_ssh=self.vagrant_ssh, multiplex=self.multiplex, 
+                                    persist=self.persist, parallel=self.parallel, inventory_ttl=self.inventory_ttl, 
+                                    timeout=self.timeout, connect_timeout=self.connect_timeout, retries=self.retries, 
+                                    workspace=registry[name]['path'])
+            providers[name].tracer=self.tracer
+        return Shards(providers, {x: registry[x].get('budget') for x in names}, self.parallel, self.min_parallel)
+
     def _update_by_key(self, target, source, keys=[], key_dict={}):
         for x in keys:
             if source.get(x): # key exists and not none
@@ -84,238 +912,1902 @@ class Vagrant(object):
                 
         return target
 		
+    def _span(self, phase, node=None, **args):
+        """
+        timed span of self.tracer, or a no-op if tracing is off
+
+        :param phase: name of the phase
+        :param node: [optional], name of the node
+        :return: context manager
+        """
+        if self.tracer is None:
+            return contextlib.nullcontext()
+        return self.tracer.span(phase, node, **args)
+
     def _impute_drive_sep(self, splited_path):
-        if ':' in splited_path[0]:
+        if splited_path and not splited_path[0]:
+            # absolute posix path
+            splited_path[0] = os.sep
+        elif ':' in splited_path[0]:
             splited_path.insert(0, os.sep)
             splited_path.insert(2, os.sep)
         return splited_path
     
     def _nested_mkdir(self, path):
         parsed_path = re.split('[\\\\/]', path)
-        parsed_path = [x for x in parsed_path if x]
         parsed_path = self._impute_drive_sep(parsed_path)
+        parsed_path = [x for x in parsed_path if x]
         
         for i in range(len(parsed_path)-1):
             d=os.path.join(*parsed_path[0:i+1])
             if not os.path.isdir(d):
                 os.mkdir(d)
 
-    def _get_host_names(self):
+    def _get_host_names(self, state=None):
         """
         get all of the host names that exist in current vagrant environment
+
+        :param state: [optional], list of machine states, e.g. ['running']. Only hosts in one of them are returned
+        :return: list
         """
-        res = self.execute('vagrant status', result=True)
-        if isinstance(res, Exception):
-            print(res)
-            return []
-            
-        res = res.decode('utf8')
-        res = re.split('[\r\n]{1,2}', res)
-        host_lines = res[res.index('', 1) + 1:res.index('', 2)]
-        host_names = [re.split('\s+', x)[0] for x in host_lines]
-        return host_names
+        machines = self.inventory()
+        return [x for x in machines if not state or machines[x].get('state') in state]
 
-    def _scp(self, name, direction, source, dest, recursive):
+    def _filter_hosts(self, hosts, state):
         """
-        upload file to / fetch file from the remote node using scp functionality available on local machine
+        keep the hosts whose machine state is one of state
 
-        :param name: name of the node.
-        :param direction: download or upload
-        :param source: source file path 
-        :param dest: destination file path 
-        :return: None
-        """         
-        # get vagrant setting
-        if name not in self.ssh_config:
-            res=self.execute('vagrant ssh-config {}'.format(name), result=True)
-            res=res.decode('utf8')            
-            configs=[x.strip().split() for x in re.split('[\r\n]+',res) if x]
-            configs=dict(zip([x[0] for x in configs], [x[1] for x in configs]))
-            user=configs['User']
-            key_file=os.path.normpath(configs['IdentityFile'])
-            ip=configs['HostName']
-            port=configs['Port']
-                        
-            #save to ssh_config
-            self.ssh_config[name]={'user':user, 'ip':ip, 'port':port, 'key_file':key_file}
-        else:
-            user, ip, port, key_file=[self.ssh_config[name][x] for x in ['user','ip','port','key_file']]
-            
-        # submit 
-        kwargs={'recursive': '-r' if recursive else '',
-                'port':port,
-                'key_file':key_file,
-                'source':source,
-                'user':user,
-                'ip':ip,
-                'dest':dest}     
-                      
-        if direction=='upload':
-            logging.debug('upload {} to node {} with path {}...'.format(source, name, dest))
-            template='scp {recursive} -P {port} -q -o LogLevel=QUIET -o StrictHostKeyChecking=no -i {key_file} {source} {user}@{ip}:{dest}'
-            subprocess.call(template.format(**kwargs))
-        elif direction=='download':
-            logging.debug('download {} form the node {} with path {}...'.format(source, name, dest))
-            template='scp {recursive} -P {port} -q -o LogLevel=QUIET -o StrictHostKeyChecking=no -i {key_file} {user}@{ip}:{source} {dest}'
-            subprocess.call(template.format(**kwargs))
-                     
-    def _parse_run_result(self, res, template=None, report_kwargs=None):
+        :param hosts: list of node names
+        :param state: list of machine states
+        :return: list
         """
-        parse running result, and (optionally) generating running report
+        machines = self.inventory()
+        kept = [x for x in hosts if machines.get(x, {}).get('state') in state]
+        for x in hosts:
+            if x not in kept:
+                logging.info('skip node {}, its state is {}'.format(x, machines.get(x, {}).get('state', 'unknown')))
+        return kept
 
-        :param res: job result object
-        :param template: template of running report
-        :param report_kwargs: content dictionary of running result
-        :return: str or dictionary:
-        """         
-        #parse run_report
-        job_status='Finished' if not isinstance(res, Exception) else 'Failed'
-        
-        if job_status =='Finished':
-            str_output=res.decode('utf8') if not isinstance(res, str) else res
-            command_output=re.search('^\x04(.+?)\nreturn_code', str_output, re.MULTILINE|re.DOTALL)
-            command_output=command_output.group(1).strip() if command_output else ""
-            return_code=int(re.search('return_code: (\d+)', str_output).group(1))
-            job_status=job_status if return_code!=0 else 'Success'
-        else:                               
-            command_output=res.stdout.decode('utf8')
-            return_code='N.A.'
-        
-        ## return 
-        parse_result={'job_status':job_status, 'return_code':return_code, 'output':command_output}
-        if template and report_kwargs:
-            report_kwargs.update(parse_result)
-            return template.format(**report_kwargs)
-        else:
-            return parse_result
+    def _parse_machine_readable(self, res):
+        """
+        parse the output of `vagrant status --machine-readable`
 
-    def run_parallel(self, hosts, run_action, args, kwargs):                                            
+        :param res: output of vagrant status
+        :return: dictionary: host name -> {'state':..., 'provider':...}, in the order of Vagrantfile
         """
-        run job in parallel fashion
+        res = res.decode('utf8') if not isinstance(res, str) else res
+        machines = {}
+        for line in res.splitlines():
+            fields = line.split(',', 3)
+            if len(fields) < 4 or not fields[1]:
+                continue
+            data = fields[3].replace('%!(VAGRANT_COMMA)', ',').replace('\\n', '\n')
+            if fields[2] == 'state':
+                machines.setdefault(fields[1], {})['state'] = data
+            elif fields[2] == 'provider-name':
+                machines.setdefault(fields[1], {})['provider'] = data
+        return machines
 
-        :param hosts: list of node names on which job runs
-        :param run_action: running action function object
-        :param args: positional arguments of running action function
-        :param kwargs: keyword arguments of running action function
-        :return: None:
-        """      
-        # initalize threading pool
-        pool = mt.Pool(len(hosts))
-        run_result = queue.Queue()
+    def inventory(self, refresh=False):
+        """
+        names, states and providers of all machines in the current vagrant environment. The answer of 
+        `vagrant status --machine-readable` is cached under EHVAGRANT_HOME for inventory_ttl seconds, or until 
+        the .vagrant/machines state folder changes
+
+        :param refresh: ignore the cache
+        :return: dictionary: host name -> {'state':..., 'provider':...}, in the order of Vagrantfile
+        """
+        cache_file = os.path.join(self.cache_path, 'inventory.json')
+        fingerprint = self._state_fingerprint()
+        if not refresh and os.path.isfile(cache_file):
+            try:
+                with open(cache_file) as f:
+                    cache = json.load(f)
+                if cache['fingerprint'] == fingerprint and time.time() - cache['time'] < self.inventory_ttl:
+                    return cache['machines']
+            except (ValueError, KeyError, OSError) as e:
+                logging.debug('ignore broken inventory cache {}: {}'.format(cache_file, e))
         
-        # submit job to the threading pool and put the job result object into the result queue
-        for name in hosts:
-            cur_args=([name] + args)
-            job=pool.apply_async(run_action, args=cur_args, kwds=kwargs)            
-            run_result.put([name, job])
-        pool.close()
-        
-        # retrieve the result          
-        wait_time=5
-        run_report=[]
-        while run_result.qsize()>0:
-            node, job_res = run_result.get()
-            if not job_res.ready():
-                run_result.put([node, job_res])
-                logging.info('job assign to node {:<8s} is not finished yet! Wait for finishing.....'.format(node, wait_time))
-                time.sleep(wait_time)
-            else:
-                run_report.append(job_res.get())
+        res = self.execute('vagrant status --machine-readable', result=True)
+        if isinstance(res, subprocess.CalledProcessError):
+            res = res.output or b''
+        elif isinstance(res, Exception):
+            print(res)
+            return {}
+        machines = self._parse_machine_readable(res)
         
-        #print report
-        for x in run_report:
-            print(x)					
+        tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+        with open(tmp_file, 'w') as out:
+            json.dump({'fingerprint':fingerprint, 'time':time.time(), 'machines':machines}, out)
+        os.replace(tmp_file, cache_file)
+        return machines
+
+    def _invalidate_inventory(self):
+        """
+        drop the cached inventory, called after machine states are changed
+
+        :return: None
+        """
+        cache_file = os.path.join(self.cache_path, 'inventory.json')
+        if os.path.isfile(cache_file):
+            os.remove(cache_file)
+
+    def _invalidate_ssh_config(self):
+        """
+        drop the ssh setting held in memory, called after machine states are changed. The disk cache is 
+        checked against the state fingerprint on the next lookup
+
+        :return: None
+        """
+        with self.ssh_config_lock:
+            self.ssh_config={}
+            self.ssh_config_missing=set()
+            self.ssh_config_fingerprint=None
+
+    def _state_fingerprint(self):
+        """
+        digest of the Vagrantfile and the .vagrant/machines state folder, changes whenever a machine is
+        created, booted, halted or destroyed, or the Vagrantfile is edited
+
+        :return: str
+        """
+        stats=[]
+        machine_path=os.path.join(self.workspace, '.vagrant', 'machines')
+        for path in [self.path]:
+            if os.path.isfile(path):
+                st=os.stat(path)
+                stats.append([path, st.st_mtime_ns, st.st_size])
+        for root, dirs, files in os.walk(machine_path):
+            dirs.sort()
+            for f in sorted(files):
+                st=os.stat(os.path.join(root, f))
+                stats.append([os.path.relpath(os.path.join(root, f), machine_path), st.st_mtime_ns, st.st_size])
+        return hashlib.sha1(json.dumps(stats).encode('utf8')).hexdigest()
+
+    def _parse_ssh_config(self, res):
+        """
+        parse the output of `vagrant ssh-config`, which may hold the setting of several hosts
+
+        :param res: output of vagrant ssh-config
+        :return: dictionary: host name -> ssh setting
+        """
+        res=res.decode('utf8') if not isinstance(res, str) else res
+        configs={}
+        cur=None
+        for line in re.split('[\r\n]+', res):
+            line=line.strip().split(None, 1)
+            if len(line)!=2:
+                continue
+            if line[0]=='Host':
+                cur=configs.setdefault(line[1], {})
+            elif cur is not None:
+                cur[line[0]]=line[1].strip('"')
+        
+        ssh_config={}
+        for name, config in configs.items():
+            if not all(x in config for x in ['User','HostName','Port','IdentityFile']):
+                continue
+            ssh_config[name]={'user':config['User'], 
+                              'ip':config['HostName'], 
+                              'port':config['Port'], 
+                              'key_file':os.path.normpath(config['IdentityFile'])}
+        return ssh_config
+
+    def _load_ssh_config(self):
+        """
+        load ssh setting of all hosts into self.ssh_config. The setting is read from the disk cache under 
+        EHVAGRANT_HOME if it is still valid, otherwise all of the hosts are queried with a single 
+        `vagrant ssh-config` call and the cache is rewritten
+
+        :return: None
+        """
+        cache_file=os.path.join(self.cache_path, 'ssh_config.json')
+        fingerprint=self._state_fingerprint()
+        
+        # try disk cache
+        if os.path.isfile(cache_file):
+            try:
+                with open(cache_file) as f:
+                    cache=json.load(f)
+                if cache.get('fingerprint')==fingerprint:
+                    self.ssh_config=dict(cache['hosts'])
+                    self.ssh_config_missing=set(cache.get('missing', []))
+                    self.ssh_config_fingerprint=fingerprint
+                    return
+            except (ValueError, KeyError, OSError) as e:
+                logging.debug('ignore broken ssh config cache {}: {}'.format(cache_file, e))
+        
+        # bulk query. vagrant stops at the first host which is not ready for ssh, but the output of the ready
+        # ones is still usable
+        logging.debug('query ssh setting of all hosts......')
+        with self._span('ssh_config'):
+            res=self.execute('vagrant ssh-config', result=True)
+            if isinstance(res, subprocess.CalledProcessError):
+                res=res.output or b''
+            elif isinstance(res, Exception):
+                res=b''
+            self.ssh_config=self._parse_ssh_config(res)
+        self.ssh_config_missing=set()
+        self.ssh_config_fingerprint=fingerprint
+        self._save_ssh_config()
+
+    def _save_ssh_config(self):
+        """
+        write self.ssh_config to the disk cache
+
+        :return: None
+        """
+        cache_file=os.path.join(self.cache_path, 'ssh_config.json')
+        tmp_file='{}.{}.tmp'.format(cache_file, os.getpid())
+        with open(tmp_file, 'w') as out:
+            json.dump({'fingerprint':self.ssh_config_fingerprint, 'hosts':self.ssh_config, 
+                       'missing':sorted(self.ssh_config_missing)}, out)
+        os.replace(tmp_file, cache_file)
+
+    def _cached_host_names(self):
+        """
+        names of the hosts which have a ssh setting in the cache
+
+        :return: list
+        """
+        with self.ssh_config_lock:
+            if self.ssh_config_fingerprint!=self._state_fingerprint():
+                self._load_ssh_config()
+            return list(self.ssh_config)
+
+    def _get_ssh_config(self, name):
+        """
+        get ssh setting of a node, shared by upload, download, run_command and run_script
+
+        :param name: name of the node
+        :return: dictionary with key user, ip, port and key_file
+        """
+        with self.ssh_config_lock:
+            # a machine which is recreated or halted changes the state fingerprint, and may change its port
+            if self.ssh_config_fingerprint!=self._state_fingerprint():
+                self._load_ssh_config()
+            
+            if name not in self.ssh_config and name not in self.ssh_config_missing:
+                # not covered by the bulk query (e.g. booted after the cache was built), ask for it alone
+                res=self.execute('vagrant ssh-config {}'.format(name), result=True)
+                if isinstance(res, subprocess.CalledProcessError):
+                    # e.g. halted, remembered until the machine state changes
+                    self.ssh_config_missing.add(name)
+                    self._save_ssh_config()
+                if isinstance(res, Exception):
+                    raise EnvironmentError('can not get ssh setting of node {}: {}'.format(name, res))
+                self.ssh_config.update(self._parse_ssh_config(res))
+                if name not in self.ssh_config:
+                    self.ssh_config_missing.add(name)
+                self._save_ssh_config()
                 
-    def run_script(self, name, script_path, data=None, report=True, report_alone=True):
+            if name not in self.ssh_config:
+                raise EnvironmentError('can not get ssh setting of node {}'.format(name))
+            return self.ssh_config[name]
+
+    async def _get_ssh_config_async(self, name):
+        """
+        non-blocking version of _get_ssh_config. The lookup may call vagrant, so it runs in a worker thread and 
+        gives up after self.timeout seconds
+
+        :param name: name of the node
+        :return: dictionary with key user, ip, port and key_file
+        """
+        loop=asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(None, self._get_ssh_config, name), self.timeout)
+        except asyncio.TimeoutError:
+            raise EnvironmentError('can not get ssh setting of node {}: timed out after {} seconds'.format(name, 
+                                                                                                        self.timeout))
+
+    def _local_path(self, path):
+        """
+        absolute local path, with ~ expanded and a trailing separator kept
+
+        :param path: local path, relative to the current folder
+        :return: str
+        """
+        absolute=os.path.abspath(os.path.expanduser(path))
+        return os.path.join(absolute, '') if path.endswith(('/', os.sep)) else absolute
+
+    async def _scp_async(self, name, direction, source, dest, recursive, compress=False):
+        """
+        upload file to / fetch file from the remote node using scp functionality available on local machine
+
+        :param name: name of the node.
+        :param direction: download or upload
+        :param source: source file path 
+        :param dest: destination file path 
+        :param compress: compress data on the wire
+        :return: bytes or exception
+        """         
+        # get vagrant setting
+        config=await self._get_ssh_config_async(name)
+        user, ip, port=[config[x] for x in ['user','ip','port']]
+        
+        # scp runs in the workspace, so the local path must not be relative to the current folder
+        if direction=='upload':
+            source=self._local_path(source)
+        else:
+            dest=self._local_path(dest)
+            
+        # submit 
+        kwargs={'recursive': '-r' if recursive else '',
+                'compress': '-C' if compress else '',
+                'port':port,
+                'options':self._ssh_options(name, config),
+                'source':source,
+                'user':user,
+                'ip':ip,
+                'dest':dest}     
+                      
+        if direction=='upload':
+            logging.debug('upload {} to node {} with path {}...'.format(source, name, dest))
+            template='scp {recursive} {compress} -P {port} -q {options} {source} {user}@{ip}:{dest}'
+        elif direction=='download':
+            logging.debug('download {} form the node {} with path {}...'.format(source, name, dest))
+            template='scp {recursive} {compress} -P {port} -q {options} {user}@{ip}:{source} {dest}'
+        
+        with self._span('scp', name, direction=direction, source=source):
+            res=await self._retry_async(name, lambda: self.execute_async(template.format(**kwargs), result=True))
+        if isinstance(res, Exception):
+            logging.error('{} {} on node {} failed: {}'.format(direction, source, name, res))
+        return res
+
+    def _scp(self, name, direction, source, dest, recursive, compress=False):
+        """
+        blocking version of _scp_async
+        """
+        return self._run_sync(self._scp_async(name, direction, source, dest, recursive, compress))
+
+    def _local_manifest(self, path):
+        """
+        content manifest of a local file or folder. File hashes are kept in a disk cache under EHVAGRANT_HOME 
+        and reused as long as size and mtime of the file are unchanged
+
+        :param path: local path of file or folder
+        :return: dictionary: relative path -> [size, sha1]
+        """
+        path=os.path.abspath(path)
+        if os.path.isdir(path):
+            files=[]
+            for root, dirs, names in os.walk(path):
+                for x in names:
+                    full=os.path.join(root, x)
+                    files.append([os.path.relpath(full, path).replace(os.sep, '/'), full])
+        elif os.path.isfile(path):
+            files=[[os.path.basename(path), path]]
+        else:
+            return {}
+        
+        cache_file=os.path.join(self.cache_path, 'hash_cache.json')
+        with self.hash_cache_lock:
+            if self.hash_cache is None:
+                try:
+                    with open(cache_file) as f:
+                        self.hash_cache=json.load(f)
+                except (ValueError, OSError):
+                    self.hash_cache={}
+            
+            manifest={}
+            dirty=False
+            for rel, full in files:
+                st=os.stat(full)
+                cached=self.hash_cache.get(full)
+                if cached and cached[0]==st.st_size and cached[1]==st.st_mtime_ns:
+                    digest=cached[2]
+                else:
+                    sha1=hashlib.sha1()
+                    with open(full, 'rb') as f:
+                        for chunk in iter(lambda: f.read(1 << 20), b''):
+                            sha1.update(chunk)
+                    digest=sha1.hexdigest()
+                    self.hash_cache[full]=[st.st_size, st.st_mtime_ns, digest]
+                    dirty=True
+                manifest[rel]=[st.st_size, digest]
+            
+            if dirty:
+                tmp_file='{}.{}.tmp'.format(cache_file, os.getpid())
+                with open(tmp_file, 'w') as out:
+                    json.dump(self.hash_cache, out)
+                os.replace(tmp_file, cache_file)
+        return manifest
+
+    async def _remote_manifest_async(self, name, path):
+        """
+        content manifest of a file or folder on the node
+
+        :param name: name of the node
+        :param path: path of file or folder on the node
+        :return: (kind, dictionary: relative path -> sha1). kind is 'dir', 'file' or None if path does not exist
+        """
+        command=' '.join(['if [ -d {p} ]; then echo dir; cd {p} && find . -type f -exec sha1sum {{}} +;',
+                          'elif [ -f {p} ]; then echo file; sha1sum {p}; fi']).format(p=path)
+        res=await self.run_command_async(name, command, report=False)
+        if isinstance(res, Exception):
+            raise EnvironmentError('can not list {} on node {}: {}'.format(path, name, res))
+        
+        lines=[x for x in res['output'].splitlines() if x.strip()]
+        if not lines or lines[0].strip() not in ['dir', 'file']:
+            return None, {}
+        manifest={}
+        for line in lines[1:]:
+            digest, rel=line.strip().split(None, 1)
+            rel=rel[2:] if rel.startswith('./') else rel
+            manifest[rel if lines[0].strip()=='dir' else os.path.basename(rel)]=digest
+        return lines[0].strip(), manifest
+
+    def _pack_files(self, root, names, compress, out):
+        """
+        pack files under root into a tar stream
+
+        :param root: local folder
+        :param names: relative path of files to be packed
+        :param compress: gzip the stream
+        :param out: file object the stream is written to
+        :return: int, size of the stream
+        """
+        with tarfile.open(fileobj=out, mode='w:gz' if compress else 'w') as tar:
+            for x in names:
+                tar.add(os.path.join(root, x), arcname=x)
+        size=out.tell()
+        out.seek(0)
+        return size
+
+    def _unpack_files(self, stream, dest):
+        """
+        unpack a tar stream into dest
+
+        :param stream: file object of the tar stream
+        :param dest: local folder
+        :return: None
+        """
+        os.makedirs(dest, exist_ok=True)
+        with tarfile.open(fileobj=stream, mode='r:*') as tar:
+            extract_kwargs={'filter':'data'} if hasattr(tarfile, 'data_filter') else {}
+            tar.extractall(dest, **extract_kwargs)
+
+    async def _sync_async(self, name, direction, source, dest, compress=False):
+        """
+        delta-sync a file or folder between the host and the node: both sides are compared by content hash, and 
+        only the changed files are transferred, as one tar stream over ssh. A source folder is mirrored into the 
+        dest folder; a source file is copied to dest, or into dest if it is a folder
+
+        :param name: name of the node
+        :param direction: download or upload
+        :param source: source file path 
+        :param dest: destination file path 
+        :param compress: compress data on the wire
+        :return: dictionary of transfer statistic
+        """
+        loop=asyncio.get_running_loop()
+        z='z' if compress else ''
+        stats={'node':name, 'files':0, 'transferred_files':0, 'transferred_bytes':0, 'saved_bytes':0}
+        
+        if direction=='upload':
+            local=await loop.run_in_executor(None, self._local_manifest, source)
+            if os.path.isfile(source):
+                kind, remote=await self._remote_manifest_async(name, dest)
+                target='{}/{}'.format(dest.rstrip('/'), os.path.basename(source)) if kind=='dir' or dest.endswith('/') else dest
+                if kind=='dir':
+                    kind, remote=await self._remote_manifest_async(name, target)
+                changed=[x for x in local if remote.get(os.path.basename(target))!=local[x][1]]
+            else:
+                kind, remote=await self._remote_manifest_async(name, dest)
+                changed=[x for x in local if remote.get(x)!=local[x][1]]
+            stats['files']=len(local)
+            stats['saved_bytes']=sum(local[x][0] for x in local if x not in changed)
+            
+            if changed and os.path.isfile(source):
+                res=await self._scp_async(name, 'upload', source, target, False, compress)
+                stats['transferred_bytes']=local[changed[0]][0]
+            elif changed:
+                with tempfile.TemporaryFile() as payload:
+                    size=await loop.run_in_executor(None, self._pack_files, source, changed, compress, payload)
+                    command=await self._ssh_command_async(name, 'mkdir -p {d} && tar x{z}f - -C {d}'.format(d=dest, z=z))
+                    
+                    async def transfer():
+                        payload.seek(0)
+                        return await self.execute_async(command, result=True, stdin=payload, stdout=subprocess.DEVNULL)
+                    
+                    res=await self._retry_async(name, transfer)
+                stats['transferred_bytes']=size
+        
+        else:
+            kind, remote=await self._remote_manifest_async(name, source)
+            if kind is None:
+                raise EnvironmentError('{} does not exist on node {}'.format(source, name))
+            elif kind=='file':
+                target=os.path.join(dest, os.path.basename(source)) if os.path.isdir(dest) or dest.endswith(('/', os.sep)) else dest
+                local=await loop.run_in_executor(None, self._local_manifest, target)
+                changed=[x for x in remote if [v[1] for v in local.values()]!=[remote[x]]]
+            else:
+                local=await loop.run_in_executor(None, self._local_manifest, dest) if os.path.isdir(dest) else {}
+                changed=[x for x in remote if local.get(x, [None, None])[1]!=remote[x]]
+            stats['files']=len(remote)
+            if kind=='file':
+                stats['saved_bytes']=0 if changed else sum(v[0] for v in local.values())
+            else:
+                stats['saved_bytes']=sum(v[0] for x, v in local.items() if x in remote and x not in changed)
+            
+            if changed and kind=='file':
+                res=await self._scp_async(name, 'download', source, target, False, compress)
+                stats['transferred_bytes']=os.path.getsize(target) if os.path.isfile(target) else 0
+            elif changed:
+                with tempfile.TemporaryFile() as names, tempfile.TemporaryFile() as payload:
+                    names.write('\n'.join(changed).encode('utf8'))
+                    names.seek(0)
+                    command=await self._ssh_command_async(name, 'cd {s} && tar c{z}f - -T -'.format(s=source, z=z))
+                    
+                    async def transfer():
+                        names.seek(0)
+                        payload.seek(0)
+                        payload.truncate()
+                        return await self.execute_async(command, result=True, stdin=names, stdout=payload)
+                    
+                    res=await self._retry_async(name, transfer)
+                    stats['transferred_bytes']=payload.tell()
+                    payload.seek(0)
+                    if not isinstance(res, Exception):
+                        await loop.run_in_executor(None, self._unpack_files, payload, dest)
+        
+        if changed and isinstance(res, Exception):
+            raise EnvironmentError('sync {} {} on node {} failed: {}'.format(direction, source, name, res))
+        
+        stats['transferred_files']=len(changed)
+        logging.info('{} {} node {}: {}/{} files changed, {} bytes transferred, {} bytes saved'.format(
+                direction, source, name, stats['transferred_files'], stats['files'], 
+                stats['transferred_bytes'], stats['saved_bytes']))
+        return stats
+
+    def _ssh_options(self, name, config=None):
+        """
+        ssh options shared by the scp and ssh calls made against a node
+
+        :param name: name of the node
+        :param config: [optional], ssh setting of the node, looked up if None
+        :return: str
+        """
+        key_file=(config or self._get_ssh_config(name))['key_file']
+        options=['-o LogLevel=QUIET', 
+                 '-o StrictHostKeyChecking=no', 
+                 '-o UserKnownHostsFile={}'.format(os.devnull), 
+                 '-o IdentitiesOnly=yes',
+                 '-o ConnectTimeout={}'.format(self.connect_timeout),
+                 '-o ServerAliveInterval={}'.format(self.connect_timeout),
+                 '-o ServerAliveCountMax=3',
+                 '-i {}'.format(shlex.quote(key_file))]
+        
+        if self.multiplex:
+            # share one master connection per node among all of the ssh and scp calls
+            options.extend(['-o ControlMaster=auto',
+                            '-o ControlPath={}'.format(shlex.quote(os.path.join(self.control_path, '%C'))),
+                            '-o ControlPersist={}'.format(self.persist if self.persist else 600)])
+            self.connected.add(name)
+        return ' '.join(options)
+
+    def disconnect(self, name=None):
+        """
+        close the multiplexed master connection of the node
+
+        :param name: [optional], name of the node. if None, close all of the connection opened by this object
+        :return: None
+        """
+        if not self.multiplex:
+            return
+        names=[name] if name else list(self.connected)
+        for x in names:
+            try:
+                user, ip, port=[self._get_ssh_config(x)[k] for k in ['user','ip','port']]
+            except EnvironmentError:
+                continue
+            logging.debug('close master connection of node {}......'.format(x))
+            self.execute('ssh -O exit -p {port} {options} {user}@{ip}'.format(port=port, 
+                                                                              options=self._ssh_options(x), 
+                                                                              user=user, 
+                                                                              ip=ip), result=True)
+            self.connected.discard(x)
+
+    def _close_connections(self):
+        """
+        teardown hook, close the master connections at exit unless they should persist across runs
+
+        :return: None
+        """
+        if not self.persist:
+            self.disconnect()
+
+    def _transient(self, res):
+        """
+        whether a ssh/scp call failed to reach the node, rather than failed on it. ssh exits with 255 then, and 
+        quiet scp exits without any message of the remote side
+
+        :param res: result of execute_async
+        :return: bool
+        """
+        if not isinstance(res, subprocess.CalledProcessError):
+            return False
+        return res.returncode==255 or (res.cmd.startswith('scp ') and b'scp: ' not in (res.output or b''))
+
+    async def _retry_async(self, name, call, retry=None):
+        """
+        await call, and await it again with exponential backoff while it fails with a transient connection error
+
+        :param name: name of the node
+        :param call: coroutine function which returns the result of execute_async
+        :param retry: [optional], function which takes the result and tells whether it may be retried, default 
+                      to self._transient
+        :return: result of the last attempt
+        """
+        retry=retry or self._transient
+        for attempt in range(self.retries + 1):
+            res=await call()
+            if attempt==self.retries or not retry(res):
+                return res
+            delay=RETRY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5)
+            logging.warning('connection to node {} failed, retry in {:.1f} seconds'.format(name, delay))
+            self.incidents[name]['retry']+=1
+            await asyncio.sleep(delay)
+
+    def _incident_report(self):
+        """
+        format the timeout, retry and replaced events of every node into a table
+
+        :return: str, empty if nothing happened
+        """
+        if not self.incidents:
+            return ''
+        rows=[['node', 'timeout', 'retry', 'replaced']]
+        for name in sorted(self.incidents):
+            rows.append([name] + [str(self.incidents[name][x]) for x in rows[0][1:]])
+        widths=[max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines=['  '.join(x.ljust(w) for x, w in zip(row, widths)) for row in rows]
+        return '\n'.join(['\n========= INCIDENTS =========', lines[0], '-' * len(lines[0])] + lines[1:])
+
+    def _ssh_command(self, name, command, config=None):
+        """
+        build the system ssh call which runs command on the node directly, without starting vagrant
+
+        :param name: name of the node
+        :param command: command executed on the node
+        :param config: [optional], ssh setting of the node, looked up if None
+        :return: str
+        """
+        config=config or self._get_ssh_config(name)
+        user, ip, port=[config[x] for x in ['user','ip','port']]
+        return 'ssh -p {port} -q -T {options} {user}@{ip} {command}'.format(port=port, 
+                                                                            options=self._ssh_options(name, config),
+                                                                            user=user, 
+                                                                            ip=ip, 
+                                                                            command=shlex.quote(command))
+
+
+    async def _ssh_command_async(self, name, command):
+        """
+        non-blocking version of _ssh_command, for the event loop
+
+        :param name: name of the node
+        :param command: command executed on the node
+        :return: str
+        """
+        return self._ssh_command(name, command, await self._get_ssh_config_async(name))
+                     
+    def _parse_run_result(self, res, template=None, report_kwargs=None, stream=None):
+        """
+        parse running result, and (optionally) generating running report
+
+        :param res: job result object
+        :param template: template of running report
+        :param report_kwargs: content dictionary of running result
+        :param stream: [optional], NodeStream object the output was streamed to
+        :return: str or dictionary:
+        """         
+        #parse run_report
+        job_status='Finished' if not isinstance(res, Exception) else 'Failed'
+        
+        if job_status =='Finished' and stream is not None:
+            command_output='streamed to {}'.format(stream.log_path)
+            return_code=stream.return_code if stream.return_code is not None else 'N.A.'
+            job_status=job_status if return_code!=0 else 'Success'
+        elif job_status =='Finished':
+            str_output=res.decode('utf8') if not isinstance(res, str) else res
+            command_output=re.search('^\x04(.+?)\nreturn_code', str_output, re.MULTILINE|re.DOTALL)
+            command_output=command_output.group(1).strip() if command_output else ""
+            return_code=int(re.search('return_code: (\d+)', str_output).group(1))
+            job_status=job_status if return_code!=0 else 'Success'
+        else:                               
+            command_output=res.stdout.decode('utf8') if getattr(res, 'stdout', None) else str(res)
+            return_code='N.A.'
+        
+        ## return 
+        parse_result={'job_status':job_status, 'return_code':return_code, 'output':command_output}
+        if stream is not None:
+            parse_result.update({'log_path':stream.log_path, 'output_bytes':stream.bytes})
+        if template and report_kwargs:
+            report_kwargs.update(parse_result)
+            return template.format(**report_kwargs)
+        else:
+            return parse_result
+
+    async def _start_parallel(self, hosts, job, parallel):
+        """
+        schedule job on every host, at most parallel of them run at the same time
+
+        :param hosts: list of node names on which job runs
+        :param job: coroutine function which takes the node name
+        :param parallel: maximum number of nodes running at the same time
+        :return: dictionary: task -> node name
+        """
+        semaphore=self._limiter(parallel)
+        
+        async def bounded_job(name):
+            async with semaphore:
+                return await job(name)
+        
+        return {asyncio.ensure_future(bounded_job(name)):name for name in hosts}
+
+    def _limiter(self, parallel):
+        """
+        limit of the number of nodes running at the same time, adaptive if self.min_parallel is set
+
+        :param parallel: maximum number of nodes running at the same time
+        :return: asyncio.Semaphore or AdaptiveLimit
+        """
+        if self.min_parallel:
+            return AdaptiveLimit(min(self.min_parallel, parallel), parallel, tracer=self.tracer)
+        return asyncio.Semaphore(parallel)
+
+    def iter_parallel(self, hosts, run_action, args, kwargs, parallel=None):
+        """
+        run job in parallel fashion, and yield the job result of every node as soon as it finishes. Actions 
+        with an async version (e.g. run_command_async) run as coroutines of a single event loop, the others
+        run in a thread pool of size parallel. A job which runs longer than self.timeout is cancelled, and its 
+        result is a TimeoutError
+
+        :param hosts: list of node names on which job runs
+        :param run_action: running action function object
+        :param args: positional arguments of running action function
+        :param kwargs: keyword arguments of running action function
+        :param parallel: maximum number of nodes running at the same time, default to self.parallel
+        :return: generator of (node name, job result). job result is the exception raised by the job if it failed
+        """
+        parallel=max(min(parallel or self.parallel, len(hosts)), 1)
+        async_action=getattr(self, '{}_async'.format(run_action.__name__), None)
+        executor=futures.ThreadPoolExecutor(max_workers=parallel) if async_action is None else None
+        loop=BlockingLoop()
+        
+        async def job(name):
+            with self._span('job', name, action=run_action.__name__):
+                if async_action is not None:
+                    call=async_action(name, *args, **kwargs)
+                else:
+                    call=asyncio.get_running_loop().run_in_executor(executor, functools.partial(run_action, name, *args, **kwargs))
+                try:
+                    return await asyncio.wait_for(call, self.timeout)
+                except asyncio.TimeoutError:
+                    self.incidents[name]['timeout']+=1
+                    raise TimeoutError('job on node {} timed out after {} seconds'.format(name, self.timeout))
+        
+        pending=set()
+        try:
+            tasks=loop.run_until_complete(self._start_parallel(hosts, job, parallel))
+            pending=set(tasks)
+            while pending:
+                done, pending=loop.run_until_complete(asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED))
+                for task in done:
+                    try:
+                        res=task.result()
+                    except Exception as e:
+                        logging.error('job assigned to node {} failed: {}'.format(tasks[task], e))
+                        res=e
+                    yield tasks[task], res
+        finally:
+            # cancel the unfinished jobs if the caller stops early
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.close()
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+    def _summary_table(self, results, last_column=('log', 'log_path')):
+        """
+        format the status and return code of every node into a table
+
+        :param results: list of (node name, job result)
+        :param last_column: (title, key) of the last column
+        :return: str
+        """
+        rows=[['node', 'status', 'return_code', last_column[0]]]
+        for name, res in sorted(results, key=lambda x: x[0]):
+            if isinstance(res, Exception):
+                res=self._parse_run_result(res)
+            rows.append([name, res['job_status'], str(res['return_code']), str(res.get(last_column[1], 'N.A.'))])
+        widths=[max(len(row[i]) for row in rows) for i in range(3)]
+        lines=['  '.join([x.ljust(w) for x, w in zip(row, widths)] + [row[3]]) for row in rows]
+        return '\n'.join(['\n========= SUMMARY =========', lines[0], '-' * len(lines[0])] + lines[1:])
+
+    def _result_record(self, name, res, job_type):
+        """
+        flatten the result of a run into a json serializable record. Outputs up to INLINE_OUTPUT_BYTES are inlined,
+        spooled outputs are referenced by the path of their log and never read in full
+
+        :param name: name of the node
+        :param res: job result, dictionary or exception
+        :param job_type: run_command or run_script
+        :return: dictionary
+        """
+        if isinstance(res, Exception):
+            res=self._parse_run_result(res)
+        record={'node':name, 
+                'job':job_type,
+                'status':res['job_status'], 
+                'return_code':res['return_code'] if isinstance(res['return_code'], int) else None}
+        if 'started' in res:
+            record.update({'started':round(res['started'], 3), 
+                           'finished':round(res['started'] + res['seconds'], 3), 
+                           'seconds':round(res['seconds'], 3)})
+        for key in ['remote_job_folder', 'local_output_folder', 'cached']:
+            if key in res:
+                record[key]=res[key]
+        if 'log_path' in res:
+            record.update({'output_path':res['log_path'], 'output_bytes':res['output_bytes']})
+            if res['output_bytes'] <= INLINE_OUTPUT_BYTES:
+                with open(res['log_path'], 'rb') as f:
+                    record['output']=f.read().decode('utf8', 'replace')
+        else:
+            record.update({'output':res['output'], 'output_bytes':len(res['output'].encode('utf8'))})
+        return record
+
+    def _result(self, name, res, job_type):
+        """
+        Result object of the job result of a node
+
+        :param name: name of the node
+        :param res: job result, as yielded by iter_parallel
+        :param job_type: name of the action
+        :return: Result
+        """
+        error=res if isinstance(res, Exception) else None
+        if job_type in ['run_command', 'run_script']:
+            return Result(error=error, **self._result_record(name, res, job_type))
+        if error is not None:
+            parsed=self._parse_run_result(res)
+            return Result(name, job_type, parsed['job_status'], error=error, output=parsed['output'])
+        if isinstance(res, dict) and 'job_status' in res:
+            return Result(name, job_type, res['job_status'], res.get('return_code'), value=res)
+        return Result(name, job_type, 'Success', value=res)
+
+    def map(self, hosts, action, *args, parallel=None, **kwargs):
+        """
+        run an action on every host in parallel fashion, see iter_parallel, and lazily yield a Result per node in 
+        the order the nodes finish. Nothing starts before the first result is asked for, and the jobs still running 
+        are cancelled once the generator is closed, e.g. by leaving a for loop early. run_command and run_script 
+        never print reports here: their output is kept in Result.output, or spooled to a log if spool=True
+
+            for result in provider.map(hosts, 'run_script', 'job.sh', spool=True):
+                if not result.ok:
+                    break
+
+        :param hosts: list of node names on which the action runs
+        :param action: name of the action, e.g. run_command, or the method itself
+        :param args: positional arguments of the action after the node name
+        :param parallel: maximum number of nodes running at the same time, default to self.parallel
+        :param kwargs: keyword arguments of the action
+        :return: generator of Result
+        """
+        action=getattr(self, action) if isinstance(action, str) else action
+        if action.__name__ in ['run_command', 'run_script']:
+            kwargs['report']=False
+        with contextlib.closing(self.iter_parallel(hosts, action, args, kwargs, parallel)) as results:
+            for name, res in results:
+                yield self._result(name, res, action.__name__)
+
+    def run_parallel(self, hosts, run_action, args, kwargs, parallel=None):                                            
+        """
+        run job in parallel fashion, print the report of every node as soon as it finishes
+
+        :param hosts: list of node names on which job runs
+        :param run_action: running action function object
+        :param args: positional arguments of running action function
+        :param kwargs: keyword arguments of running action function
+        :param parallel: maximum number of nodes running at the same time, default to self.parallel
+        :return: None:
+        """      
+        for node, report in self.iter_parallel(hosts, run_action, args, kwargs, parallel):
+            if isinstance(report, str):
+                print(report)
+                
+    def _box_identity(self, name):
+        """
+        identity of the box a node is built from, read from the box_meta file vagrant keeps in .vagrant/machines
+
+        :param name: name of node
+        :return: dictionary with box, version and provider, or with the node name if the node has no box_meta
+        """
+        path=os.path.join(self.workspace, '.vagrant', 'machines', name)
+        for provider in sorted(os.listdir(path)) if os.path.isdir(path) else []:
+            meta=os.path.join(path, provider, 'box_meta')
+            if os.path.isfile(meta):
+                with open(meta) as f:
+                    box=json.load(f)
+                return {'box':box.get('name'), 'version':box.get('version'), 'provider':provider}
+        return {'node':name}
+
+    def _result_key(self, name, script_path, data=None, args=None, reset_to=None):
+        """
+        key of a run_script result in the result cache: digest of the script, the data manifest, the arguments, 
+        the snapshot the node starts from and the box of the node
+
+        :return: str
+        """
+        key={'script':[v[1] for v in self._local_manifest(script_path).values()],
+             'data':self._data_digest(data) if data else None,
+             'args':args,
+             'reset_to':reset_to,
+             'box':self._box_identity(name)}
+        return hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf8')).hexdigest()
+
+    def _link_tree(self, source, dest):
+        """
+        copy a folder as hard links where the file system allows it, so cached outputs take no extra space
+
+        :param source: local folder
+        :param dest: local folder, created if missing
+        :return: None
+        """
+        def link(src, dst):
+            if os.path.lexists(dst):
+                if os.path.samefile(src, dst):
+                    return
+                os.remove(dst)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+        shutil.copytree(source, dest, copy_function=link, dirs_exist_ok=True)
+
+    def _store_result(self, key, run_res, guest_exp_folder_path, host_exp_folder_path, have_output_file):
+        """
+        keep a successful run_script result in the result cache under .ehvagrant/results/{key}: the console 
+        output, the output folder and the report fields. An entry is built aside and renamed into place, so a
+        concurrent reader never sees half of it, and the first of concurrent writers wins
+
+        :return: None
+        """
+        results_path=os.path.join(self.cache_path, 'results')
+        os.makedirs(results_path, exist_ok=True)
+        entry=os.path.join(results_path, key)
+        if os.path.isdir(entry):
+            return
+        tmp=tempfile.mkdtemp(prefix='{}.'.format(key), suffix='.tmp', dir=results_path)
+        try:
+            if 'log_path' in run_res:
+                shutil.copyfile(run_res['log_path'], os.path.join(tmp, 'console_output.log'))
+            else:
+                with open(os.path.join(tmp, 'console_output.log'), 'w') as out:
+                    out.write(run_res['output'])
+            if have_output_file:
+                self._link_tree(host_exp_folder_path, os.path.join(tmp, 'output'))
+            with open(os.path.join(tmp, 'result.json'), 'w') as out:
+                json.dump({'job_status':run_res['job_status'], 'return_code':run_res['return_code'], 
+                           'remote_job_folder':guest_exp_folder_path + '/', 'stored':time.time()}, out)
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _load_result(self, key, host_exp_folder_path, stream=None):
+        """
+        look a run_script result up in the result cache, link its output folder into host_exp_folder_path and 
+        replay its console output, and mark the entry as used
+
+        :param key: key of the result, see _result_key
+        :param host_exp_folder_path: local folder the output files are placed in
+        :param stream: [optional], NodeStream object the console output is replayed to
+        :return: (running result, whether the output folder exists), or None if the cache has no such result
+        """
+        entry=os.path.join(self.cache_path, 'results', key)
+        try:
+            with open(os.path.join(entry, 'result.json')) as f:
+                res=json.load(f)
+            os.utime(os.path.join(entry, 'result.json'))
+            have_output_file=os.path.isdir(os.path.join(entry, 'output'))
+            if have_output_file:
+                self._link_tree(os.path.join(entry, 'output'), host_exp_folder_path)
+            with open(os.path.join(entry, 'console_output.log'), 'rb') as f:
+                if stream is not None:
+                    for line in f:
+                        stream(line.rstrip(b'\n'))
+                    res.update({'output':'streamed to {}'.format(stream.log_path), 'log_path':stream.log_path, 
+                                'output_bytes':stream.bytes})
+                else:
+                    res['output']=f.read().decode('utf8', 'replace')
+        except (OSError, ValueError):
+            return None
+        res.pop('stored', None)
+        res['cached']=True
+        return res, have_output_file
+
+    def result_cache_gc(self, max_size=None, max_age=None):
+        """
+        evict entries from the local result cache. Entries not used for max_age days are removed, then the least 
+        recently used entries are removed until the cache fits in max_size
+
+        :param max_size: [optional], maximum total size of the cache, int in bytes or size string like 10G
+        :param max_age: [optional], maximum age of an entry, in days since it was last used
+        :return: dictionary of eviction statistic
+        """
+        results_path=os.path.join(self.cache_path, 'results')
+        entries=[]
+        for key in os.listdir(results_path) if os.path.isdir(results_path) else []:
+            entry=os.path.join(results_path, key)
+            try:
+                used=os.path.getmtime(os.path.join(entry, 'result.json'))
+            except OSError:
+                # left over by an interrupted writer
+                used=os.path.getmtime(entry)
+            size=sum(os.path.getsize(os.path.join(root, x)) for root, dirs, names in os.walk(entry) for x in names)
+            entries.append([used, size, entry])
+        
+        # keep the most recently used entries
+        max_size=self._parse_size(max_size) if max_size is not None else None
+        now=time.time()
+        kept, removed, total=[], [], 0
+        for used, size, entry in sorted(entries, reverse=True):
+            too_old=max_age is not None and now - used > float(max_age) * 86400
+            too_big=max_size is not None and total + size > max_size
+            if too_old or too_big or entry.endswith('.tmp') and now - used > 86400:
+                shutil.rmtree(entry, ignore_errors=True)
+                removed.append(size)
+            else:
+                kept.append(size)
+                total+=size
+        
+        stats={'removed':len(removed), 'removed_bytes':sum(removed), 'kept':len(kept), 'kept_bytes':total}
+        (logging.info if removed else logging.debug)('result cache: removed {} entries ({} bytes), kept {} entries ({} bytes)'.format(
+                stats['removed'], stats['removed_bytes'], stats['kept'], stats['kept_bytes']))
+        return stats
+
+    def _runs_db(self):
+        """
+        open the run index, .ehvagrant/runs.db under the workspace, and create its table if it is missing
+
+        :return: sqlite3.Connection
+        """
+        conn=sqlite3.connect(os.path.join(self.cache_path, 'runs.db'), timeout=30)
+        conn.row_factory=sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY,
+                node TEXT, job TEXT, script TEXT, script_name TEXT, args TEXT, job_folder TEXT,
+                status TEXT, return_code INTEGER, started REAL, finished REAL, seconds REAL,
+                output_bytes INTEGER, output_files INTEGER, output_files_bytes INTEGER, cached INTEGER,
+                remote_job_folder TEXT, local_output_folder TEXT, output_path TEXT);
+            CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+            CREATE INDEX IF NOT EXISTS runs_node ON runs (node, started);
+            CREATE INDEX IF NOT EXISTS runs_script ON runs (script_name, started);
+            CREATE INDEX IF NOT EXISTS runs_status ON runs (status, started);
+            ''')
+        return conn
+
+    def _index_run(self, record):
+        """
+        add a finished job to the run index. A failure is logged and never fails the job
+
+        :param record: dictionary of column values
+        :return: None
+        """
+        try:
+            with self.runs_lock:
+                conn=self._runs_db()
+                try:
+                    with conn:
+                        conn.execute('INSERT INTO runs ({}) VALUES ({})'.format(', '.join(record), 
+                                                                              ', '.join('?' * len(record))), 
+                                     list(record.values()))
+                finally:
+                    conn.close()
+        except sqlite3.Error as e:
+            logging.warning('can not add the run of node {} to the run index: {}'.format(record.get('node'), e))
+
+    def _parse_time(self, value):
+        """
+        parse a point in time: epoch seconds, a date like 2024-05-01 or 2024-05-01T13:30, or a duration before 
+        now like 30m, 12h or 7d
+
+        :param value: str
+        :return: float, epoch seconds
+        """
+        value=str(value).strip()
+        match=re.match('^(\\d+(?:\\.\\d+)?)([smhd])$', value)
+        if match:
+            return time.time() - float(match.group(1)) * {'s':1, 'm':60, 'h':3600, 'd':86400}[match.group(2)]
+        if re.match('^\\d+(\\.\\d+)?$', value):
+            return float(value)
+        for fmt in ['%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d']:
+            try:
+                return time.mktime(time.strptime(value, fmt))
+            except ValueError:
+                pass
+        raise ValueError('invalid time: {}'.format(value))
+
+    def runs(self, nodes=None, status=None, script=None, since=None, until=None, limit=None):
+        """
+        query the run index, newest run first
+
+        :param nodes: [optional], list of node names
+        :param status: [optional], job status, Success, Finished or Failed
+        :param script: [optional], shell pattern of the script file name, e.g. sweep*.sh
+        :param since: [optional], only runs started since then, see _parse_time
+        :param until: [optional], only runs started before then, see _parse_time
+        :param limit: [optional], maximum number of runs
+        :return: list of dictionary, one per run
+        """
+        where, params=[], []
+        if nodes:
+            where.append('node IN ({})'.format(', '.join('?' * len(nodes))))
+            params+=list(nodes)
+        if status:
+            where.append('status = ?')
+            params.append(status)
+        if script:
+            where.append('script_name GLOB ?')
+            params.append(script)
+        if since:
+            where.append('started >= ?')
+            params.append(self._parse_time(since))
+        if until:
+            where.append('started < ?')
+            params.append(self._parse_time(until))
+        query='SELECT * FROM runs{} ORDER BY started DESC, id DESC'.format(' WHERE ' + ' AND '.join(where) if where else '')
+        if limit:
+            query+=' LIMIT {:d}'.format(int(limit))
+        
+        conn=self._runs_db()
+        try:
+            return [dict(row) for row in conn.execute(query, params)]
+        finally:
+            conn.close()
+
+    def _runs_table(self, runs):
+        """
+        format runs of the run index into a table
+
+        :param runs: list of dictionary, see runs
+        :return: str
+        """
+        rows=[['started', 'node', 'job', 'status', 'return_code', 'seconds', 'output']]
+        for x in runs:
+            rows.append([time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(x['started'])), x['node'], 
+                         ' '.join([x['script_name'] or '', x['args'] or '']).strip(), x['status'] + (' (cached)' if x['cached'] else ''), 
+                         str(x['return_code'] if x['return_code'] is not None else 'N.A.'), '{:.1f}'.format(x['seconds']), 
+                         x['local_output_folder'] or x['output_path'] or 'N.A.'])
+        widths=[max(len(row[i]) for row in rows) for i in range(len(rows[0]) - 1)]
+        lines=['  '.join([x.ljust(w) for x, w in zip(row, widths)] + [row[-1]]) for row in rows]
+        return '\n'.join([lines[0], '-' * len(lines[0])] + lines[1:] + ['{} runs'.format(len(runs))])
+
+    async def run_script_async(self, name, script_path, data=None, report=True, report_alone=True, pipeline=False,
+                               data_cache=False, stream=False, spool=False, args=None, exp_folder_name=None, reset_to=None,
+                               result_cache=False):
+        """
+        run shell script on specified node, fetch the console output and data output if existed
+
+        :param name: name of node
+        :param script_path: local path of script file which will be executed on the node
+        :param report: processing job running report. if False, return result object
+        :param report_alone: print job running report. if False, return job running report
+        :param pipeline: ship script and data, run the script and fetch the results within a single ssh session
+        :param data_cache: keep data in the content-addressed cache of the node, and only upload it if the node 
+                           does not have it yet
+        :param stream: print console output lines as they arrive and tee them to console_output.log in the local 
+                       experiment folder, instead of holding the output
+        :param spool: write console output to console_output.log without printing it, instead of holding the output
+        :param args: [optional], extra arguments of the script, a shell string passed after the job folder
+        :param exp_folder_name: [optional], name of the job folder, default to {script_name}_{epoch_second}
+        :param reset_to: [optional], name of a snapshot the node is restored to right before the job starts
+        :param result_cache: reuse the stored result of a successful run with the same script, data, arguments, 
+                             snapshot and box instead of running the job, and store the result of this run
+        :return: dictionary, subprocess.CalledProcessError
+        """
+        started=time.time()
+        loop=asyncio.get_running_loop()
+        
+        # building path
+        script_name=os.path.basename(script_path)
+        exp_folder_name=exp_folder_name or '{}_{:.0f}'.format(script_name,time.time())
+        guest_exp_folder_path='~/cm_experiment/{}'.format(exp_folder_name)
+        host_exp_folder_path = os.path.join(self.experiment_path, name, exp_folder_name, 'output')  
+        
+        if stream or spool:
+            stream=NodeStream(name, os.path.join(self.experiment_path, name, exp_folder_name, 'console_output.log'),
+                              echo=bool(stream))
+        
+        key, cached=None, None
+        try:
+            if result_cache:
+                with self._span('result_cache', name):
+                    key=await loop.run_in_executor(None, self._result_key, name, script_path, data, args, reset_to)
+                    cached=await loop.run_in_executor(None, self._load_result, key, host_exp_folder_path, stream or None)
+            if cached is not None:
+                logging.info('node {}: result of {} is in the result cache, the job does not run'.format(name, script_path))
+                run_res, have_output_file=cached
+            else:
+                if reset_to:
+                    restored=await self.snapshot_async(name, 'restore', reset_to)
+                    if restored['job_status']!='Success':
+                        raise EnvironmentError('can not restore node {} to snapshot {}'.format(name, reset_to))
+                
+                with self._span('run_script', name, script=script_path, pipeline=bool(pipeline)):
+                    if pipeline and not self.vagrant_ssh:
+                        run_res, have_output_file=await self._run_script_pipeline_async(name, script_path, data, 
+                                                                                        guest_exp_folder_path, host_exp_folder_path,
+                                                                                        data_cache, stream or None, args)
+                    else:
+                        run_res, have_output_file=await self._run_script_steps_async(name, script_path, data, 
+                                                                                     guest_exp_folder_path, host_exp_folder_path,
+                                                                                     data_cache, stream or None, args)
+        finally:
+            if stream:
+                stream.close()
+        if isinstance(run_res, Exception):
+            run_res=self._parse_run_result(run_res)
+        elif key and cached is None and run_res['job_status']=='Success':
+            await loop.run_in_executor(None, self._store_result, key, run_res, guest_exp_folder_path, 
+                                       host_exp_folder_path, have_output_file)
+        
+        # add the job to the run index
+        finished=time.time()
+        output_files=[os.path.join(root, x) for root, dirs, names in os.walk(host_exp_folder_path) for x in names] if have_output_file else []
+        await loop.run_in_executor(None, self._index_run, {
+            'node':name, 'job':'run_script', 'script':os.path.abspath(script_path), 'script_name':script_name, 
+            'args':args, 'job_folder':exp_folder_name, 'status':run_res['job_status'], 
+            'return_code':run_res['return_code'] if isinstance(run_res['return_code'], int) else None,
+            'started':started, 'finished':finished, 'seconds':finished - started, 
+            'output_bytes':run_res['output_bytes'] if 'log_path' in run_res else len(run_res['output'].encode('utf8')),
+            'output_files':len(output_files), 'output_files_bytes':sum(os.path.getsize(x) for x in output_files),
+            'cached':int(bool(run_res.get('cached'))), 
+            'remote_job_folder':run_res.get('remote_job_folder', guest_exp_folder_path + '/'),
+            'local_output_folder':host_exp_folder_path + '/' if have_output_file else None, 
+            'output_path':run_res.get('log_path')})
+
+        # processing the report
+        if not report:
+            run_res.update({'started':started, 'seconds':time.time() - started, 
+                            'remote_job_folder':run_res.get('remote_job_folder', guest_exp_folder_path + '/'), 
+                            'local_output_folder':host_exp_folder_path + '/' if have_output_file else None})
+            return run_res
+        
+        else:
+            template='\n'.join(['\n\n========= JOB REPORT =========',
+                                'node_name: {name}',
+                                'job_description: {job_type} "{command}"',
+                                'job_status/node_return_code: {job_status} / {return_code}',
+                                'node job_folder: {remote_job_folder}',
+                                'local output folder:{local_output_folder}',
+                                'console output:\n{output}\n'])            
+            
+            report_kwargs={'name':name, 
+                           'job_type':'run_script',
+                           'remote_job_folder':guest_exp_folder_path+'/',
+                           'local_output_folder': host_exp_folder_path+'/' if have_output_file else 'N.A.',
+                           'command':script_path                          
+                           }
+            
+            report_kwargs.update(run_res)            
+            report=template.format(**report_kwargs)
+            
+            if report_alone:
+                print(report)            
+            else:
+                return report
+
+    def run_script(self, name, script_path, data=None, report=True, report_alone=True, pipeline=False, 
+                   data_cache=False, stream=False, spool=False, args=None, exp_folder_name=None, reset_to=None,
+                   result_cache=False):
+        """
+        blocking version of run_script_async
+        """
+        return self._run_sync(self.run_script_async(name, script_path, data, report, report_alone, pipeline, 
+                                                    data_cache, stream, spool, args, exp_folder_name, reset_to,
+                                                    result_cache))
+
+    def load_jobs(self, path):
+        """
+        read a job list, one json object per line with the keys script, and optionally data and args. args is a 
+        shell string or a list of arguments. Relative paths are relative to the folder of the job list, blank 
+        lines and lines starting with # are skipped
+
+        :param path: local path of the job list
+        :return: list of dictionary
+        """
+        base=os.path.dirname(os.path.abspath(path))
+        jobs=[]
+        with open(path) as f:
+            for i, line in enumerate(f):
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+                try:
+                    job=json.loads(line)
+                    script=job['script']
+                except (ValueError, KeyError, TypeError):
+                    raise ValueError('line {} of {} is not a job with a script: {}'.format(i + 1, path, line.strip()))
+                args=job.get('args') or ''
+                if not isinstance(args, str):
+                    args=' '.join(shlex.quote(str(x)) for x in args)
+                jobs.append({'script':os.path.join(base, os.path.expanduser(script)), 
+                             'data':os.path.join(base, os.path.expanduser(job['data'])) if job.get('data') else None,
+                             'args':args})
+        return jobs
+
+    def iter_batch(self, hosts, jobs, parallel=None, pipeline=False, data_cache=False, attempts=3, speculate=False,
+                   result_cache=False):
+        """
+        run many independent jobs on a pool of nodes. The jobs wait in a single queue which every node pulls from 
+        as soon as it is idle, so faster nodes run more jobs and no node waits for the others to finish a round. 
+        The job folders follow the run_script layout, named {script_name}_{batch epoch}_{job index}, and console 
+        output is spooled to their console_output.log. A node on which a job raises or runs longer than 
+        self.timeout, e.g. since it is unreachable or hangs, leaves the pool and the job goes back to the queue
+
+        :param hosts: list of node names of the pool
+        :param jobs: list of dictionary with script, and optionally data and args, see load_jobs
+        :param parallel: maximum number of nodes running at the same time, default to self.parallel
+        :param pipeline: run every job within a single ssh session
+        :param data_cache: keep data in the content-addressed cache of the nodes
+        :param attempts: number of nodes a job is tried on before it is given up
+        :param speculate: once the queue is empty, run a copy of a straggling job on an idle node. The first copy 
+                          to finish wins and the other one is cancelled, so jobs must be idempotent
+        :param result_cache: reuse the stored result of a job run before with the same inputs, see run_script_async
+        :return: generator of (job index, node name, job result), in the order the jobs finish. job result is the 
+                 exception raised by the last attempt if the job was given up
+        """
+        parallel=max(min(parallel or self.parallel, len(hosts)), 1)
+        batch_id='{:.0f}'.format(time.time())
+        loop=BlockingLoop()
+        
+        async def start():
+            semaphore=self._limiter(parallel)
+            finished=asyncio.Queue()
+            queue=collections.deque((i, job, 0) for i, job in enumerate(jobs))
+            running={}  # job index -> {node name: (task, start time)}
+            done=set()
+            durations=[]
+            
+            def straggler():
+                # the longest running job with a single copy, if it runs much longer than the finished ones
+                if not speculate or not durations:
+                    return None
+                now=time.time()
+                limit=SPECULATE_FACTOR * sorted(durations)[len(durations) // 2]
+                late=[(now - started, index) for index, copies in running.items() if len(copies)==1 
+                      and index not in done for task, started in copies.values() if now - started > limit]
+                return max(late)[1] if late else None
+            
+            async def run_job(name, index, tried):
+                # run one copy of a job, return False if the node has to leave the pool
+                job=jobs[index]
+                folder='{}_{}_{:04d}'.format(os.path.basename(job['script']), batch_id, index)
+                started=time.time()
+                task=asyncio.ensure_future(self.run_script_async(name, job['script'], job.get('data'), report=False, 
+                                                                 pipeline=pipeline, data_cache=data_cache, spool=True,
+                                                                 result_cache=result_cache,
+                                                                 args=job.get('args'), exp_folder_name=folder))
+                running.setdefault(index, {})[name]=(task, started)
+                try:
+                    await asyncio.wait([task], timeout=self.timeout)
+                except asyncio.CancelledError:
+                    task.cancel()
+                    raise
+                finally:
+                    running[index].pop(name)
+                    if not running[index]:
+                        del running[index]
+                
+                if not task.done():
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    self.incidents[name]['timeout']+=1
+                    res=TimeoutError('job {} timed out after {} seconds'.format(index, self.timeout))
+                elif index in done:
+                    # the other copy won
+                    return True
+                else:
+                    res=task.exception() or task.result()
+                
+                if isinstance(res, Exception):
+                    logging.error('job {} failed on node {}, node leaves the pool: {}'.format(index, name, res))
+                    if index in running:
+                        # another copy still runs
+                        pass
+                    elif tried + 1 < attempts:
+                        self.incidents[name]['replaced']+=1
+                        queue.appendleft((index, job, tried + 1))
+                    else:
+                        done.add(index)
+                        finished.put_nowait((index, name, res))
+                    return False
+                
+                done.add(index)
+                durations.append(time.time() - started)
+                for other, (other_task, _) in running.get(index, {}).items():
+                    logging.info('job {} finished on node {} first, cancel the copy on node {}'.format(index, name, other))
+                    self.incidents[other]['replaced']+=1
+                    other_task.cancel()
+                finished.put_nowait((index, name, res))
+                return True
+            
+            async def worker(name):
+                while True:
+                    async with semaphore:
+                        index, tried=None, 0
+                        if queue:
+                            index, job, tried=queue.popleft()
+                        else:
+                            index=straggler()
+                            if index is not None:
+                                logging.info('job {} straggles, run a copy on node {}'.format(index, name))
+                        if index is not None:
+                            if not await run_job(name, index, tried):
+                                return
+                            continue
+                        if not running:
+                            return
+                    # wait for a job to come back to the queue, or to straggle
+                    await asyncio.sleep(0.5)
+            
+            async def drain():
+                await asyncio.gather(*[worker(name) for name in hosts])
+                # every node left the pool, the jobs still waiting can not run
+                while queue:
+                    index, job, tried=queue.popleft()
+                    finished.put_nowait((index, None, EnvironmentError('no node left to run job {}'.format(index))))
+                finished.put_nowait(None)
+            
+            return finished, asyncio.ensure_future(drain())
+        
+        runner=None
+        try:
+            finished, runner=loop.run_until_complete(start())
+            while True:
+                item=loop.run_until_complete(finished.get())
+                if item is None:
+                    break
+                yield item
+        finally:
+            # cancel the unfinished jobs if the caller stops early
+            if runner is not None and not runner.done():
+                runner.cancel()
+                loop.run_until_complete(asyncio.gather(runner, return_exceptions=True))
+            loop.close()
+
+    def run_batch(self, hosts, jobs, parallel=None, pipeline=False, data_cache=False, output_format='text', 
+                  speculate=False, result_cache=False):
+        """
+        run a batch of jobs on a pool of nodes, see iter_batch. A line, or a json record, is printed as soon as a 
+        job finishes, and the records of all jobs are written to experiment/batch_{epoch}.jsonl
+
+        :param hosts: list of node names of the pool
+        :param jobs: list of dictionary with script, and optionally data and args
+        :param parallel: maximum number of nodes running at the same time, default to self.parallel
+        :param pipeline: run every job within a single ssh session
+        :param data_cache: keep data in the content-addressed cache of the nodes
+        :param output_format: text or jsonl
+        :param speculate: run a copy of straggling jobs on idle nodes, the first copy to finish wins
+        :param result_cache: reuse the stored result of a job run before with the same inputs
+        :return: list of job records
+        """
+        index_path=os.path.join(self.experiment_path, 'batch_{:.0f}.jsonl'.format(time.time()))
+        records=[]
+        with open(index_path, 'w') as index_file:
+            for index, name, res in self.iter_batch(hosts, jobs, parallel, pipeline, data_cache, speculate=speculate, 
+                                                    result_cache=result_cache):
+                record=self._result_record(name, res, 'run_script')
+                record.update({'job_index':index, 'script':jobs[index]['script'], 'args':jobs[index]['args']})
+                records.append(record)
+                index_file.write(json.dumps(record) + '\n')
+                index_file.flush()
+                if output_format=='jsonl':
+                    print(json.dumps(record), flush=True)
+                else:
+                    print('[{}/{}] job {} {} on {}: {} / {} in {}s, {}'.format(
+                        len(records), len(jobs), index, ' '.join([os.path.basename(record['script']), record['args']]).strip(), 
+                        name, record['status'], record['return_code'], record.get('seconds', 'N.A.'), 
+                        record.get('local_output_folder') or record.get('output_path') or record.get('output')))
+        
+        if output_format!='jsonl':
+            rows=[['node', 'jobs', 'failed', 'busy_seconds']]
+            for name in sorted(set(x['node'] for x in records if x['node'])):
+                mine=[x for x in records if x['node']==name]
+                rows.append([name, str(len(mine)), str(len([x for x in mine if x['status']!='Success'])), 
+                             '{:.1f}'.format(sum(x.get('seconds', 0) for x in mine))])
+            widths=[max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+            lines=['  '.join(x.ljust(w) for x, w in zip(row, widths)) for row in rows]
+            print('\n'.join(['\n========= BATCH SUMMARY =========', lines[0], '-' * len(lines[0])] + lines[1:] + 
+                            ['job records: {}'.format(index_path)]))
+        return records
+
+    def _data_digest(self, data):
+        """
+        content digest of a local file or folder, the key of the data cache on the node
+
+        :param data: local path of data
+        :return: str
+        """
+        manifest=self._local_manifest(data)
+        return hashlib.sha1(json.dumps(sorted([x, v[1]] for x, v in manifest.items())).encode('utf8')).hexdigest()
+
+    async def _query_data_cache_async(self, name, data):
+        """
+        check whether data is in the data cache of the node, and refresh its access time if so
+
+        :param name: name of node
+        :param data: local path of data
+        :return: (cache folder on the node, whether it exists)
+        """
+        digest=await asyncio.get_running_loop().run_in_executor(None, self._data_digest, data)
+        cache_dir='{}/{}'.format(GUEST_CACHE_PATH, digest)
+        res=await self.run_command_async(name, 'test -d {c} && touch {c}'.format(c=cache_dir), False)
+        cached=not isinstance(res, Exception) and res['return_code']==0
+        logging.debug('data {} {} in the cache of node {}'.format(digest[:12], 'is' if cached else 'is not', name))
+        return cache_dir, cached
+
+    async def _link_cached_data_async(self, name, data, guest_exp_folder_path):
+        """
+        link the data folder of the job to the data cache of the node, the data is uploaded into the cache first 
+        if the node does not have it yet
+
+        :param name: name of node
+        :param data: local path of data
+        :param guest_exp_folder_path: job folder on the node
+        :return: None
+        """
+        cache_dir, cached=await self._query_data_cache_async(name, data)
+        if not cached:
+            # upload into a private folder and rename it, so a half uploaded copy is never linked
+            tmp_dir='{}.tmp{}'.format(cache_dir, os.getpid())
+            await self.run_command_async(name, 'mkdir -p {}'.format(tmp_dir), False)
+            await self.upload_async(name, source=data, dest=tmp_dir + '/', sync=True)
+            await self.run_command_async(name, 'mv -T {tmp} {cache} 2>/dev/null || rm -rf {tmp}'.format(tmp=tmp_dir, 
+                                                                                                    cache=cache_dir), False)
+        await self.run_command_async(name, 'ln -s {} {}/data'.format(cache_dir, guest_exp_folder_path), False)
+
+    def _parse_size(self, size):
+        """
+        parse size string like 500M or 10G
+
+        :param size: size string, in bytes if there is no unit
+        :return: int, number of bytes
+        """
+        units={'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+        match=re.match('^\\s*([\\d.]+)\\s*([KMGT]?)i?B?\\s*$', str(size), re.IGNORECASE)
+        if not match:
+            raise ValueError('invalid size: {}'.format(size))
+        return int(float(match.group(1)) * units[match.group(2).upper()])
+
+    async def cache_gc_async(self, name, max_size=None, max_age=None):
+        """
+        evict entries from the data cache of the node. Entries older than max_age are removed, then the least 
+        recently used entries are removed until the cache fits in max_size
+
+        :param name: name of node
+        :param max_size: [optional], maximum total size of the cache, int in bytes or size string like 10G
+        :param max_age: [optional], maximum age of an entry, in days since it was last used
+        :return: dictionary of eviction statistic
+        """
+        command='for d in {}/*/; do [ -d "$d" ] && echo "$(stat -c %Y "$d") $(du -sk "$d" | cut -f1) $d"; done'
+        res=await self.run_command_async(name, command.format(GUEST_CACHE_PATH), False)
+        if isinstance(res, Exception):
+            raise EnvironmentError('can not list data cache of node {}: {}'.format(name, res))
+        
+        entries=[]
+        for line in res['output'].splitlines():
+            line=line.strip().split(None, 2)
+            if len(line)==3 and line[0].isdigit() and line[1].isdigit():
+                entries.append([int(line[0]), int(line[1]) << 10, line[2].rstrip('/')])
+        
+        # keep the most recently used entries
+        max_size=self._parse_size(max_size) if max_size is not None else None
+        now=time.time()
+        kept, removed, total=[], [], 0
+        for mtime, size, path in sorted(entries, reverse=True):
+            too_old=max_age is not None and now - mtime > float(max_age) * 86400
+            too_big=max_size is not None and total + size > max_size
+            if too_old or too_big:
+                removed.append([size, path])
+            else:
+                kept.append([size, path])
+                total+=size
+        
+        if removed:
+            await self.run_command_async(name, 'rm -rf {}'.format(' '.join(shlex.quote(x[1]) for x in removed)), False)
+        
+        stats={'node':name, 'removed':len(removed), 'removed_bytes':sum(x[0] for x in removed), 
+               'kept':len(kept), 'kept_bytes':total}
+        logging.info('data cache of node {}: removed {} entries ({} bytes), kept {} entries ({} bytes)'.format(
+                name, stats['removed'], stats['removed_bytes'], stats['kept'], stats['kept_bytes']))
+        return stats
+
+    def cache_gc(self, name, max_size=None, max_age=None):
+        """
+        blocking version of cache_gc_async
+        """
+        return self._run_sync(self.cache_gc_async(name, max_size, max_age))
+
+    async def collect_async(self, name, runs=None, dest=None, compress=True, rate_limit=None):
+        """
+        fetch the output folders of past runs from ~/cm_experiment of the node into {dest}/{name}/{run}/output,
+        the layout of run_script. Only the files which are missing locally, or whose size differs, are fetched,
+        as one tar stream over ssh which is gzipped on the node. A partly fetched file has the wrong size, so an
+        interrupted collection picks up where it stopped
+
+        :param name: name of node
+        :param runs: [optional], list of shell patterns of run folder names, e.g. job.sh_*, default to every run
+        :param dest: [optional], local folder, default to the experiment folder
+        :param compress: gzip the stream on the node
+        :param rate_limit: [optional], RateLimit object shared by the transfers of all nodes
+        :return: dictionary of transfer statistic
+        """
+        loop=asyncio.get_running_loop()
+        dest=os.path.join(dest or self.experiment_path, name)
+        command=' '.join(['cd ~/cm_experiment 2>/dev/null && for d in {}; do',
+                          '[ -d "$d/output" ] && find "$d/output" -type f -printf "%s %p\\n"; done; true'])
+        with self._span('collect_list', name):
+            res=await self.run_command_async(name, command.format(' '.join(runs) if runs else '*'), False)
+        if isinstance(res, Exception):
+            raise EnvironmentError('can not list the runs of node {}: {}'.format(name, res))
+
+        remote={}
+        for line in res['output'].splitlines():
+            line=line.strip().split(' ', 1)
+            if len(line)==2 and line[0].isdigit():
+                remote[line[1]]=int(line[0])
+        local={x: os.path.getsize(os.path.join(dest, x)) for x in remote if os.path.isfile(os.path.join(dest, x))}
+        changed=sorted(x for x in remote if local.get(x)!=remote[x])
+        stats={'node':name, 'runs':len(set(x.split('/', 1)[0] for x in remote)), 'files':len(remote),
+               'transferred_files':len(changed), 'transferred_bytes':0,
+               'output_bytes':sum(remote[x] for x in changed),
+               'saved_bytes':sum(remote[x] for x in remote if x not in changed)}
+
+        if changed:
+            with tempfile.TemporaryFile() as names, tempfile.TemporaryFile() as payload:
+                names.write('\n'.join(changed).encode('utf8'))
+                command=await self._ssh_command_async(name, 'cd ~/cm_experiment && tar c{}f - -T -'.format('z' if compress else ''))
+
+                async def transfer():
+                    names.seek(0)
+                    payload.seek(0)
+                    payload.truncate()
+                    return await self.execute_async(command, result=True, stdin=names, stdout=payload,
+                                                    rate_limit=rate_limit)
+
+                with self._span('collect_transfer', name, files=len(changed)):
+                    res=await self._retry_async(name, transfer)
+                if isinstance(res, Exception):
+                    raise EnvironmentError('collect outputs of node {} failed: {}'.format(name, res))
+                stats['transferred_bytes']=payload.tell()
+                payload.seek(0)
+                with self._span('collect_unpack', name):
+                    await loop.run_in_executor(None, self._unpack_files, payload, dest)
+
+        logging.info('collect node {}: {} runs, {}/{} files fetched, {} bytes transferred for {} bytes, {} bytes saved'.format(
+                name, stats['runs'], stats['transferred_files'], stats['files'], stats['transferred_bytes'],
+                stats['output_bytes'], stats['saved_bytes']))
+        return stats
+
+    def collect(self, name, runs=None, dest=None, compress=True, rate_limit=None):
         """
-        run shell script on specified node, fetch the console output and data output if existed
+        blocking version of collect_async
+        """
+        return self._run_sync(self.collect_async(name, runs, dest, compress, rate_limit))
+
+    async def _run_script_steps_async(self, name, script_path, data, guest_exp_folder_path, host_exp_folder_path, 
+                                      data_cache=False, stream=None, args=None):
+        """
+        run_script step by step: build the job folder, upload script and data, run script, fetch console output 
+        and download the output folder, each step with its own remote call
 
         :param name: name of node
         :param script_path: local path of script file which will be executed on the node
-        :param report: processing job running report. if False, return result object
-        :param report_alone: print job running report. if False, return job running report
-        :return: dictionary, subprocess.CalledProcessError
+        :param data: local path of data
+        :param data_cache: link the data folder to the content-addressed data cache on the node
+        :param guest_exp_folder_path: job folder on the node
+        :param host_exp_folder_path: local folder the output files are downloaded to
+        :param stream: [optional], NodeStream object the console output is streamed to
+        :param args: [optional], extra arguments of the script
+        :return: (running result or the exception which stopped the job, whether the output folder is fetched)
         """
-        # building path
         script_name=os.path.basename(script_path)
-        exp_folder_name='{}_{:.0f}'.format(script_name,time.time())
-        guest_exp_folder_path='~/cm_experiment/{}'.format(exp_folder_name)
         guest_script_path='{}/{}'.format(guest_exp_folder_path,script_name)
 
         # ensure cm_experiment folder exists, in not, build cm_experiement folder
-        cm_folder_query=self.run_command(name, 'ls -d ~/cm_experiment/', False)
-        cm_folder_query=cm_folder_query['output']
-        if 'No such file or directory' in cm_folder_query:
-            self.run_command(name, 'mkdir ~/cm_experiment', False)
-                           
-        # build geust expreiment folder and ship sciript to it 
-        self.run_command(name, 'mkdir {}'.format(guest_exp_folder_path), False)
-        self.upload(name, source=script_path, dest=guest_script_path, recursive=False)
+        with self._span('folder_setup'):
+            cm_folder_query=await self.run_command_async(name, 'ls -d ~/cm_experiment/', False)
+            if isinstance(cm_folder_query, Exception):
+                # node unreachable, reported as failed like in pipeline mode
+                return cm_folder_query, False
+            cm_folder_query=cm_folder_query['output']
+            if 'No such file or directory' in cm_folder_query:
+                await self.run_command_async(name, 'mkdir ~/cm_experiment', False)
+                               
+            # build geust expreiment folder
+            await self.run_command_async(name, 'mkdir {}'.format(guest_exp_folder_path), False)
+        
+        # ship sciript to it 
+        with self._span('upload_script'):
+            await self.upload_async(name, source=script_path, dest=guest_script_path, recursive=False)
         
         # if there is some data must runing against, scp data to data folder
-        if data:
-            if os.path.isdir(data):
-                self.upload(name, source=data, dest=guest_exp_folder_path, recursive=True)
-                data_folder = [x for x in re.split('[\\\\/]', data) if x][-1]
-                self.run_command(name, 'mv {base}/{data_folder} {base}/data'.format(base=guest_exp_folder_path, data_folder=data_folder), False)
-            else:
-                data_folder='{}/data/'.format(guest_exp_folder_path)                
-                self.run_command(name, 'mkdir {}'.format(data_folder), False)
-                self.upload(name, source=data, dest=data_folder)
+        with self._span('upload_data'):
+            if data and data_cache:
+                await self._link_cached_data_async(name, data, guest_exp_folder_path)
+            elif data:
+                if os.path.isdir(data):
+                    await self.upload_async(name, source=data, dest=guest_exp_folder_path, recursive=True)
+                    data_folder = [x for x in re.split('[\\\\/]', data) if x][-1]
+                    await self.run_command_async(name, 'mv {base}/{data_folder} {base}/data'.format(base=guest_exp_folder_path, data_folder=data_folder), False)
+                else:
+                    data_folder='{}/data/'.format(guest_exp_folder_path)                
+                    await self.run_command_async(name, 'mkdir {}'.format(data_folder), False)
+                    await self.upload_async(name, source=data, dest=data_folder)
                 
         # run the script
-        script_args=guest_exp_folder_path
-        run_res=self.run_command(name, '. {} {} 2>&1 > {}/console_output.txt'.format(guest_script_path, script_args, guest_exp_folder_path), False)   
+        script_args=guest_exp_folder_path if not args else '{} {}'.format(guest_exp_folder_path, args)
+        with self._span('run'):
+            if stream is not None:
+                run_res=await self.run_command_async(name, '. {} {} 2>&1 | tee {}/console_output.txt; (exit ${{PIPESTATUS[0]}})'.format(guest_script_path, script_args, guest_exp_folder_path), False, stream=stream)
+            else:
+                run_res=await self.run_command_async(name, '. {} {} 2>&1 > {}/console_output.txt'.format(guest_script_path, script_args, guest_exp_folder_path), False)   
         
         # fetch console output
         if isinstance(run_res, subprocess.CalledProcessError):
             # TODO: if return error, how to modify the following process?
             pass
         elif isinstance(run_res, Exception):
-            raise run_res
-        else:
-            console_output=self.run_command(name, 'cat {}/console_output.txt'.format(guest_exp_folder_path), False)
+            return run_res, False
+        elif stream is None:
+            with self._span('fetch_console'):
+                console_output=await self.run_command_async(name, 'cat {}/console_output.txt'.format(guest_exp_folder_path), False)
+            if isinstance(console_output, Exception):
+                return console_output, False
             run_res['output']=console_output['output']+'\n'+run_res['output']               
         
         # fetch output files if exists
-        output_files_query=self.run_command(name, "ls {}/output/".format(guest_exp_folder_path), report=False)
-        have_output_file=output_files_query['return_code']==0 and output_files_query['output'] # remote output folder exists and have files in it     
+        with self._span('download_output'):
+            output_files_query=await self.run_command_async(name, "ls {}/output/".format(guest_exp_folder_path), report=False)
+            if isinstance(output_files_query, Exception):
+                return output_files_query, False
+            have_output_file=output_files_query['return_code']==0 and output_files_query['output'] # remote output folder exists and have files in it     
+            
+            if have_output_file:
+                # build local experiment folder
+                self._nested_mkdir(host_exp_folder_path)
+                await self.download_async(name, source="{}/output/".format(guest_exp_folder_path), dest=host_exp_folder_path, prefix_dest=False, recursive=True)
         
-        if have_output_file:
-            # build local experiment folder
-            host_exp_folder_path = os.path.join(self.experiment_path, name, exp_folder_name, 'output')  
-            self._nested_mkdir(host_exp_folder_path)
-            self.download(name, source="{}/output/".format(guest_exp_folder_path), dest=host_exp_folder_path, prefix_dest=False, recursive=True)
+        return run_res, have_output_file
 
-        # processing the report
-        if not report:
-            return run_res
+    def _pack_job(self, script_path, data, out):
+        """
+        pack script and data into a gzipped tar stream, laid out as they are in the job folder
+
+        :param script_path: local path of script file
+        :param data: local path of data, file or folder
+        :param out: file object the stream is written to
+        :return: None
+        """
+        with tarfile.open(fileobj=out, mode='w:gz') as tar:
+            tar.add(script_path, arcname=os.path.basename(script_path))
+            if data:
+                if os.path.isdir(data):
+                    tar.add(data, arcname='data')
+                else:
+                    tar.add(data, arcname='data/{}'.format(os.path.basename(data)))
+        out.flush()
+        out.seek(0)
+
+    def _unpack_job_result(self, stream, host_exp_folder_path):
+        """
+        unpack the result stream sent back by the pipelined job, output files are extracted into 
+        host_exp_folder_path
+
+        :param stream: file object of the gzipped tar stream
+        :param host_exp_folder_path: local output folder
+        :return: (dictionary: result file name -> content, whether there is any output file)
+        """
+        results={}
+        outputs=[]
+        with tarfile.open(fileobj=stream, mode='r:gz') as tar:
+            for member in tar.getmembers():
+                if member.name in ['console_output.txt', 'stderr_output.txt', 'return_code.txt']:
+                    results[member.name]=tar.extractfile(member).read().decode('utf8', 'replace')
+                elif member.name.startswith('output/') and (member.isfile() or member.isdir()):
+                    outputs.append(member)
+            
+            have_output_file=any(x.isfile() for x in outputs)
+            if have_output_file:
+                # extract into the parent, member names already start with output/
+                os.makedirs(host_exp_folder_path, exist_ok=True)
+                extract_kwargs={'filter':'data'} if hasattr(tarfile, 'data_filter') else {}
+                tar.extractall(os.path.dirname(host_exp_folder_path), members=outputs, **extract_kwargs)
+        return results, have_output_file
+
+    async def _run_script_pipeline_async(self, name, script_path, data, guest_exp_folder_path, host_exp_folder_path,
+                                         data_cache=False, stream=None, args=None):
+        """
+        run_script within a single ssh session: script and data are streamed to the node as one archive, and the 
+        console output, return code and the output folder come back as one archive on the same channel. With 
+        data_cache, one more call checks whether the data is already cached on the node
+
+        :param name: name of node
+        :param script_path: local path of script file which will be executed on the node
+        :param data: local path of data
+        :param guest_exp_folder_path: job folder on the node
+        :param host_exp_folder_path: local folder the output files are extracted to
+        :param data_cache: link the data folder to the content-addressed data cache on the node
+        :param stream: [optional], NodeStream object the console output is streamed to, over standard error of 
+                       the session since standard output carries the result archive
+        :param args: [optional], extra arguments of the script
+        :return: (running result, whether the output folder is fetched)
+        """
+        loop=asyncio.get_running_loop()
+        link_data=''
+        if data and data_cache:
+            with self._span('data_cache'):
+                cache_dir, cached=await self._query_data_cache_async(name, data)
+            if cached:
+                data=None
+                link_data='ln -s {} data &&'.format(cache_dir)
+            else:
+                tmp_dir='{}.tmp{}'.format(cache_dir, os.getpid())
+                link_data=('mkdir -p {root} && mv data {tmp} && {{ mv -T {tmp} {cache} 2>/dev/null || rm -rf {tmp}; }} '
+                           '&& ln -s {cache} data &&').format(root=GUEST_CACHE_PATH, tmp=tmp_dir, cache=cache_dir)
         
+        if stream is None:
+            run=' '.join(['( . {job}/{script} {job} {args}) > {job}/console_output.txt 2> {job}/stderr_output.txt;',
+                          'echo $? > {job}/return_code.txt;'])
         else:
-            template='\n'.join(['\n\n========= JOB REPORT =========',
-                                'node_name: {name}',
-                                'job_description: {job_type} "{command}"',
-                                'job_status/node_return_code: {job_status} / {return_code}',
-                                'node job_folder: {remote_job_folder}',
-                                'local output folder:{local_output_folder}',
-                                'console output:\n{output}\n'])            
-            
-            report_kwargs={'name':name, 
-                           'job_type':'run_script',
-                           'remote_job_folder':guest_exp_folder_path+'/',
-                           'local_output_folder': host_exp_folder_path+'/' if have_output_file else 'N.A.',
-                           'command':script_path                          
-                           }
-            
-            report_kwargs.update(run_res)            
-            report=template.format(**report_kwargs)
+            run=' '.join(['( . {job}/{script} {job} {args}) 2>&1 | tee {job}/console_output.txt >&2;',
+                          'echo ${{PIPESTATUS[0]}} > {job}/return_code.txt; : > {job}/stderr_output.txt;'])
+        remote=' '.join(['mkdir -p {job} && cd {job} && tar xzf - && {link_data} cd ~ &&',
+                         run,
+                         'cd {job} && tar czf - console_output.txt stderr_output.txt return_code.txt',
+                         '$(test -d output && echo output)'])
+        remote=remote.format(job=guest_exp_folder_path, script=os.path.basename(script_path), link_data=link_data, 
+                             args=args + ' ' if args else '')
+        
+        with tempfile.TemporaryFile() as payload, tempfile.TemporaryFile() as result:
+            with self._span('pack'):
+                await loop.run_in_executor(None, self._pack_job, script_path, data, payload)
+            try:
+                command=await self._ssh_command_async(name, remote)
+            except EnvironmentError as e:
+                return e, False
             
-            if report_alone:
-                print(report)            
-            else:
-                return report            
+            logging.debug('run script {} on node {} in a single session......'.format(script_path, name))
+            with self._span('session'):
+                res=await self.execute_async(command, result=True, stdin=payload, stdout=result, stream=stream)
+            if isinstance(res, Exception):
+                return res, False
             
-    def run_command(self, name, command, report=True, report_alone=True):
+            result.seek(0)
+            try:
+                with self._span('unpack'):
+                    results, have_output_file=await loop.run_in_executor(None, self._unpack_job_result, 
+                                                                         result, host_exp_folder_path)
+            except tarfile.TarError as e:
+                return subprocess.CalledProcessError(255, command, output=str(e).encode('utf8')), False
+        
+        return_code=int(results.get('return_code.txt', '').strip() or 255)
+        run_res={'job_status':'Success' if return_code==0 else 'Finished',
+                 'return_code':return_code,
+                 'output':'{}\n{}'.format(results.get('console_output.txt', '').strip(), 
+                                         results.get('stderr_output.txt', '').strip())}
+        if stream is not None:
+            run_res.update({'output':'streamed to {}'.format(stream.log_path), 'log_path':stream.log_path, 
+                            'output_bytes':stream.bytes})
+        return run_res, have_output_file
+
+    async def run_command_async(self, name, command, report=True, report_alone=True, stream=False, spool=False):
         """
         run shell command in specified node
 
@@ -323,15 +2815,43 @@ class Vagrant(object):
         :param command: command executed on the node
         :param report: processing job running report. if False, return result object
         :param report_alone: print job running report. if False, return job running report
+        :param stream: print output lines as they arrive and tee them to a log file under experiment_path, 
+                       instead of holding the output. May also be a NodeStream object
+        :param spool: write output lines to the log file without printing them, instead of holding the output
         :return: string, subprocess.CalledProcessError
         """
+        started=time.time()
+        own_stream=stream is True or (spool and not stream)
+        if own_stream:
+            log_path=os.path.join(self.experiment_path, name, 'command_{:.0f}.log'.format(time.time()))
+            stream=NodeStream(name, log_path, echo=stream is True)
+        stream=stream or None
+        
         #submit job
         logging.debug('exceute "{}" on node {}......'.format(command, name))        
-        res=self.execute('vagrant ssh {} -c "echo -e \\"\x04\\";{}; echo \\"return_code: $?\\""'.format(name, command), result=True)                                       
+        with self._span('run_command', name, command=command):
+            try:
+                if self.vagrant_ssh:
+                    res=await self.execute_async('vagrant ssh {} -c "echo -e \\"\x04\\";{}; echo \\"return_code: $?\\""'.format(name, command), result=True, stream=stream)                                       
+                else:
+                    try:
+                        ssh_command=await self._ssh_command_async(name, 'echo -e "\x04";{}; echo "return_code: $?"'.format(command))
+                        # only retried if the command did not start, so it never runs twice
+                        res=await self._retry_async(name, lambda: self.execute_async(ssh_command, result=True, stream=stream), 
+                                                    lambda x: self._transient(x) and not (stream.started if stream else b'\x04' in (x.output or b'')))
+                    except EnvironmentError as e:
+                        res=e
+            finally:
+                if own_stream:
+                    stream.close()
 
         # processing result
         if not report:
-            return self._parse_run_result(res) if not isinstance(res, Exception) else res
+            if isinstance(res, Exception) and stream is None:
+                return res
+            res=self._parse_run_result(res, stream=stream)
+            res.update({'started':started, 'seconds':time.time() - started})
+            return res
         
         else:
             template='\n'.join(['\n\n========= JOB REPORT =========',
@@ -339,37 +2859,198 @@ class Vagrant(object):
                                 'job_description: {job_type} "{command}"',
                                 'console output:\n{output}\n'])
             report_kwargs={'name':name, 'job_type':'run_command', 'command':command}
-            report=self._parse_run_result(res, template, report_kwargs)
+            report=self._parse_run_result(res, template, report_kwargs, stream)
             
             if report_alone:
                 print(report)                
             else:
-                return report 
+                return report
+
+    def run_command(self, name, command, report=True, report_alone=True, stream=False, spool=False):
+        """
+        blocking version of run_command_async
+        """
+        return self._run_sync(self.run_command_async(name, command, report, report_alone, stream, spool))
 		 
-    def execute(self, command, result=False):
+    def execute(self, command, result=False, timeout=None):
         """
-        TODO: doc
+        run shell command in the workspace
 
-        :param command:
-        :return:
+        :param command: shell command
+        :param result: if True, return the output of command, or the exception if it failed
+        :param timeout: [optional], seconds the command may run before it is killed. A command whose output is 
+                        returned, e.g. `vagrant ssh-config`, is limited to self.timeout by default
+        :return: bytes, Exception
         """
         if self.debug:
             logging.debug(command.strip())
             logging.debug(self.workspace.strip())
             
-        if not result:
-            subprocess.run(command.strip(),
-                           cwd=self.workspace,
-                           check=True,
-                           shell=True)
-        else:
-            try:
-                res = subprocess.check_output(command.strip(),
-                                            cwd=self.workspace,
-                                            shell=True, stderr=subprocess.STDOUT, input=b'\n')
-                return res
-            except Exception as e:
-                return e
+        with self._span('execute', command=command.strip()):
+            if not result:
+                subprocess.run(command.strip(),
+                               cwd=self.workspace,
+                               check=True,
+                               shell=True, 
+                               timeout=timeout)
+            else:
+                try:
+                    with subprocess.Popen(command.strip(), 
+                                          cwd=self.workspace,
+                                          shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, 
+                                          stderr=subprocess.STDOUT, start_new_session=os.name!='nt') as proc:
+                        try:
+                            res, _ = proc.communicate(b'\n', timeout=timeout or self.timeout)
+                        except BaseException:
+                            # on timeout or Ctrl-C, kill the children of the shell too, see _kill
+                            self._kill(proc)
+                            proc.communicate()
+                            raise
+                    if proc.returncode:
+                        raise subprocess.CalledProcessError(proc.returncode, command.strip(), output=res)
+                    return res
+                except Exception as e:
+                    return e
+
+    async def _read_lines(self, reader, callback):
+        """
+        feed the lines read from reader to callback, one at a time. Overlong lines are split, so the buffer 
+        never exceeds 64 KiB
+
+        :param reader: asyncio.StreamReader
+        :param callback: function which takes one line of bytes
+        :return: None
+        """
+        buf=b''
+        while True:
+            chunk=await reader.read(1 << 16)
+            if not chunk:
+                break
+            lines=(buf + chunk).split(b'\n')
+            buf=lines.pop()
+            for line in lines:
+                callback(line)
+            if len(buf) >= 1 << 16:
+                callback(buf)
+                buf=b''
+        if buf:
+            callback(buf)
+
+    async def _copy_limited(self, reader, out, rate_limit):
+        """
+        copy reader into out, no faster than rate_limit allows
+
+        :param reader: asyncio.StreamReader
+        :param out: binary file object
+        :param rate_limit: RateLimit object
+        :return: None
+        """
+        while True:
+            chunk=await reader.read(1 << 16)
+            if not chunk:
+                break
+            await rate_limit.consume(len(chunk))
+            out.write(chunk)
+
+    async def execute_async(self, command, result=False, stdin=None, stdout=None, stream=None, rate_limit=None):
+        """
+        non-blocking version of execute, the command runs as a child process of the event loop
+
+        :param command: shell command
+        :param result: if True, return the output of command, or the exception if it failed
+        :param stdin: [optional], file object fed to the command instead of a newline
+        :param stdout: [optional], file object the standard output is written to. Only the standard error is 
+                       returned then, so binary payloads are never held in memory
+        :param stream: [optional], function called with every output line as soon as it arrives, the output is 
+                       not returned then
+        :param rate_limit: [optional], RateLimit object the standard output written to stdout is throttled by
+        :return: bytes, subprocess.CalledProcessError
+        """
+        if self.debug:
+            logging.debug(command.strip())
+            logging.debug(self.workspace.strip())
+        
+        with self._span('execute', command=command.strip()):
+            if not result:
+                proc=await asyncio.create_subprocess_shell(command.strip(), cwd=self.workspace, 
+                                                           start_new_session=os.name!='nt')
+                try:
+                    await proc.wait()
+                except asyncio.CancelledError:
+                    self._kill(proc)
+                    await proc.wait()
+                    raise
+                if proc.returncode:
+                    raise subprocess.CalledProcessError(proc.returncode, command)
+            else:
+                try:
+                    proc=await asyncio.create_subprocess_shell(command.strip(), 
+                                                               cwd=self.workspace,
+                                                               stdin=stdin if stdin is not None else subprocess.PIPE,
+                                                               stdout=stdout if stdout is not None and rate_limit is None else subprocess.PIPE,
+                                                               stderr=subprocess.PIPE if stdout is not None else subprocess.STDOUT,
+                                                               start_new_session=os.name!='nt')
+                    try:
+                        if stdout is not None and rate_limit is not None:
+                            if stdin is None:
+                                proc.stdin.write(b'\n')
+                                proc.stdin.close()
+                            err, _=await asyncio.gather(proc.stderr.read(), 
+                                                        self._copy_limited(proc.stdout, stdout, rate_limit))
+                            await proc.wait()
+                            res=b''
+                        elif stream is None:
+                            res, err=await proc.communicate(b'\n' if stdin is None else None)
+                        else:
+                            if stdin is None:
+                                proc.stdin.write(b'\n')
+                                proc.stdin.close()
+                            await self._read_lines(proc.stderr if stdout is not None else proc.stdout, stream)
+                            await proc.wait()
+                            res, err=b'', b''
+                    except asyncio.CancelledError:
+                        self._kill(proc)
+                        await proc.wait()
+                        raise
+                    if stdout is not None:
+                        res=err
+                    if proc.returncode:
+                        return subprocess.CalledProcessError(proc.returncode, command, output=res)
+                    return res
+                except Exception as e:
+                    return e
+
+    def _kill(self, proc):
+        """
+        kill a child process of execute or execute_async together with its own children, e.g. the ssh started by 
+        the shell, which would otherwise outlive it and keep its pipes open
+
+        :param proc: subprocess.Popen or asyncio.subprocess.Process, started in a new session
+        :return: None
+        """
+        try:
+            if os.name=='nt':
+                proc.kill()
+            else:
+                os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def _run_sync(self, coro):
+        """
+        run the coroutine to the end in a new event loop, backing the blocking api. If the calling thread already 
+        runs an event loop, e.g. in Jupyter, the new loop runs in a worker thread, and blocks the calling loop until 
+        it is done. Async callers should await the *_async method instead
+
+        :param coro: coroutine object
+        :return: result of coroutine
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+        with futures.ThreadPoolExecutor(max_workers=1) as thread:
+            return thread.submit(asyncio.run, coro).result()
 
     def ssh(self, name):
         """
@@ -380,10 +3061,12 @@ class Vagrant(object):
         """
         self.execute("vagrant ssh " + str(name))    
     
-    def create(self, hosts, image='ubuntu/xenial64', output_path=None, template=None):
+    def create(self, hosts, image='ubuntu/xenial64', output_path=None, template=None, linked_clone=False):
         """
         TODO: doc
 
+        :param linked_clone: write the bulk template, whose machines are linked clones of one imported copy of 
+                             the box and skip the box update check
         :return:                        
         """ 
         # prepare dict
@@ -393,7 +3076,26 @@ class Vagrant(object):
         kwargs.update({'image':image})
         
         # prepare template
-        if not template:
+        if not template and linked_clone:
+            template="""
+            Vagrant.configure("2") do |config|
+              config.vm.box = "{image}"
+              config.vm.box_check_update = false
+              config.vm.provider "virtualbox" do |vb|
+                vb.linked_clone = true
+              end
+              config.vm.provider "vmware_desktop" do |vm|
+                vm.linked_clone = true
+              end
+              config.vm.provider "hyperv" do |hv|
+                hv.linked_clone = true
+              end
+              ([{array}]).each do |name|
+                config.vm.define "#{{name}}"
+              end
+            end
+            """
+        elif not template:
             template="""
             Vagrant.configure("2") do |config|    
               ([{array}]).each do |name|
@@ -409,6 +3111,89 @@ class Vagrant(object):
         with open(output_path, 'w') as out:
             out.write(template.format(**kwargs))
         
+    def _ensure_box(self, image):
+        """
+        add the box to the local box store if it is not there yet, so the machines do not download it each
+
+        :param image: name of the box
+        :return: None
+        """
+        res=self.execute('vagrant box list', result=True)
+        if isinstance(res, Exception):
+            raise res
+        boxes=[x.split()[0] for x in res.decode('utf8', 'replace').splitlines() if x.strip()]
+        if image not in boxes:
+            provider=os.getenv('VAGRANT_DEFAULT_PROVIDER')
+            self.execute('vagrant box add {}{}'.format(image, ' --provider {}'.format(provider) if provider else ''))
+
+    async def provision_async(self, hosts, wave=None):
+        """
+        bring many machines up in waves, so the host is not flooded by machines which boot at the same time. 
+        Providers which support it bring a wave up with one `vagrant up --parallel` call, one wave after the 
+        other. The others get a vagrant process per machine, and a machine starts as soon as one of the at most 
+        wave booting machines is ready
+
+        :param hosts: list of node names
+        :param wave: maximum number of machines booting at the same time, default to self.parallel
+        :return: list of (node name, result dictionary), with the seconds every machine waited for its wave, 
+                 booted, and took from the start of provisioning until it was ready
+        """
+        loop=asyncio.get_running_loop()
+        wave=max(int(wave or self.parallel), 1)
+        start=loop.time()
+        
+        async def up(names):
+            queued=loop.time() - start
+            with self._span('wave', size=len(names)):
+                results=await self._vagrant_call_async('up --parallel' if len(names) > 1 else 'up', names)
+            for name, res in results:
+                res.update({'queued':'{:.1f}'.format(queued), 
+                            'ready':'{:.1f}'.format(queued + float(res['elapsed']))})
+            return results
+        
+        if self._providers(hosts) <= PARALLEL_PROVIDERS:
+            results=[]
+            for i in range(0, len(hosts), wave):
+                results+=await up(hosts[i:i + wave])
+        else:
+            semaphore=asyncio.Semaphore(wave)
+            
+            async def bounded_up(name):
+                async with semaphore:
+                    return await up([name])
+            
+            results=await asyncio.gather(*[bounded_up(name) for name in hosts])
+            results=[x for res in results for x in res]
+        
+        self._invalidate_inventory()
+        self._invalidate_ssh_config()
+        return results
+
+    def provision(self, hosts, image='ubuntu/xenial64', wave=None, output_path=None, template=None):
+        """
+        create and bring up many machines: import the box once, write a Vagrantfile whose machines are linked 
+        clones of it, bring them up in waves (see provision_async) and print the time to ready of every machine
+
+        :param hosts: list of node names
+        :param image: name of the box
+        :param wave: maximum number of machines booting at the same time, default to self.parallel
+        :param output_path: [optional], path of the Vagrantfile, default to the one of the workspace
+        :param template: [optional], Vagrantfile template, see create
+        :return: list of (node name, result dictionary)
+        """
+        with self._span('import_box'):
+            self._ensure_box(image)
+        self.create(hosts, image, output_path, template, linked_clone=True)
+        results=self._run_sync(self.provision_async(hosts, wave))
+        
+        rows=[['node', 'status', 'return_code', 'queued', 'boot', 'ready']]
+        for name, res in sorted(results, key=lambda x: float(x[1]['ready'])):
+            rows.append([name, res['job_status'], str(res['return_code']), res['queued'], res['elapsed'], res['ready']])
+        widths=[max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines=['  '.join(x.ljust(w) for x, w in zip(row, widths)) for row in rows]
+        print('\n'.join(['\n========= PROVISION (seconds) =========', lines[0], '-' * len(lines[0])] + lines[1:]))
+        return results
+
     def start(self, name=None):
         """
         TODO: doc
@@ -420,6 +3205,8 @@ class Vagrant(object):
             # start all
             name = ""
         self.execute("vagrant up " + str(name))
+        self._invalidate_inventory()
+        self._invalidate_ssh_config()
 		
     def stop(self, name=None):
         """
@@ -432,6 +3219,8 @@ class Vagrant(object):
             # start all
             name = ""
         self.execute("vagrant halt " + str(name))
+        self._invalidate_inventory()
+        self._invalidate_ssh_config()
         
     def suspend(self, name=None):
         """
@@ -444,6 +3233,8 @@ class Vagrant(object):
             # start all
             name = ""
         self.execute("vagrant suspend " + str(name))
+        self._invalidate_inventory()
+        self._invalidate_ssh_config()
 
     def destroy(self, name=None, force = False):
         """
@@ -455,19 +3246,169 @@ class Vagrant(object):
         if name is None:
             name = ""
         self.execute("vagrant destroy {}{}".format('-f ' if force else '' ,name))
+        self._invalidate_inventory()
+        self._invalidate_ssh_config()
+
+
+    def _snapshot_command(self, name, action, snapshot=None):
+        """
+        vagrant command of a snapshot action, the snapshot name is only passed if given
+
+        :param name: name of node
+        :param action: save, restore, delete or list
+        :param snapshot: [optional], name of the snapshot
+        :return: str
+        """
+        options={'save':['--force'], 'restore':['--no-provision'], 'delete':[], 'list':[]}[action]
+        return ' '.join(['vagrant', 'snapshot', action] + options + [name] + ([shlex.quote(snapshot)] if snapshot else []))
+
+    async def snapshot_async(self, name, action, snapshot=None):
+        """
+        save, restore or delete a snapshot of the node, or list its snapshots. Saving replaces a snapshot of the 
+        same name. A restored node is running, and its master connection is closed, since the connection does 
+        not survive the restore
+
+        :param name: name of node
+        :param action: save, restore, delete or list
+        :param snapshot: name of the snapshot, required unless action is list
+        :return: dictionary with job_status, return_code and elapsed, plus the list of snapshots if action is list
+        """
+        if action not in ['save', 'restore', 'delete', 'list']:
+            raise ValueError('unknown snapshot action {}, choose from save, restore, delete or list'.format(action))
+        if action!='list' and not snapshot:
+            raise ValueError('snapshot {} needs the name of the snapshot'.format(action))
+        
+        start=time.time()
+        with self._span('snapshot_{}'.format(action), name, snapshot=snapshot):
+            res=await self.execute_async(self._snapshot_command(name, action, snapshot), result=True)
+        if action=='restore':
+            self._invalidate_inventory()
+            self._invalidate_ssh_config()
+            await asyncio.get_running_loop().run_in_executor(None, self.disconnect, name)
+        
+        return_code=res.returncode if isinstance(res, subprocess.CalledProcessError) else 'N.A.' if isinstance(res, Exception) else 0
+        result={'job_status':'Success' if return_code==0 else 'Failed', 
+                'return_code':return_code, 
+                'elapsed':'{:.1f}'.format(time.time() - start)}
+        if return_code!=0:
+            output=res.output if isinstance(res, subprocess.CalledProcessError) else str(res).encode('utf8')
+            logging.error('snapshot {} {} of node {} failed: {}'.format(action, snapshot or '', name, 
+                                                                         (output or b'').decode('utf8', 'replace').strip()))
+        elif action=='list':
+            lines=[x.strip() for x in res.decode('utf8', 'replace').splitlines()]
+            result['snapshots']=[x for x in lines if x and not x.startswith('==>')]
+        return result
+
+    def snapshot(self, name, action, snapshot=None):
+        """
+        blocking version of snapshot_async
+        """
+        return self._run_sync(self.snapshot_async(name, action, snapshot))
+
+    def _providers(self, hosts):
+        """
+        providers of the hosts, read from the .vagrant/machines state folder. Hosts which are not created yet 
+        count as the default provider
+
+        :param hosts: list of node names
+        :return: set of provider names
+        """
+        providers=set()
+        for name in hosts:
+            path=os.path.join(self.workspace, '.vagrant', 'machines', name)
+            found=[x for x in os.listdir(path) if os.path.isdir(os.path.join(path, x))] if os.path.isdir(path) else []
+            providers.update(found or [os.getenv('VAGRANT_DEFAULT_PROVIDER', 'virtualbox')])
+        return providers
+
+    async def _vagrant_call_async(self, command, hosts):
+        """
+        run one vagrant call against hosts, print its output as it arrives and time every host by the last 
+        output line which mentions it
+
+        :param command: vagrant sub command, e.g. 'up --parallel'
+        :param hosts: list of node names
+        :return: list of (node name, result dictionary)
+        """
+        loop=asyncio.get_running_loop()
+        start=loop.time()
+        finish={}
+        
+        def on_line(line):
+            line=line.decode('utf8', 'replace').rstrip()
+            print(line)
+            match=re.match('^==> ([^:\\s]+):', line)
+            if match:
+                finish[match.group(1)]=loop.time()
+        
+        res=await self.execute_async('vagrant {} {}'.format(command, ' '.join(hosts)), result=True, stream=on_line)
+        end=loop.time()
+        return_code=res.returncode if isinstance(res, subprocess.CalledProcessError) else 'N.A.' if isinstance(res, Exception) else 0
+        results=[]
+        for name in hosts:
+            results.append([name, {'job_status':'Success' if return_code==0 else 'Failed', 
+                                   'return_code':return_code, 
+                                   'elapsed':'{:.1f}'.format(finish.get(name, end) - start)}])
+        return results
+
+    async def lifecycle_async(self, action, hosts, parallel=None, force=False):
+        """
+        run a lifecycle action (start, stop, suspend or destroy) on many hosts at the same time. `vagrant up` 
+        is issued as multi-machine calls with --parallel of at most parallel hosts each, one after the other, when 
+        every provider supports it; otherwise every host gets its own vagrant process, at most parallel at a time
 
+        :param action: start, stop, suspend or destroy
+        :param hosts: list of node names
+        :param parallel: maximum number of vagrant processes running at the same time, default to self.parallel
+        :param force: destroy without confirmation, required by a parallel destroy
+        :return: list of (node name, result dictionary)
+        """
+        command={'start':'up', 'stop':'halt', 'suspend':'suspend', 'destroy':'destroy -f'}[action]
+        if action=='destroy' and not force:
+            raise ValueError('parallel destroy can not ask for confirmation, set force')
+        
+        parallel=max(int(parallel or self.parallel), 1)
+        if action=='start' and self._providers(hosts) <= PARALLEL_PROVIDERS:
+            results=[]
+            for i in range(0, len(hosts), parallel):
+                chunk=hosts[i:i + parallel]
+                results+=await self._vagrant_call_async('up --parallel' if len(chunk) > 1 else 'up', chunk)
+        else:
+            semaphore=asyncio.Semaphore(parallel)
+            
+            async def bounded_call(name):
+                async with semaphore:
+                    return await self._vagrant_call_async(command, [name])
+            
+            results=await asyncio.gather(*[bounded_call(name) for name in hosts])
+            results=[x for res in results for x in res]
+        
+        self._invalidate_inventory()
+        self._invalidate_ssh_config()
+        return results
+
+    def lifecycle(self, action, hosts, parallel=None, force=False):
+        """
+        blocking version of lifecycle_async, print a per-host status and timing summary at the end
+        """
+        results=self._run_sync(self.lifecycle_async(action, hosts, parallel, force))
+        print(self._summary_table(results, ('seconds', 'elapsed')))
+        return results
 
-    def ls(self, name=None):
+    def ls(self, name=None, state=None):
         """
         Provides the status information of all Vagrant Virtual machines by default.
         If a name is specified, it provides the status of that particular virtual machine.	  
-        :param name: [optional], name of the Vagrant VM.
+        :param name: [optional], name of the Vagrant VM, or list of them.
+        :param state: [optional], list of machine states, only machines in one of them are listed
         :return:
         """
-        if name is None:
-            # start all
-            name = ""
-        self.execute("vagrant status " + str(name))
+        machines = self.inventory()
+        names = [name] if isinstance(name, str) else name or list(machines)
+        rows = [[x, machines.get(x, {}).get('state', 'unknown'), machines.get(x, {}).get('provider', 'N.A.')] 
+                for x in names if not state or machines.get(x, {}).get('state') in state]
+        width = max([len(x[0]) for x in rows] + [4])
+        for row in [['name', 'state', 'provider']] + rows:
+            print('{:<{width}s}  {:<16s}{}'.format(*row, width=width))
 
     def info(self, name):
         """
@@ -475,13 +3416,20 @@ class Vagrant(object):
 
         :return:
         """
-        self.execute("vagrant status " + name)
+        self.ls(name)
 
-    def download(self, name, source, dest, prefix_dest=False, recursive=False):
+    async def download_async(self, name, source, dest, prefix_dest=False, recursive=False, sync=False, compress=False):
         """
-        TODO: doc
+        download file or folder from the node
 
-        :return:
+        :param name: name of the node
+        :param source: path of file or folder on the node
+        :param dest: local path
+        :param prefix_dest: put the downloaded data under a sub folder named after the node
+        :param recursive: source is a folder
+        :param sync: only transfer files whose content differs from the local copy
+        :param compress: compress data on the wire
+        :return: bytes or exception, or dictionary of transfer statistic if sync
         """        
         if prefix_dest:
             if os.path.isdir(dest):
@@ -494,25 +3442,311 @@ class Vagrant(object):
                     path_split.insert(-1, name)
                     path_split = self._impute_drive_sep(path_split)									
                     dest=os.path.join(*path_split)
-                
+        
+        if sync:
+            with self._span('sync', name, direction='download', source=source):
+                return await self._sync_async(name, 'download', source, dest, compress)
         r=(not os.path.basename(source) or recursive)
-        self._scp(name, 'download', source, dest, r)
+        return await self._scp_async(name, 'download', source, dest, r, compress)
     
-    def upload(self, name, source, dest, recursive=False):
+    async def upload_async(self, name, source, dest, recursive=False, sync=False, compress=False):
         """
-        TODO: doc
+        upload file or folder to the node
 
-        :return:
+        :param name: name of the node
+        :param source: local path of file or folder
+        :param dest: path on the node
+        :param recursive: source is a folder
+        :param sync: only transfer files whose content differs from the copy on the node
+        :param compress: compress data on the wire
+        :return: bytes or exception, or dictionary of transfer statistic if sync
         """                        
+        if sync:
+            with self._span('sync', name, direction='upload', source=source):
+                return await self._sync_async(name, 'upload', source, dest, compress)
         r=(not os.path.basename(source) or recursive)
-        self._scp(name, 'upload', source, dest, r)
+        return await self._scp_async(name, 'upload', source, dest, r, compress)
+
+    def download(self, name, source, dest, prefix_dest=False, recursive=False, sync=False, compress=False):
+        """
+        blocking version of download_async
+        """
+        return self._run_sync(self.download_async(name, source, dest, prefix_dest, recursive, sync, compress))
+
+    def upload(self, name, source, dest, recursive=False, sync=False, compress=False):
+        """
+        blocking version of upload_async
+        """
+        return self._run_sync(self.upload_async(name, source, dest, recursive, sync, compress))
+
+
+class Daemon(object):
+    """
+    long-lived process per workspace which keeps a Vagrant object, with its inventory, ssh setting cache and ssh 
+    master connections, and runs the commands of the CLI clients one at a time. A client passes its standard 
+    streams along with the command over a unix socket, so output, prompts and child processes behave as if the 
+    command ran in the client
+    """
+
+    def __init__(self, provider, idle=3600):
+        """
+        :param provider: Vagrant object
+        :param idle: seconds without any command before the daemon stops. if 0, it never stops by itself
+        """
+        self.provider = provider
+        self.idle = int(idle or 0)
+        self.socket_path = daemon_socket_path(provider.workspace)
+        self.started = time.time()
+        self.requests = 0
+        self.stopped = False
 
+    def serve(self):
+        """
+        accept clients until stopped or idle
+
+        :return: None
+        """
+        if os.path.lexists(self.socket_path):
+            os.remove(self.socket_path)
+        server=socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        server.listen(8)
+        server.settimeout(self.idle or None)
+        with open(self.socket_path + '.pid', 'w') as f:
+            f.write(str(os.getpid()))
+        logging.info('daemon {} serves {} on {}'.format(os.getpid(), self.provider.workspace, self.socket_path))
+        try:
+            while not self.stopped:
+                try:
+                    conn, _=server.accept()
+                except socket.timeout:
+                    logging.info('no command for {} seconds, stop'.format(self.idle))
+                    break
+                except KeyboardInterrupt:
+                    # a late interrupt of a client whose command already finished
+                    continue
+                with conn:
+                    conn.settimeout(None)
+                    if self._peer_uid(conn) not in [None, os.getuid()]:
+                        logging.error('refuse a client of user {}'.format(self._peer_uid(conn)))
+                        continue
+                    self.handle(conn)
+        finally:
+            server.close()
+            for x in [self.socket_path, self.socket_path + '.pid']:
+                if os.path.exists(x):
+                    os.remove(x)
+
+    def _peer_uid(self, conn):
+        """
+        user id of the client process, or None if the system does not tell
+
+        :param conn: connected socket
+        :return: int or None
+        """
+        if not hasattr(socket, 'SO_PEERCRED'):
+            return None
+        creds=conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        return struct.unpack('3i', creds)[1]
+
+    def handle(self, conn):
+        """
+        serve one client
+
+        :param conn: connected socket
+        :return: None
+        """
+        try:
+            msg, fds, _, _=socket.recv_fds(conn, 1 << 16, 3)
+            while not msg.endswith(b'\n'):
+                chunk=conn.recv(1 << 16)
+                if not chunk:
+                    return
+                msg+=chunk
+            request=json.loads(msg.decode('utf8'))
+        except (OSError, ValueError) as e:
+            logging.error('bad request: {}'.format(e))
+            return
+        
+        if request.get('action')=='status':
+            reply={'pid':os.getpid(), 'workspace':self.provider.workspace, 'uptime':time.time() - self.started, 
+                   'requests':self.requests, 'idle':self.idle}
+        elif request.get('action')=='stop':
+            self.stopped=True
+            reply={'exit_code':0}
+        else:
+            self.requests+=1
+            reply={'exit_code':self.run(request, fds)}
+        for fd in fds:
+            os.close(fd)
+        try:
+            conn.sendall(json.dumps(reply).encode('utf8') + b'\n')
+        except OSError:
+            pass
+
+    def run(self, request, fds):
+        """
+        run a command with the standard streams, working directory and environment variables of the client, 
+        e.g. PATH or EHVAGRANT_RESULT_CACHE
+
+        :param request: dictionary with the docopt arguments, working directory and environment of the client
+        :param fds: standard input, output and error of the client
+        :return: int, exit code
+        """
+        saved=[os.dup(x) for x in range(len(fds))]
+        cwd=os.getcwd()
+        environ=dict(os.environ)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            for i, fd in enumerate(fds):
+                os.dup2(fd, i)
+            os.chdir(request['cwd'])
+            os.environ.clear()
+            os.environ.update(request.get('environ', environ))
+            process_arguments(request['arguments'], self.provider)
+            return 0
+        except KeyboardInterrupt:
+            return 130
+        except Exception:
+            traceback.print_exc()
+            return 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            for i, fd in enumerate(saved):
+                os.dup2(fd, i)
+                os.close(fd)
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(environ)
+
+
+def daemon_socket_path(workspace):
+    """
+    unix socket the daemon of the workspace listens on, its pid is kept next to it
+
+    :param workspace: workspace of the vagrant project
+    :return: str
+    """
+    return os.path.join(runtime_path(workspace), 'daemon.sock')
+
+
+def _daemon_request(request, fds=()):
+    """
+    send one request to the daemon of the workspace
+
+    :param request: dictionary
+    :param fds: file descriptors passed along with the request
+    :return: reply dictionary, or None if no daemon is running
+    """
+    if not hasattr(socket, 'send_fds'):
+        return None
+    path=daemon_socket_path(workspace_path())
+    if not os.path.lexists(path):
+        return None
+    # the standard streams go to whoever listens there, so it must be a socket of this user
+    info=os.lstat(path)
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid!=os.getuid():
+        raise PermissionError('{} is not a daemon socket of this user, remove it'.format(path))
+    sock=socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        # stale socket of a daemon which did not exit cleanly
+        sock.close()
+        return None
+    
+    with sock:
+        socket.send_fds(sock, [json.dumps(request).encode('utf8') + b'\n'], list(fds))
+        reply=b''
+        while not reply.endswith(b'\n'):
+            try:
+                chunk=sock.recv(1 << 16)
+            except KeyboardInterrupt:
+                # interrupt the command in the daemon, and wait for it to wind down
+                with open(path + '.pid') as f:
+                    os.kill(int(f.read()), signal.SIGINT)
+                continue
+            if not chunk:
+                break
+            reply+=chunk
+    return json.loads(reply.decode('utf8')) if reply else {'exit_code':1}
+
+
+def start_daemon(idle=3600, debug=False):
+    """
+    start the daemon of the workspace in the background, unless it is running already. It logs to 
+    daemon.log under the cache folder of the workspace
+
+    :param idle: seconds without any command before the daemon stops
+    :param debug: log debug messages
+    :return: None
+    """
+    if not hasattr(os, 'fork') or not hasattr(socket, 'send_fds'):
+        raise EnvironmentError('daemon mode is not supported on this platform')
+    status=_daemon_request({'action':'status'})
+    if status and 'pid' in status:
+        print('daemon {} is already running for {}'.format(status['pid'], status['workspace']))
+        return
+    
+    pid=os.fork()
+    if pid:
+        os.waitpid(pid, 0)
+        for _ in range(100):
+            status=_daemon_request({'action':'status'})
+            if status and 'pid' in status:
+                print('daemon {} started for {}'.format(status['pid'], status['workspace']))
+                return
+            time.sleep(0.1)
+        raise EnvironmentError('daemon did not start, see daemon.log under the workspace')
+    
+    # detach from the terminal of the caller
+    os.setsid()
+    if os.fork():
+        os._exit(0)
+    provider=Vagrant(debug=debug)
+    with open(os.devnull, 'rb') as null, open(os.path.join(provider.cache_path, 'daemon.log'), 'ab') as log:
+        os.dup2(null.fileno(), 0)
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+    sys.stdout.reconfigure(line_buffering=True)
+    # clients forward their interrupts, which must reach the command even if the caller ignored them
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    logging.basicConfig(level=logging.DEBUG if debug else logging.INFO, 
+                        format='%(asctime)s %(levelname)s %(message)s')
+    Daemon(provider, idle).serve()
+    sys.exit(0)
+
+
+def daemon_command(arguments):
+    """
+    start, stop or query the daemon of the workspace
+
+    :param arguments: input arguments for the Vagrant script.
+    :return: None
+    """
+    if arguments.get("start"):
+        start_daemon(arguments.get("--idle") or 3600, arguments.get("--debug"))
+    elif arguments.get("stop"):
+        reply=_daemon_request({'action':'stop'})
+        print('daemon stopped' if reply else 'no daemon is running for {}'.format(workspace_path()))
+    elif arguments.get("status"):
+        status=_daemon_request({'action':'status'})
+        if status and 'pid' in status:
+            print('daemon {pid} serves {workspace}, up {uptime:.0f} seconds, {requests} commands, '
+                  'stops after {idle} idle seconds'.format(**status))
+        else:
+            print('no daemon is running for {}'.format(workspace_path()))
 
-def process_arguments(arguments):
+
+def process_arguments(arguments, provider=None):
     """
     TODO: doc
 
     :param arguments: input arguments for the Vagrant script.
+    :param provider: [optional], long-lived Vagrant object of the daemon. if None, a new one is built
     :return:
     """
     debug = arguments["--debug"]
@@ -520,8 +3754,30 @@ def process_arguments(arguments):
         logging.basicConfig(level=logging.DEBUG)        
     else:
         logging.basicConfig(level=logging.INFO)
+    logging.getLogger().setLevel(logging.DEBUG if debug else logging.INFO)
         
-    provider = Vagrant(debug=debug)
+    if provider is None:
+        provider = Vagrant(debug=debug, 
+                           vagrant_ssh=arguments.get("--vagrant-ssh"), 
+                           persist=arguments.get("--persist") or 0,
+                           parallel=arguments.get("--parallel") or DEFAULT_PARALLEL,
+                           min_parallel=arguments.get("--min-parallel"),
+                           trace=bool(arguments.get("--trace")),
+                           timeout=arguments.get("--timeout"),
+                           connect_timeout=arguments.get("--connect-timeout") or 10,
+                           retries=arguments.get("--retries") or 2)
+    else:
+        # the daemon keeps its caches and connections, only the options of this call change
+        provider.debug = debug
+        provider.vagrant_ssh = arguments.get("--vagrant-ssh")
+        provider.parallel = int(arguments.get("--parallel") or DEFAULT_PARALLEL)
+        provider.min_parallel = int(arguments["--min-parallel"]) if arguments.get("--min-parallel") else None
+        provider.tracer = Tracer() if arguments.get("--trace") else None
+        provider.timeout = float(arguments["--timeout"]) if arguments.get("--timeout") else None
+        provider.connect_timeout = int(arguments.get("--connect-timeout") or 10)
+        provider.retries = int(arguments.get("--retries") or 2)
+        provider.incidents.clear()
+        provider._invalidate_ssh_config()
 
     # parse argument
     hosts = []
@@ -530,7 +3786,10 @@ def process_arguments(arguments):
     args= []
     if arguments.get("create"):
         action = provider.create
-        kwargs=provider._update_by_key(kwargs, arguments, ['--image','--template'], {'--output':'output_path'})
+        kwargs=provider._update_by_key(kwargs, arguments, ['--image','--template'], {'--box':'image', '--output':'output_path'})
+    elif arguments.get("provision"):
+        action = provider.provision
+        kwargs=provider._update_by_key(kwargs, arguments, ['--wave','--template'], {'--box':'image', '--output':'output_path'})
     elif arguments.get("start") or arguments.get("resume"):
         action = provider.start
     elif arguments.get("stop"):
@@ -542,6 +3801,22 @@ def process_arguments(arguments):
         kwargs=provider._update_by_key(kwargs, arguments, [], {'-f':'force'})
     elif arguments.get("ls"):
         action = provider.ls
+    elif arguments.get("disconnect"):
+        action = provider.disconnect
+    elif arguments.get("runs"):
+        action = provider.runs
+        kwargs = provider._update_by_key(kwargs, arguments, ['--status', '--script', '--since', '--until', '--limit'])
+        if arguments.get("--vms"):
+            kwargs['nodes'] = hostlist.expand_hostlist(arguments["--vms"])
+    elif arguments.get("workspace") and arguments.get("add"):
+        action = provider.add_workspace
+        args += [arguments.get("NAME"), arguments.get("PATH")]
+        kwargs = provider._update_by_key(kwargs, arguments, ['--budget'])
+    elif arguments.get("workspace") and arguments.get("remove"):
+        action = provider.remove_workspace
+        args.append(arguments.get("NAME"))
+    elif arguments.get("workspace") and arguments.get("list"):
+        action = provider.list_workspaces
     elif arguments.get("info"):
         action = provider.info
         args.append(arguments.get("NAME"))
@@ -549,12 +3824,12 @@ def process_arguments(arguments):
         action = provider.download
         args.append(arguments.get("--from"))
         args.append(arguments.get("--to"))
-        kwargs = provider._update_by_key(kwargs, arguments, key_dict={'-r':'recursive'})
+        kwargs = provider._update_by_key(kwargs, arguments, ['--sync', '--compress'], {'-r':'recursive'})
     elif arguments.get("upload"):
         action = provider.upload
         args.append(arguments.get("--from"))
         args.append(arguments.get("--to"))
-        kwargs = provider._update_by_key(kwargs, arguments, key_dict={'-r':'recursive'})
+        kwargs = provider._update_by_key(kwargs, arguments, ['--sync', '--compress'], {'-r':'recursive'})
     elif arguments.get("ssh"):
         action = provider.ssh
         args.append(arguments.get("NAME"))
@@ -564,7 +3839,32 @@ def process_arguments(arguments):
     elif arguments.get("run") and arguments.get("script"):
         action = provider.run_script
         args.append(arguments.get("SCRIPT"))
-        kwargs = provider._update_by_key(kwargs, arguments,['--data'])
+        kwargs = provider._update_by_key(kwargs, arguments,['--data', '--pipeline'], {'--data-cache':'data_cache', 
+                                                                                     '--reset-to':'reset_to'})
+    elif arguments.get("run") and arguments.get("batch"):
+        action = provider.run_batch
+        args.append(provider.load_jobs(arguments.get("JOBS")))
+        kwargs = provider._update_by_key(kwargs, arguments, ['--pipeline', '--speculate'], {'--data-cache':'data_cache', 
+                                                                                           '--format':'output_format'})
+    elif arguments.get("cache") and arguments.get("gc") and arguments.get("--local"):
+        action = provider.result_cache_gc
+        kwargs = provider._update_by_key(kwargs, arguments, [], {'--max-size':'max_size', '--max-age':'max_age'})
+    elif arguments.get("collect"):
+        action = provider.collect
+        kwargs['runs'] = arguments["--runs"].split(',') if arguments.get("--runs") else None
+        kwargs['dest'] = arguments.get("--to")
+        if arguments.get("--bandwidth"):
+            kwargs['rate_limit'] = RateLimit(provider._parse_size(arguments["--bandwidth"]))
+    elif arguments.get("snapshot"):
+        action = provider.snapshot
+        args.append([x for x in ['save', 'restore', 'delete', 'list'] if arguments.get(x)][0])
+        args.append(arguments.get("SNAPSHOT"))
+    elif arguments.get("cache") and arguments.get("gc"):
+        action = provider.cache_gc
+        kwargs = provider._update_by_key(kwargs, arguments, [], {'--max-size':'max_size', '--max-age':'max_age'})
+    if action in [provider.run_script, provider.run_batch]:
+        if (arguments.get("--result-cache") or os.getenv('EHVAGRANT_RESULT_CACHE')=='1') and not arguments.get("--no-cache"):
+            kwargs['result_cache'] = True
                     
     # do the action
     if action is not None:
@@ -572,11 +3872,25 @@ def process_arguments(arguments):
         action_type = action.__name__   
         
         # aciton that has immediately execute       
-        if action_type in ['ssh','info']:
+        if action_type in ['ssh','info','result_cache_gc','add_workspace','remove_workspace','list_workspaces']:
             action(*args, **kwargs)
             return             
         
-        # parse vms_hosts 
+        if arguments.get("--format") not in [None, 'text', 'jsonl']:
+            raise ValueError('unknown format {}, choose from text or jsonl'.format(arguments.get("--format")))
+        
+        if action_type in ['runs']:
+            # the run index is local, no host is involved
+            records = action(*args, **kwargs)
+            if arguments["--format"]=='jsonl':
+                for record in records:
+                    print(json.dumps(record))
+            else:
+                print(provider._runs_table(records))
+            return
+        
+        # parse vms_hosts and states
+        states = arguments.get("--state").split(',') if arguments.get("--state") else []
         if arguments.get("--vms"):
             vms_hosts = arguments.get("--vms")
             vms_hosts = hostlist.expand_hostlist(vms_hosts)
@@ -584,26 +3898,73 @@ def process_arguments(arguments):
             vms_hosts=[]
 
         #action with vms_host
-        if action_type in ['create']:
+        if action_type in ['create','provision']:
             args.append(vms_hosts)
             action(*args, **kwargs)
             return                         
-        elif action_type in ['start','stop','suspend','destroy','ls'] and not vms_hosts:
+        elif action_type in ['ls']:
+            action(vms_hosts or None, states)
+            return
+        elif action_type in ['start','stop','suspend','destroy'] and not vms_hosts:
             action(*args, **kwargs)
             return
+        elif action_type in ['disconnect']:
+            # close persisted connections of the given hosts, or of every host with a cached ssh setting
+            provider.connected.update(vms_hosts or provider._cached_host_names())
+            provider.disconnect()
+            return
         
         # impute hosts
-        if not vms_hosts:
-            hosts = provider._get_host_names()
+        shards = None
+        if arguments.get("--workspaces"):
+            shards = provider.shards(arguments["--workspaces"].split(','))
+            hosts = shards.hosts(vms_hosts, states)
+            if not hosts:
+                raise EnvironmentError('There is no host in the workspaces {}'.format(', '.join(shards.providers)))
+        elif not vms_hosts:
+            hosts = provider._get_host_names(states)
             if not hosts:
                 raise EnvironmentError('There is no host exists in the current vagrant project')
         else:
-            hosts = vms_hosts                                            
+            hosts = provider._filter_hosts(vms_hosts, states) if states else vms_hosts
+            if not hosts:
+                raise EnvironmentError('None of the given hosts is in state {}'.format(','.join(states)))
 
         # action work with host                    
-        if action_type in ['start','stop','suspend','destroy','ls']:
-            for node_name in hosts:
-                action(node_name, *args, **kwargs)                
+        if shards is not None:
+            shards.run(hosts, action_type, args, kwargs, arguments.get("--format") or 'text', arguments.get("--stream"))
+            provider.incidents.update(shards.incidents())
+        elif action_type in ['run_batch']:
+            action(hosts, *args, **kwargs)
+        elif action_type in ['snapshot']:
+            results = list(provider.iter_parallel(hosts, action, args, kwargs))
+            if args[0]=='list':
+                results = [(node_name, dict(res, snapshots=','.join(res['snapshots'])) if isinstance(res, dict) and 'snapshots' in res else res) 
+                           for node_name, res in results]
+            print(provider._summary_table(results, ('snapshots', 'snapshots') if args[0]=='list' else ('seconds', 'elapsed')))
+        elif action_type in ['collect']:
+            # a single event loop for every host, so they share the bandwidth budget
+            stats = [result.value for result in provider.map(hosts, action, *args, **kwargs) if result.ok]
+            print('collected {} files of {} hosts, {} bytes transferred for {} bytes, {} bytes already there'.format(
+                sum(x['transferred_files'] for x in stats), len(stats), sum(x['transferred_bytes'] for x in stats),
+                sum(x['output_bytes'] for x in stats), sum(x['saved_bytes'] for x in stats)))
+        elif action_type in ['start','stop','suspend','destroy']:
+            if action_type=='destroy' and not kwargs.get('force'):
+                # every host asks for its own confirmation
+                for node_name in hosts:
+                    action(node_name, *args, **kwargs)                
+            else:
+                provider.lifecycle(action_type, hosts, force=kwargs.get('force', False))
+        elif action_type in ['run_command','run_script'] and arguments.get("--format")=='jsonl':
+            # output is spooled to log files, a record is written as soon as a host finishes
+            for result in provider.map(hosts, action, *args, spool=True, **kwargs):
+                print(json.dumps(result.to_dict()), flush=True)
+        elif action_type in ['run_command','run_script'] and arguments.get("--stream"):
+            # output is printed line by line while the jobs run, a summary table follows
+            results = [(result.node, {'job_status':result.status, 'log_path':result.output_path,
+                                      'return_code':'N.A.' if result.return_code is None else result.return_code}) 
+                       for result in provider.map(hosts, action, *args, stream=True, **kwargs)]
+            print(provider._summary_table(results))
         else:
             # impute argument according to number of host
             if len(hosts)>1:
@@ -621,7 +3982,22 @@ def process_arguments(arguments):
                 if action_type in ['download']:
                     kwargs.update({'prefix_dest':False})                        
                 
-                action(hosts[0], *args, **kwargs)                   
+                if provider.timeout:
+                    # the job is cancelled like in a parallel run
+                    provider.run_parallel(hosts, action, args, kwargs)
+                else:
+                    action(hosts[0], *args, **kwargs)                   
+
+        if kwargs.get('result_cache'):
+            provider.result_cache_gc(RESULT_CACHE_MAX_SIZE, RESULT_CACHE_MAX_AGE)
+
+        # report the nodes which timed out, were retried or replaced, and export the timed phases of the run
+        report_file = sys.stderr if arguments.get("--format")=='jsonl' else sys.stdout
+        if provider.incidents:
+            print(provider._incident_report(), file=report_file)
+        if provider.tracer is not None:
+            provider.tracer.export(arguments["--trace"])
+            print(provider.tracer.summary(), file=report_file)
                    
 #%%
 def main():
@@ -631,6 +4007,19 @@ def main():
     :return:
     """
     arguments = docopt(__doc__, version='Vagrant Manager 1.0')
+    # turn SIGTERM into a normal exit, so the ssh master connections still get closed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    if arguments.get("daemon"):
+        daemon_command(arguments)
+        return
+    
+    # hand the command over to the daemon of the workspace if there is one, interactive ssh stays local
+    if not arguments.get("ssh"):
+        sys.stdout.flush()
+        reply = _daemon_request({'action':'run', 'arguments':arguments, 'cwd':os.getcwd(), 'environ':dict(os.environ)}, 
+                                [0, 1, 2])
+        if reply is not None:
+            sys.exit(reply.get('exit_code', 1))
     process_arguments(arguments)
 
 
@@ -0,0 +1,68 @@
+"""
+shared fixtures: a temporary vagrant project backed by the fake vagrant, ssh and scp executables of
+benchmarks/stubs, so the tests run without any virtual machine
+"""
+import os
+import pytest
+from ehvagrant.ehvagrant import Vagrant
+
+STUB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'stubs')
+
+
+class FakeProject(object):
+    """
+    workspace and fake machine state of one test
+    """
+
+    def __init__(self, root, names):
+        self.root = str(root)
+        self.fake_root = os.path.join(self.root, 'fake')
+        self.workspace = os.path.join(self.root, 'workspace')
+        self.names = names
+        os.makedirs(self.fake_root)
+        os.makedirs(self.workspace)
+        self.set_nodes([(name, 'running') for name in names])
+        open(os.path.join(self.fake_root, 'private_key'), 'w').close()
+
+    def set_nodes(self, nodes):
+        with open(os.path.join(self.fake_root, 'nodes'), 'w') as f:
+            for name, state in nodes:
+                f.write('{} {}\n'.format(name, state))
+
+    def calls(self, prefix=''):
+        """
+        stub calls made so far which start with prefix, e.g. 'vagrant status'
+        """
+        path = os.path.join(self.fake_root, 'calls.log')
+        if not os.path.isfile(path):
+            return []
+        with open(path) as f:
+            return [x.strip() for x in f if x.startswith(prefix)]
+
+    def guest(self, name, *path):
+        return os.path.join(self.fake_root, 'guests', name, *path)
+
+
+@pytest.fixture
+def fake(tmp_path, monkeypatch):
+    """
+    FakeProject with three running nodes, node1 to node3, and the environment pointing at it
+    """
+    project = FakeProject(tmp_path, ['node1', 'node2', 'node3'])
+    monkeypatch.setenv('PATH', STUB_PATH + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('EHVAGRANT_HOME', project.workspace)
+    monkeypatch.setenv('EHV_FAKE_ROOT', project.fake_root)
+    monkeypatch.delenv('EHVAGRANT_RESULT_CACHE', raising=False)
+    monkeypatch.delenv('VAGRANT_DEFAULT_PROVIDER', raising=False)
+    for name in ['EHV_FAKE_VAGRANT_STARTUP', 'EHV_FAKE_SSH_LATENCY', 'EHV_FAKE_SSH_HANDSHAKE', 'EHV_FAKE_BANDWIDTH',
+                 'EHV_FAKE_FAILURE_RATE', 'EHV_FAKE_HANG_NODES']:
+        monkeypatch.delenv(name, raising=False)
+    return project
+
+
+@pytest.fixture
+def provider(fake):
+    """
+    Vagrant object of the fake project, without ssh connection multiplexing
+    """
+    return Vagrant(multiplex=False)
@@ -0,0 +1,90 @@
+import asyncio
+from ehvagrant.ehvagrant import AdaptiveLimit, host_load
+
+
+class Machine(object):
+    """
+    probe of a simulated machine with 4 cpus, every running job keeps one of them busy
+    """
+
+    def __init__(self):
+        self.limit = None
+        self.extra = 0
+
+    def __call__(self):
+        return {'cpus': 4, 'runnable': (self.limit.active if self.limit else 0) + self.extra}
+
+
+def run_jobs(limit, machine, count, seconds=0.05):
+    peak = []
+
+    async def job():
+        async with limit:
+            peak.append(limit.active)
+            assert limit.active <= max(x[1] for x in limit.history)
+            await asyncio.sleep(seconds)
+
+    async def start():
+        await asyncio.gather(*[job() for _ in range(count)])
+
+    machine.limit = limit
+    asyncio.run(start())
+    return max(peak)
+
+
+def test_limit_grows_to_maximum_while_the_machine_has_capacity():
+    machine = Machine()
+    limit = AdaptiveLimit(1, 4, interval=0.01, probe=machine)
+    assert limit.limit == 1
+    assert run_jobs(limit, machine, 40) == 4
+    assert limit.limit == 4
+    assert limit.active == 0
+
+
+def test_limit_backs_off_under_load_and_stays_within_bounds():
+    machine = Machine()
+    limit = AdaptiveLimit(2, 64, interval=0.01, probe=machine)
+    run_jobs(limit, machine, 200, seconds=0.03)
+    # more than 1.5 runnable tasks per cpu is an overload, so the limit swings around 6
+    assert any(reasons for _, _, reasons in limit.history)
+    assert all(2 <= x[1] <= 64 for x in limit.history)
+    assert max(x[1] for x in limit.history) < 16
+
+
+def test_limit_never_goes_below_minimum():
+    machine = Machine()
+    machine.extra = 100
+    limit = AdaptiveLimit(3, 8, interval=0.01, probe=machine)
+    assert run_jobs(limit, machine, 20) == 3
+    assert limit.limit == 3
+
+
+def test_stall_pressure_is_an_overload():
+    samples = iter([{'cpus': 4, 'io_stall': 0}, {'cpus': 4, 'io_stall': 900000}])
+    limit = AdaptiveLimit(1, 8, interval=0, probe=lambda: next(samples))
+    limit.limit = 8
+    limit._adjust()
+    assert limit.limit == 4
+    assert limit.history[-1][2] == ['io pressure']
+
+
+def test_cancelled_waiter_releases_its_slot():
+    async def start():
+        limit = AdaptiveLimit(1, 1, probe=lambda: {'cpus': 1})
+        await limit.acquire()
+        waiter = asyncio.ensure_future(limit.acquire())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limit.release()
+        assert limit.active == 0 and not limit.waiters
+        await asyncio.wait_for(limit.acquire(), 1)
+
+    asyncio.run(start())
+
+
+def test_host_load_reads_proc():
+    load = host_load()
+    assert load['cpus'] >= 1
+    if 'memory' in load:
+        assert 0 <= load['memory'] <= 1
@@ -0,0 +1,22 @@
+import asyncio
+
+
+def test_blocking_call_inside_a_running_loop(fake, provider):
+    async def caller():
+        return provider.run_command('node1', 'echo hi', report=False)
+
+    assert asyncio.run(caller())['output'] == 'hi'
+
+
+def test_map_inside_a_running_loop(fake, provider):
+    async def caller():
+        return sorted(x.node for x in provider.map(fake.names, 'run_command', 'echo hi') if x.ok)
+
+    assert asyncio.run(caller()) == fake.names
+
+
+def test_async_variant_shares_the_caller_loop(fake, provider):
+    async def caller():
+        return await asyncio.gather(*[provider.run_command_async(x, 'echo hi', report=False) for x in fake.names])
+
+    assert [x['output'] for x in asyncio.run(caller())] == ['hi'] * 3
@@ -0,0 +1,46 @@
+import os
+import sys
+import subprocess
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cli(*args):
+    """
+    run the ehvagrant command line, return its exit code and output
+    """
+    res = subprocess.run([sys.executable, '-m', 'ehvagrant.ehvagrant'] + list(args), stdout=subprocess.PIPE, 
+                         stderr=subprocess.STDOUT, universal_newlines=True, timeout=60)
+    return res.returncode, res.stdout
+
+
+@pytest.fixture
+def daemon(fake, monkeypatch):
+    monkeypatch.setenv('PYTHONPATH', REPO)
+    code, out = cli('daemon', 'start', '--idle=60')
+    assert code == 0 and 'started' in out
+    yield
+    cli('daemon', 'stop')
+
+
+def test_commands_run_in_the_daemon(fake, daemon, monkeypatch):
+    monkeypatch.setenv('EHV_TEST_MARK', 'from-client')
+    code, out = cli('run', 'command', 'echo $EHV_TEST_MARK', '--vms=node1')
+    assert code == 0 and 'console output:\nfrom-client' in out
+    code, out = cli('daemon', 'status')
+    assert '1 commands' in out
+
+
+def test_daemon_follows_recreated_machines(fake, daemon):
+    code, out = cli('run', 'command', 'basename $HOME', '--vms=node1')
+    assert 'console output:\nnode1' in out
+
+    # node1 is recreated and gets another forwarded port
+    fake.set_nodes([('node3', 'running'), ('node2', 'running'), ('node1', 'running')])
+    machine = os.path.join(fake.workspace, '.vagrant', 'machines', 'node1', 'virtualbox')
+    os.makedirs(machine)
+    with open(os.path.join(machine, 'id'), 'w') as f:
+        f.write('2')
+    code, out = cli('run', 'command', 'basename $HOME', '--vms=node1')
+    assert 'console output:\nnode1' in out
@@ -0,0 +1,37 @@
+import os
+import time
+from ehvagrant.ehvagrant import Vagrant
+
+
+def test_inventory_is_cached_within_ttl(fake):
+    provider = Vagrant(multiplex=False, inventory_ttl=60)
+    assert provider._get_host_names() == fake.names
+    assert provider._get_host_names() == fake.names
+    assert len(fake.calls('vagrant status')) == 1
+
+
+def test_inventory_is_refreshed_after_ttl(fake):
+    provider = Vagrant(multiplex=False, inventory_ttl=0.05)
+    provider.inventory()
+    time.sleep(0.1)
+    provider.inventory()
+    assert len(fake.calls('vagrant status')) == 2
+
+
+def test_inventory_is_refreshed_when_the_state_folder_changes(fake):
+    provider = Vagrant(multiplex=False, inventory_ttl=60)
+    provider.inventory()
+    fake.set_nodes([('node1', 'running'), ('node2', 'poweroff'), ('node3', 'running')])
+    machine = os.path.join(fake.workspace, '.vagrant', 'machines', 'node2', 'virtualbox')
+    os.makedirs(machine)
+    with open(os.path.join(machine, 'action_halt'), 'w') as f:
+        f.write('1')
+    assert provider.inventory()['node2']['state'] == 'poweroff'
+    assert len(fake.calls('vagrant status')) == 2
+
+
+def test_state_filter(fake):
+    fake.set_nodes([('node1', 'running'), ('node2', 'poweroff'), ('node3', 'running')])
+    provider = Vagrant(multiplex=False)
+    assert provider._get_host_names(['running']) == ['node1', 'node3']
+    assert provider._filter_hosts(['node2', 'node3'], ['poweroff']) == ['node2']
@@ -0,0 +1,59 @@
+import time
+import pytest
+from ehvagrant.ehvagrant import Result
+
+
+def test_map_is_lazy(fake, provider):
+    results = provider.map(fake.names, 'run_command', 'echo hi')
+    assert fake.calls('ssh') == []
+    assert sorted(x.node for x in results) == fake.names
+    assert len(fake.calls('ssh')) == 3
+
+
+def test_map_yields_result_records(fake, provider):
+    results = list(provider.map(fake.names, provider.run_command, 'echo hi'))
+    assert all(isinstance(x, Result) for x in results)
+    for result in results:
+        assert result.ok and result.job == 'run_command'
+        assert result.return_code == 0 and result.output == 'hi'
+        assert result.seconds >= 0 and result.error is None
+        record = result.to_dict()
+        assert list(record)[:4] == ['node', 'job', 'status', 'return_code']
+        assert record['output'] == 'hi' and 'error' not in record
+
+
+def test_map_yields_in_completion_order(fake, provider):
+    # remote commands of the fake machines run in their home folder, guests/{name}
+    command = 'case $(pwd) in */node1) sleep 1;; esac; echo done'
+    nodes = [x.node for x in provider.map(fake.names, 'run_command', command)]
+    assert nodes[-1] == 'node1'
+
+
+def test_map_cancels_the_running_jobs_when_closed(fake, provider):
+    start = time.time()
+    results = provider.map(fake.names, 'run_command', 'sleep 0.2; echo early', parallel=1)
+    first = next(results)
+    results.close()
+    assert first.ok
+    assert time.time() - start < 1
+    assert len(fake.calls('ssh')) <= 2
+
+
+def test_map_reports_failures_as_records(fake, provider):
+    result = next(provider.map(['missing'], 'run_command', 'true'))
+    assert result.status == 'Failed' and not result.ok
+    assert isinstance(result.error, Exception) and result.return_code is None
+
+
+def test_map_keeps_the_value_of_other_actions(fake, provider, tmp_path):
+    source = tmp_path / 'f.txt'
+    source.write_text('x')
+    results = list(provider.map(fake.names, 'upload', str(source), 'f.txt', sync=True))
+    assert all(x.ok and x.value['transferred_files'] == 1 for x in results)
+
+
+def test_result_has_slots():
+    result = Result('node1', 'upload', 'Success')
+    with pytest.raises(AttributeError):
+        result.extra = 1
+    assert result.to_dict() == {'node': 'node1', 'job': 'upload', 'status': 'Success', 'return_code': None}
@@ -0,0 +1,44 @@
+import os
+import pytest
+
+
+@pytest.fixture
+def script(tmp_path):
+    path = tmp_path / 'sweep.sh'
+    path.write_text('mkdir -p $1/output\necho "$2" > $1/output/result.txt\necho "run $2"\n')
+    return path
+
+
+def test_same_job_is_served_from_the_cache(fake, provider, script):
+    first = provider.run_script('node1', str(script), report=False, args='1', result_cache=True)
+    calls = len(fake.calls())
+    second = provider.run_script('node1', str(script), report=False, args='1', result_cache=True)
+    assert not first.get('cached') and second['cached']
+    assert len(fake.calls()) == calls
+    assert second['job_status'] == 'Success' and second['output'] == first['output']
+    with open(os.path.join(second['local_output_folder'], 'result.txt')) as f:
+        assert f.read().strip() == '1'
+
+
+def test_other_arguments_or_script_run_again(fake, provider, script):
+    provider.run_script('node1', str(script), report=False, args='1', result_cache=True)
+    assert not provider.run_script('node1', str(script), report=False, args='2', result_cache=True).get('cached')
+    script.write_text(script.read_text() + 'true\n')
+    assert not provider.run_script('node1', str(script), report=False, args='1', result_cache=True).get('cached')
+
+
+def test_unsuccessful_runs_are_not_cached(fake, provider, tmp_path):
+    script = tmp_path / 'fail.sh'
+    script.write_text('echo no; (exit 3)\n')
+    for _ in range(2):
+        res = provider.run_script('node1', str(script), report=False, result_cache=True)
+        assert res['job_status'] == 'Finished' and not res.get('cached')
+
+
+def test_gc_evicts_entries_over_the_size_limit(fake, provider, script):
+    for arg in ['1', '2']:
+        provider.run_script('node1', str(script), report=False, args=arg, result_cache=True)
+    assert provider.result_cache_gc(max_size='1G')['kept'] == 2
+    stats = provider.result_cache_gc(max_size=0)
+    assert stats['removed'] == 2 and stats['kept'] == 0
+    assert not provider.run_script('node1', str(script), report=False, args='1', result_cache=True).get('cached')
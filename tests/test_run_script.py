@@ -0,0 +1,31 @@
+import os
+import pytest
+from ehvagrant import ehvagrant
+from ehvagrant.ehvagrant import Vagrant
+
+
+@pytest.fixture
+def script(tmp_path):
+    path = tmp_path / 'job.sh'
+    path.write_text('mkdir -p $1/output\necho "$2" > $1/output/result.txt\necho done\n')
+    return str(path)
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_script_runs_and_its_output_is_downloaded(fake, script, pipeline):
+    provider = Vagrant(multiplex=False)
+    res = provider.run_script('node1', script, report=False, pipeline=pipeline, args='42')
+    assert res['job_status'] == 'Success' and 'done' in res['output']
+    with open(os.path.join(res['local_output_folder'], 'result.txt')) as f:
+        assert f.read().strip() == '42'
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_unreachable_node_is_reported_as_failed(fake, script, pipeline, monkeypatch):
+    monkeypatch.setattr(ehvagrant, 'RETRY_BACKOFF', 0.01)
+    provider = Vagrant(multiplex=False)
+    provider._get_ssh_config('node1')
+    monkeypatch.setenv('EHV_FAKE_FAILURE_RATE', '1')
+    res = provider.run_script('node1', script, report=False, pipeline=pipeline)
+    assert res['job_status'] == 'Failed' and res['return_code'] == 'N.A.'
+    assert res['local_output_folder'] is None
@@ -0,0 +1,45 @@
+import time
+import pytest
+
+
+@pytest.fixture
+def indexed(fake, provider, tmp_path):
+    """
+    run index with a successful sweep.sh run on node1 and node2, and a failing check.sh run on node3
+    """
+    sweep = tmp_path / 'sweep.sh'
+    sweep.write_text('mkdir -p $1/output\necho "$2" > $1/output/result.txt\n')
+    check = tmp_path / 'check.sh'
+    check.write_text('(exit 2)\n')
+    provider.run_script('node1', str(sweep), report=False, args='1')
+    provider.run_script('node2', str(sweep), report=False, args='2')
+    provider.run_script('node3', str(check), report=False)
+    return provider
+
+
+def test_runs_are_indexed_newest_first(indexed):
+    runs = indexed.runs()
+    assert [x['node'] for x in runs] == ['node3', 'node2', 'node1']
+    assert [x['status'] for x in runs] == ['Finished', 'Success', 'Success']
+    assert runs[0]['return_code'] == 2 and runs[0]['local_output_folder'] is None
+    assert runs[1]['args'] == '2' and runs[1]['output_files'] == 1
+    assert runs[1]['local_output_folder'].endswith('/output/')
+
+
+def test_runs_are_filtered(indexed):
+    assert [x['node'] for x in indexed.runs(status='Success')] == ['node2', 'node1']
+    assert [x['node'] for x in indexed.runs(script='sw*.sh', nodes=['node1'])] == ['node1']
+    assert len(indexed.runs(limit=2)) == 2
+    assert len(indexed.runs(since='1h')) == 3
+    assert indexed.runs(until=time.time() - 3600) == []
+
+
+def test_runs_table(indexed):
+    table = indexed._runs_table(indexed.runs())
+    assert table.splitlines()[-1] == '3 runs'
+    assert 'check.sh' in table and 'N.A.' in table
+
+
+def test_bad_time_is_refused(provider):
+    with pytest.raises(ValueError):
+        provider.runs(since='yesterday')
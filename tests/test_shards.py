@@ -0,0 +1,67 @@
+import os
+import json
+import pytest
+from ehvagrant.ehvagrant import Vagrant
+
+
+@pytest.fixture
+def shards(fake):
+    """
+    workspaces a and b, both backed by the machines of the fake project
+    """
+    other = os.path.join(fake.root, 'other')
+    Vagrant(multiplex=False, workspace=other)
+    provider = Vagrant(multiplex=False)
+    provider.add_workspace('a', fake.workspace)
+    provider.add_workspace('b', other, budget=1)
+    return provider.shards(['all'])
+
+
+def test_workspace_names_are_checked(fake):
+    provider = Vagrant(multiplex=False)
+    with pytest.raises(ValueError):
+        provider.add_workspace('a:b', fake.workspace)
+    with pytest.raises(ValueError):
+        provider.shards(['missing'])
+
+
+def test_hosts_interleave_workspaces(shards):
+    assert shards.hosts()[:4] == [('a', 'node1'), ('b', 'node1'), ('a', 'node2'), ('b', 'node2')]
+    assert shards.budgets == {'a': None, 'b': 1}
+
+
+def test_hosts_pick_qualified_and_plain_names(shards):
+    assert shards.hosts(['a:node2', 'node3']) == [('a', 'node2'), ('b', 'node3'), ('a', 'node3')]
+
+
+def test_download_to_a_file_creates_workspace_and_node_folders(fake, shards, tmp_path):
+    os.makedirs(fake.guest('node1'))
+    with open(fake.guest('node1', 'f.txt'), 'w') as f:
+        f.write('x')
+    dest = str(tmp_path / 'dl' / 'a.txt')
+    results = shards.run([('a', 'node1'), ('b', 'node1')], 'download', ['f.txt', dest], {})
+    assert sorted(x.status for x in results) == ['Success', 'Success']
+    for ws in ['a', 'b']:
+        assert os.path.isfile(str(tmp_path / 'dl' / ws / 'node1' / 'a.txt'))
+
+
+def test_download_to_a_folder_goes_under_workspace_and_node(fake, shards, tmp_path):
+    os.makedirs(fake.guest('node2'))
+    with open(fake.guest('node2', 'f.txt'), 'w') as f:
+        f.write('x')
+    os.makedirs(str(tmp_path / 'dl'))
+    shards.run([('a', 'node2'), ('b', 'node2')], 'download', ['f.txt', str(tmp_path / 'dl')], {})
+    for ws in ['a', 'b']:
+        assert os.path.isfile(str(tmp_path / 'dl' / ws / 'node2' / 'f.txt'))
+
+
+def test_reports_and_records_name_nodes_by_workspace(shards, capsys):
+    results = shards.run([('a', 'node1'), ('b', 'node1')], 'run_command', ['echo hi'], {})
+    out = capsys.readouterr().out
+    assert sorted(x.node for x in results) == ['a:node1', 'b:node1']
+    assert 'node_name: a:node1' in out and 'job_status/node_return_code: Success / 0' in out
+
+    shards.run([('a', 'node1'), ('b', 'node1')], 'run_command', ['echo hi'], {}, output_format='jsonl')
+    records = [json.loads(x) for x in capsys.readouterr().out.splitlines() if x.startswith('{')]
+    assert sorted((x['node'], x['workspace']) for x in records) == [('a:node1', 'a'), ('b:node1', 'b')]
+    assert all(x['output'].strip() == 'hi' for x in records)
@@ -0,0 +1,27 @@
+import pytest
+
+
+def test_snapshot_command_of_list_has_no_snapshot_argument(provider):
+    assert provider._snapshot_command('node1', 'list') == 'vagrant snapshot list node1'
+
+
+def test_snapshot_command_options_and_quoting(provider):
+    assert provider._snapshot_command('node1', 'save', 'clean') == 'vagrant snapshot save --force node1 clean'
+    assert provider._snapshot_command('node1', 'restore', 'a b') == "vagrant snapshot restore --no-provision node1 'a b'"
+    assert provider._snapshot_command('node1', 'delete', 'x;y') == "vagrant snapshot delete node1 'x;y'"
+
+
+def test_snapshot_needs_a_name_unless_list(provider):
+    with pytest.raises(ValueError):
+        provider.snapshot('node1', 'save')
+    with pytest.raises(ValueError):
+        provider.snapshot('node1', 'rollback', 'clean')
+
+
+def test_snapshot_round_trip(fake, provider):
+    assert provider.snapshot('node1', 'save', 'clean')['job_status'] == 'Success'
+    assert provider.snapshot('node1', 'list')['snapshots'] == ['clean']
+    assert provider.snapshot('node1', 'restore', 'clean')['job_status'] == 'Success'
+    assert provider.snapshot('node1', 'delete', 'clean')['job_status'] == 'Success'
+    assert provider.snapshot('node1', 'list')['snapshots'] == []
+    assert 'vagrant snapshot list node1' in fake.calls('vagrant snapshot list')
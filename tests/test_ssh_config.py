@@ -0,0 +1,54 @@
+import os
+import pytest
+from ehvagrant.ehvagrant import Vagrant
+
+
+def test_ssh_config_of_all_hosts_is_queried_once(fake):
+    provider = Vagrant(multiplex=False)
+    configs = [provider._get_ssh_config(name) for name in fake.names]
+    assert len(set(x['port'] for x in configs)) == 3
+    assert len(fake.calls('vagrant ssh-config')) == 1
+
+
+def test_ssh_config_cache_is_reused_by_a_new_process(fake):
+    Vagrant(multiplex=False)._get_ssh_config('node1')
+    provider = Vagrant(multiplex=False)
+    provider._get_ssh_config('node2')
+    assert len(fake.calls('vagrant ssh-config')) == 1
+
+
+def test_ssh_config_cache_is_dropped_when_the_state_changes(fake):
+    provider = Vagrant(multiplex=False)
+    provider._get_ssh_config('node1')
+    fingerprint = provider._state_fingerprint()
+
+    machine = os.path.join(fake.workspace, '.vagrant', 'machines', 'node1', 'virtualbox')
+    os.makedirs(machine)
+    with open(os.path.join(machine, 'id'), 'w') as f:
+        f.write('1')
+    assert provider._state_fingerprint() != fingerprint
+
+    Vagrant(multiplex=False)._get_ssh_config('node1')
+    assert len(fake.calls('vagrant ssh-config')) == 2
+
+
+def test_reload_drops_the_setting_of_removed_hosts(fake):
+    provider = Vagrant(multiplex=False)
+    provider._get_ssh_config('node1')
+    fake.set_nodes([('node1', 'running'), ('node3', 'running')])
+    machine = os.path.join(fake.workspace, '.vagrant', 'machines', 'node2')
+    os.makedirs(machine)
+    open(os.path.join(machine, 'action_destroy'), 'w').close()
+    provider._load_ssh_config()
+    assert sorted(provider.ssh_config) == ['node1', 'node3']
+
+
+def test_host_without_ssh_setting_is_queried_once(fake):
+    fake.set_nodes([('node1', 'running'), ('node2', 'poweroff'), ('node3', 'running')])
+    provider = Vagrant(multiplex=False)
+    for _ in range(3):
+        with pytest.raises(EnvironmentError):
+            provider._get_ssh_config('node2')
+    with pytest.raises(EnvironmentError):
+        Vagrant(multiplex=False)._get_ssh_config('node2')
+    assert fake.calls('vagrant ssh-config node2') == ['vagrant ssh-config node2']
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import pytest
+from ehvagrant import ehvagrant
+
+
+@pytest.fixture
+def folder(tmp_path):
+    path = tmp_path / 'data'
+    (path / 'sub').mkdir(parents=True)
+    (path / 'a.txt').write_text('a')
+    (path / 'sub' / 'b.txt').write_text('bb')
+    return path
+
+
+def test_upload_only_sends_changed_files(fake, provider, folder):
+    first = provider.upload('node1', str(folder), 'data', sync=True)
+    assert (first['files'], first['transferred_files']) == (2, 2)
+    with open(fake.guest('node1', 'data', 'sub', 'b.txt')) as f:
+        assert f.read() == 'bb'
+
+    again = provider.upload('node1', str(folder), 'data', sync=True)
+    assert again['transferred_files'] == 0 and again['saved_bytes'] == 3
+
+    (folder / 'a.txt').write_text('changed')
+    changed = provider.upload('node1', str(folder), 'data', sync=True)
+    assert changed['transferred_files'] == 1
+    with open(fake.guest('node1', 'data', 'a.txt')) as f:
+        assert f.read() == 'changed'
+
+
+def test_download_only_fetches_changed_files(fake, provider, tmp_path):
+    os.makedirs(fake.guest('node1', 'out'))
+    for name, content in [('x.txt', 'x'), ('y.txt', 'yy')]:
+        with open(fake.guest('node1', 'out', name), 'w') as f:
+            f.write(content)
+    dest = tmp_path / 'local'
+    first = provider.download('node1', 'out', str(dest), sync=True)
+    assert first['transferred_files'] == 2
+    assert (dest / 'y.txt').read_text() == 'yy'
+
+    (dest / 'x.txt').write_text('stale')
+    again = provider.download('node1', 'out', str(dest), sync=True)
+    assert again['transferred_files'] == 1 and again['saved_bytes'] == 2
+    assert (dest / 'x.txt').read_text() == 'x'
+
+
+def test_tar_stream_is_retried_after_a_connection_failure(fake, provider, folder, monkeypatch):
+    monkeypatch.setattr(ehvagrant, 'RETRY_BACKOFF', 0.01)
+    execute_async = provider.execute_async
+    failed = []
+
+    async def flaky(command, *args, **kwargs):
+        # the first tar stream loses its connection half way, after reading some of its input
+        if 'tar x' in command and not failed:
+            failed.append(os.read(kwargs['stdin'].fileno(), 10))
+            return subprocess.CalledProcessError(255, command)
+        return await execute_async(command, *args, **kwargs)
+
+    monkeypatch.setattr(provider, 'execute_async', flaky)
+    stats = provider.upload('node1', str(folder), 'data', sync=True)
+    assert failed and stats['transferred_files'] == 2
+    assert provider.incidents['node1']['retry'] == 1
+    with open(fake.guest('node1', 'data', 'a.txt')) as f:
+        assert f.read() == 'a'
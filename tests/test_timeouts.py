@@ -0,0 +1,48 @@
+import time
+import pytest
+from ehvagrant import ehvagrant
+from ehvagrant.ehvagrant import Vagrant
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(ehvagrant, 'RETRY_BACKOFF', 0.01)
+
+
+def test_hung_node_times_out_without_holding_the_others(fake, monkeypatch):
+    monkeypatch.setenv('EHV_FAKE_HANG_NODES', 'node2')
+    provider = Vagrant(multiplex=False, timeout=1)
+    start = time.time()
+    results = {x.node: x for x in provider.map(fake.names, 'run_command', 'echo hi')}
+    assert time.time() - start < 5
+    assert results['node1'].ok and results['node3'].ok
+    assert isinstance(results['node2'].error, TimeoutError)
+    assert provider.incidents['node2']['timeout'] == 1
+
+
+def test_hung_ssh_setting_lookup_is_cancelled(fake, monkeypatch):
+    monkeypatch.setenv('EHV_FAKE_VAGRANT_STARTUP', '30')
+    provider = Vagrant(multiplex=False, timeout=0.5)
+    start = time.time()
+    with pytest.raises(EnvironmentError):
+        provider._get_ssh_config('node1')
+    results = list(provider.map(['node1'], 'run_command', 'echo hi'))
+    assert time.time() - start < 10
+    assert not results[0].ok
+
+
+def test_unreachable_node_is_retried(fake, monkeypatch):
+    provider = Vagrant(multiplex=False, retries=2)
+    provider._get_ssh_config('node1')
+    monkeypatch.setenv('EHV_FAKE_FAILURE_RATE', '1')
+    result = next(provider.map(['node1'], 'run_command', 'echo hi'))
+    assert not result.ok
+    assert len(fake.calls('ssh')) == 3
+    assert provider.incidents['node1']['retry'] == 2
+
+
+def test_failed_command_is_not_retried(fake):
+    provider = Vagrant(multiplex=False, retries=2)
+    result = next(provider.map(['node1'], 'run_command', '(exit 3)'))
+    assert result.return_code == 3
+    assert len(fake.calls('ssh')) == 1